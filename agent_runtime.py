@@ -0,0 +1,54 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Optional
+
+from logger import get_logger
+
+logger = get_logger("runtime")
+
+class AgentRuntime:
+    """Agent 运行时：在单个后台事件循环中协作运行多个 Agent"""
+    
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """获取事件循环，首次访问时启动后台线程"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._run_loop,
+                    name="agent-runtime",
+                    daemon=True
+                )
+                self._thread.start()
+                logger.info("Agent 运行时事件循环已启动")
+            return self._loop
+    
+    def _run_loop(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        self._loop.run_forever()
+    
+    def submit(self, coro: Coroutine[Any, Any, Any]) -> Future:
+        """提交协程到运行时，返回线程安全的 Future（可用于取消）"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+    
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """停止事件循环"""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                return
+            loop, thread = self._loop, self._thread
+        
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(timeout)
+        loop.close()
+        logger.info("Agent 运行时事件循环已停止")
+
+# 全局运行时实例
+agent_runtime = AgentRuntime()
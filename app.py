@@ -1,13 +1,16 @@
 from flask import Flask, request, jsonify, g, render_template, send_from_directory
 from flask_cors import CORS
-import threading
+import asyncio
 import time
 import uuid
 import os
+from concurrent.futures import Future
 from typing import Dict, Any, Optional
 from datetime import datetime
 
 from enhanced_babyagi import EnhancedBabyAGI
+from agent_runtime import agent_runtime
+from checkpoint import RunJournal
 from config import config
 from logger import get_logger
 from tools import tool_registry
@@ -21,8 +24,9 @@ app = Flask(__name__,
 CORS(app)  # 启用跨域支持
 
 # 全局变量存储运行中的 Agent 实例
+# 所有 Agent 在 agent_runtime 的同一个事件循环中协作运行
 running_agents: Dict[str, Dict[str, Any]] = {}
-running_threads: Dict[str, threading.Thread] = {}
+running_tasks: Dict[str, Future] = {}
 
 class APIResponse:
     """API 响应工具类"""
@@ -167,8 +171,12 @@ def create_agent():
         initial_task = data.get('initial_task')
         agent_id = str(uuid.uuid4())
         
-        # 创建 Agent 实例
-        agent = EnhancedBabyAGI(objective, initial_task)
+        # 创建 Agent 实例（运行日志以 agent_id 命名，便于重启后恢复）
+        agent = EnhancedBabyAGI(objective, initial_task, run_id=agent_id)
+        
+        # 可选的 LLM 调度权重，权重越大分到的 LLM 调用份额越多
+        if data.get('llm_weight') is not None and agent.llm_pool is not None:
+            agent.llm_pool.governor.set_weight(agent_id, float(data['llm_weight']))
         
         # 存储 Agent 信息
         running_agents[agent_id] = {
@@ -219,6 +227,76 @@ def get_agent(agent_id: str):
     response_data = {k: v for k, v in agent_data.items() if k != "agent"}
     return jsonify(APIResponse.success(response_data))
 
+def submit_agent(agent_id: str, max_iterations: Optional[int]) -> None:
+    """在共享事件循环中运行 Agent"""
+    agent_data = running_agents[agent_id]
+    
+    async def run_agent():
+        try:
+            agent = agent_data["agent"]
+            
+            logger.info(f"开始运行 Agent: {agent_id}")
+            results = await agent.arun(max_iterations)
+            
+            agent_data["results"] = results
+            agent_data["status"] = "completed"
+            agent_data["completed_at"] = datetime.now().isoformat()
+            
+            logger.info(f"Agent 运行完成: {agent_id}")
+            
+        except asyncio.CancelledError:
+            logger.info(f"Agent 运行已取消: {agent_id}")
+            raise
+        except Exception as e:
+            logger.error(f"Agent 运行失败: {e}")
+            agent_data["status"] = "failed"
+            agent_data["error"] = str(e)
+            agent_data["failed_at"] = datetime.now().isoformat()
+    
+    # 提交到运行时
+    agent_data["status"] = "running"
+    running_tasks[agent_id] = agent_runtime.submit(run_agent())
+
+def restore_interrupted_agents() -> int:
+    """恢复上次进程退出时仍在运行的 Agent 并继续执行，返回恢复的数量"""
+    if not config.CHECKPOINT_ENABLED:
+        return 0
+    
+    # 调试模式下 Flask 重载器的监控进程不运行 Agent
+    if config.API_DEBUG and os.environ.get("WERKZEUG_RUN_MAIN") != "true":
+        return 0
+    
+    restored = 0
+    for agent_id in RunJournal.list_runs(config.CHECKPOINT_DIR):
+        if agent_id in running_agents:
+            continue
+        
+        try:
+            state = RunJournal(agent_id, config.CHECKPOINT_DIR).load_state()
+            if not state or state["status"] != "running":
+                continue
+            
+            agent = EnhancedBabyAGI.resume(agent_id)
+            running_agents[agent_id] = {
+                "id": agent_id,
+                "agent": agent,
+                "objective": agent.objective,
+                "initial_task": state["initial_task"],
+                "status": "created",
+                "created_at": datetime.now().isoformat(),
+                "restored": True,
+                "results": None,
+                "error": None
+            }
+            submit_agent(agent_id, state["max_iterations"])
+            restored += 1
+            logger.info(f"已恢复中断的 Agent: {agent_id}（第 {state['current_iteration']} 次迭代）")
+            
+        except Exception as e:
+            logger.error(f"恢复 Agent {agent_id} 失败: {e}")
+    
+    return restored
+
 @app.route('/api/agents/<agent_id>/start', methods=['POST'])
 def start_agent(agent_id: str):
     """启动 Agent 执行"""
@@ -234,31 +312,7 @@ def start_agent(agent_id: str):
         data = request.get_json() or {}
         max_iterations = data.get('max_iterations', config.MAX_ITERATIONS)
         
-        # 在后台线程中运行 Agent
-        def run_agent():
-            try:
-                agent_data["status"] = "running"
-                agent = agent_data["agent"]
-                
-                logger.info(f"开始运行 Agent: {agent_id}")
-                results = agent.run(max_iterations)
-                
-                agent_data["results"] = results
-                agent_data["status"] = "completed"
-                agent_data["completed_at"] = datetime.now().isoformat()
-                
-                logger.info(f"Agent 运行完成: {agent_id}")
-                
-            except Exception as e:
-                logger.error(f"Agent 运行失败: {e}")
-                agent_data["status"] = "failed"
-                agent_data["error"] = str(e)
-                agent_data["failed_at"] = datetime.now().isoformat()
-        
-        # 启动线程
-        thread = threading.Thread(target=run_agent, daemon=True)
-        thread.start()
-        running_threads[agent_id] = thread
+        submit_agent(agent_id, max_iterations)
         
         return jsonify(APIResponse.success({
             "agent_id": agent_id,
@@ -282,12 +336,15 @@ def stop_agent(agent_id: str):
         return APIResponse.error("Agent 未在运行", 400)
     
     try:
-        # 标记为停止状态
+        # 标记为停止状态并取消运行中的协程
         agent_data["status"] = "stopped"
         agent_data["stopped_at"] = datetime.now().isoformat()
         
-        # 注意：这里只是标记停止，实际的线程可能需要一些时间才能结束
-        logger.info(f"Agent 已标记为停止: {agent_id}")
+        task = running_tasks.get(agent_id)
+        if task is not None:
+            task.cancel()
+        
+        logger.info(f"Agent 已停止: {agent_id}")
         
         return jsonify(APIResponse.success({
             "agent_id": agent_id,
@@ -339,6 +396,23 @@ def get_agent_results(agent_id: str):
             "message": "暂无结果"
         }))
 
+@app.route('/api/agents/<agent_id>/iterations', methods=['GET'])
+def get_agent_iterations(agent_id: str):
+    """分页获取 Agent 的迭代记录（包括已写入磁盘的早期记录）"""
+    if agent_id not in running_agents:
+        return APIResponse.error("Agent 不存在", 404)
+    
+    try:
+        offset = int(request.args.get("offset", 0))
+        limit = min(int(request.args.get("limit", 50)), 500)
+    except ValueError:
+        return APIResponse.error("offset 和 limit 必须是整数", 400)
+    
+    agent = running_agents[agent_id]["agent"]
+    page = agent.get_iterations(offset, limit)
+    page["agent_id"] = agent_id
+    return jsonify(APIResponse.success(page))
+
 @app.route('/api/agents/<agent_id>', methods=['DELETE'])
 def delete_agent(agent_id: str):
     """删除 Agent"""
@@ -351,10 +425,18 @@ def delete_agent(agent_id: str):
         return APIResponse.error("无法删除正在运行的 Agent，请先停止", 400)
     
     try:
-        # 清理资源
+        # 清理资源（按运行隔离记忆时，运行删除后它的记忆不会再被用到）
+        if config.VECTOR_NAMESPACE == "run":
+            agent_data["agent"].retire_memory()
+        else:
+            agent_data["agent"].close_memory()
+        if agent_data["agent"].llm_pool is not None:
+            agent_data["agent"].llm_pool.governor.forget(agent_id, drop_weight=True)
+        agent_data["agent"].history.clear()
+        agent_data["agent"].close()
         del running_agents[agent_id]
-        if agent_id in running_threads:
-            del running_threads[agent_id]
+        if agent_id in running_tasks:
+            del running_tasks[agent_id]
         
         logger.info(f"Agent 已删除: {agent_id}")
         
@@ -382,9 +464,13 @@ def quick_run():
         
         logger.info(f"快速执行 Agent，目标: {objective}")
         
-        # 创建并运行 Agent
+        # 创建并运行 Agent（一次性执行不需要崩溃恢复）
         agent = EnhancedBabyAGI(objective, initial_task)
-        results = agent.run(max_iterations)
+        agent.journal = None
+        try:
+            results = agent.run(max_iterations)
+        finally:
+            agent.close()
         
         return jsonify(APIResponse.success({
             "objective": objective,
@@ -403,6 +489,14 @@ def quick_run():
 def get_stats():
     """获取系统统计信息"""
     try:
+        # 汇总所有 Agent 的 LLM 调用（按阶段）
+        llm_phases = {}
+        for agent_data in running_agents.values():
+            for phase, usage in agent_data["agent"].ledger.phases().items():
+                totals = llm_phases.setdefault(phase, {})
+                for key, value in usage.items():
+                    totals[key] = max(totals.get(key, 0), value) if key == "max_latency" else totals.get(key, 0) + value
+        
         stats = {
             "agents": {
                 "total": len(running_agents),
@@ -410,6 +504,13 @@ def get_stats():
                 "completed": len([a for a in running_agents.values() if a["status"] == "completed"]),
                 "failed": len([a for a in running_agents.values() if a["status"] == "failed"])
             },
+            "llm_calls": {
+                "phases": llm_phases,
+                "per_agent": {
+                    agent_id: agent_data["agent"].ledger.totals()
+                    for agent_id, agent_data in running_agents.items()
+                }
+            },
             "tools": {
                 "available": len(tool_registry.tools),
                 "list": [tool["name"] for tool in tool_registry.list_tools()]
@@ -434,6 +535,10 @@ if __name__ == '__main__':
         logger.info(f"启动 BabyAGI API 服务器")
         logger.info(f"配置摘要: {config.get_summary()}")
         
+        restored = restore_interrupted_agents()
+        if restored:
+            logger.info(f"已恢复 {restored} 个中断的 Agent")
+        
         app.run(
             host=config.API_HOST,
             port=config.API_PORT,
@@ -60,8 +60,11 @@ class CustomBabyAGI:
         if self.config.LLM_PROVIDER == "openai":
             try:
                 import openai
-                openai.api_key = self.config.OPENAI_API_KEY
-                openai.base_url = self.config.OPENAI_BASE_URL
+                # 每个实例使用独立的客户端，避免多个 Agent 共享模块级全局配置
+                client = openai.OpenAI(
+                    api_key=self.config.OPENAI_API_KEY,
+                    base_url=getattr(self.config, "OPENAI_BASE_URL", None)
+                )
                 
                 def openai_llm(prompt):
                     logger.info(f"Calling OpenAI API with model: {self.config.OPENAI_MODEL}")
@@ -69,7 +72,7 @@ class CustomBabyAGI:
                     
                     start_time = time.time()
                     try:
-                        response = openai.ChatCompletion.create(
+                        response = client.chat.completions.create(
                             model=self.config.OPENAI_MODEL,
                             messages=[{"role": "user", "content": prompt}]
                         )
@@ -93,13 +96,16 @@ class CustomBabyAGI:
             try:
                 import requests
                 
+                # 复用长连接，避免每次调用重新建立连接
+                session = requests.Session()
+                
                 def ollama_llm(prompt):
                     logger.info(f"Calling Ollama API with model: {self.config.OLLAMA_MODEL}")
                     logger.debug(f"Prompt: {prompt[:100]}...")  # 只记录前100个字符
                     
                     start_time = time.time()
                     try:
-                        response = requests.post(
+                        response = session.post(
                             f"{self.config.OLLAMA_BASE_URL}/api/generate",
                             json={
                                 "model": self.config.OLLAMA_MODEL,
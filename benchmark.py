@@ -0,0 +1,437 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+BabyAGI 主循环基准测试
+
+使用脚本化的假 LLM、内存向量存储和桩工具驱动 CustomBabyAGI / EnhancedBabyAGI 的主循环，
+测量框架本身每次迭代的开销：提示词构建、JSON 解析、队列操作、向量存储读写和结果序列化。
+结果以 JSON 输出，便于在版本之间对比、发现性能回退。
+
+使用方法:
+    python benchmark.py
+    python benchmark.py --engine custom enhanced --iterations 10 100 1000 --agents 1 10 100
+    python benchmark.py --iterations 10000 --agents 500 --output results.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+import numpy as np
+
+# 添加项目根目录到 Python 路径
+project_root = Path(__file__).parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from custom_babyagi import AsyncCustomBabyAGI, Task
+from enhanced_babyagi import AsyncEnhancedBabyAGI
+from json_stream import JSONStreamExtractor
+from tools import BaseTool, ToolRegistry
+
+STAGES = ("prompt_build", "json_parse", "queue_ops", "vector_store", "serialization", "llm")
+
+_WORDS = ["数据", "分析", "报告", "接口", "测试", "部署", "文档", "监控", "优化", "设计", "评审", "迁移"]
+_TASK_ID_RE = re.compile(r"\(ID: ([^)]+)\)")
+
+class StageTimer:
+    """按阶段累计耗时和调用次数（线程安全，向量存储在线程池中调用）"""
+    
+    def __init__(self):
+        self.seconds: Dict[str, float] = {stage: 0.0 for stage in STAGES}
+        self.calls: Dict[str, int] = {stage: 0 for stage in STAGES}
+        self._lock = threading.Lock()
+    
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.seconds[stage] += seconds
+            self.calls[stage] += 1
+    
+    @contextlib.contextmanager
+    def measure(self, stage: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - started)
+    
+    def wrap(self, stage: str, func: Any) -> Any:
+        """返回计时版本的同步函数"""
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.add(stage, time.perf_counter() - started)
+        return timed
+    
+    def patch(self, stage: str, target: Any, *names: str) -> None:
+        """把对象上的方法替换为计时版本（用于单个实例）"""
+        for name in names:
+            setattr(target, name, self.wrap(stage, getattr(target, name)))
+    
+    @contextlib.contextmanager
+    def patch_class(self, stage: str, cls: type, *names: str) -> Iterator[None]:
+        """在上下文内把类方法替换为计时版本（所有实例共享）"""
+        originals = {name: cls.__dict__[name] for name in names}
+        try:
+            for name, func in originals.items():
+                setattr(cls, name, self.wrap(stage, func))
+            yield
+        finally:
+            for name, func in originals.items():
+                setattr(cls, name, func)
+
+class HashEmbedding:
+    """确定性的字节直方图嵌入，代替真实嵌入模型（开销可忽略，不掩盖框架本身的耗时）"""
+    
+    def __init__(self, dim: int = 64):
+        self.dim = dim
+    
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        vectors = []
+        for text in input:
+            data = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+            vector = np.bincount(data % self.dim, minlength=self.dim).astype(np.float32)
+            norm = np.linalg.norm(vector)
+            vectors.append(vector / norm if norm else vector)
+        return vectors
+
+class InMemoryVectorStore:
+    """实现 Agent 用到的 Chroma 集合接口（add / query / count / get）的内存向量存储"""
+    
+    def __init__(self, embedding_function: HashEmbedding):
+        self.embedding_function = embedding_function
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._vectors = np.zeros((16, embedding_function.dim), dtype=np.float32)
+        self._lock = threading.Lock()
+    
+    def add(
+        self,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        embeddings: Optional[List[Any]] = None
+    ) -> None:
+        vectors = embeddings if embeddings is not None else self.embedding_function(documents)
+        with self._lock:
+            needed = len(self._ids) + len(ids)
+            if needed > len(self._vectors):
+                grown = np.zeros((max(needed, len(self._vectors) * 2), self._vectors.shape[1]), dtype=np.float32)
+                grown[:len(self._ids)] = self._vectors[:len(self._ids)]
+                self._vectors = grown
+            self._vectors[len(self._ids):needed] = vectors
+            self._ids.extend(ids)
+            self._documents.extend(documents)
+            self._metadatas.extend(metadatas)
+    
+    def query(
+        self,
+        query_texts: Optional[List[str]] = None,
+        n_results: int = 10,
+        query_embeddings: Optional[List[Any]] = None,
+        include: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> Dict[str, List[List[Any]]]:
+        results: Dict[str, List[List[Any]]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with_embeddings = include is not None and "embeddings" in include
+        if with_embeddings:
+            results["embeddings"] = []
+        with self._lock:
+            count = len(self._ids)
+            matrix = self._vectors[:count]
+            queries = query_embeddings if query_embeddings is not None else self.embedding_function(query_texts)
+            for query in np.asarray(queries, dtype=np.float32):
+                scores = matrix @ query
+                k = min(n_results, count)
+                top = np.argpartition(-scores, k - 1)[:k] if k else np.array([], dtype=int)
+                top = top[np.argsort(-scores[top])]
+                results["ids"].append([self._ids[i] for i in top])
+                results["documents"].append([self._documents[i] for i in top])
+                results["metadatas"].append([self._metadatas[i] for i in top])
+                results["distances"].append([float(1 - scores[i]) for i in top])
+                if with_embeddings:
+                    results["embeddings"].append([matrix[i].tolist() for i in top])
+        return results
+    
+    def count(self) -> int:
+        return len(self._ids)
+    
+    def get(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Dict[str, List[Any]]:
+        with self._lock:
+            indexes = range(len(self._ids)) if ids is None else [self._ids.index(i) for i in ids if i in self._ids]
+            return {
+                "ids": [self._ids[i] for i in indexes],
+                "documents": [self._documents[i] for i in indexes],
+                "metadatas": [self._metadatas[i] for i in indexes]
+            }
+
+class EchoTool(BaseTool):
+    """桩工具：原样返回参数"""
+    
+    def __init__(self):
+        super().__init__("echo", "原样返回输入文本（基准测试桩工具）")
+    
+    def execute(self, **kwargs) -> Dict[str, Any]:
+        return {"success": True, "output": kwargs.get("text", "")}
+
+class StubToolRegistry(ToolRegistry):
+    """只注册桩工具的工具注册表"""
+    
+    def _register_default_tools(self):
+        self.register_tool(EchoTool())
+
+class ScriptedLLM:
+    """按提示词类型返回固定格式响应的假 LLM，支持流式调用和模拟延迟"""
+    
+    def __init__(self, timer: StageTimer, new_tasks: int = 1, result_chars: int = 600, latency: float = 0.0, chunk_chars: int = 32):
+        self.timer = timer
+        self.new_tasks = new_tasks
+        self.result_chars = result_chars
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self._counter = 0
+        self._tool_decisions = 0
+    
+    def _new_task_entries(self) -> List[Dict[str, Any]]:
+        entries = []
+        for _ in range(self.new_tasks):
+            self._counter += 1
+            words = [_WORDS[(self._counter * 7 + i * 3) % len(_WORDS)] for i in range(4)]
+            entries.append({"content": f"第{self._counter}号子任务：{''.join(words)}", "priority": 1 + self._counter % 5, "depends_on": []})
+        return entries
+    
+    def respond(self, prompt: str) -> str:
+        if "你是一个任务分析专家" in prompt:
+            self._tool_decisions += 1
+            use_tool = self._tool_decisions % 2 == 0
+            return json.dumps({
+                "use_tool": use_tool,
+                "tool_name": "echo" if use_tool else "",
+                "tool_params": {"text": "基准测试"} if use_tool else {},
+                "reasoning": "基准测试脚本化决策",
+                "fallback_to_llm": True
+            }, ensure_ascii=False)
+        if "并为全部待执行任务重新排序" in prompt:
+            new_tasks = self._new_task_entries()
+            order = list(reversed(_TASK_ID_RE.findall(prompt))) + list(range(1, len(new_tasks) + 1))
+            return json.dumps({"new_tasks": new_tasks, "priority_order": order}, ensure_ascii=False)
+        if "创建新的任务" in prompt:
+            return json.dumps(self._new_task_entries(), ensure_ascii=False)
+        if "重新分配优先级" in prompt:
+            task_ids = _TASK_ID_RE.findall(prompt)
+            return json.dumps([{"id": task_id, "priority": len(task_ids) - i} for i, task_id in enumerate(task_ids)])
+        body = "执行结果：完成了任务要求的分析与整理工作，并记录了关键结论。"
+        return (body * (self.result_chars // len(body) + 1))[:self.result_chars]
+    
+    async def generate(self, prompt: str, max_tokens: int = 1000) -> str:
+        started = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self.respond(prompt)
+        self.timer.add("llm", time.perf_counter() - started)
+        return response
+    
+    async def stream(self, prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+        started = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        response = self.respond(prompt)
+        self.timer.add("llm", time.perf_counter() - started)
+        for i in range(0, len(response), self.chunk_chars):
+            yield response[i:i + self.chunk_chars]
+
+class _BenchmarkAgentMixin:
+    """用假 LLM 和内存向量存储替换外部依赖，并给框架各环节加上计时"""
+    
+    def __init__(self, objective: str, llm: ScriptedLLM, timer: StageTimer):
+        self._scripted_llm = llm
+        self._timer = timer
+        super().__init__(objective)
+        timer.patch("prompt_build", self, "_render_prompt")
+        timer.patch("queue_ops", self.task_list, "push", "extend", "pop", "reprioritize", "snapshot", "task_ids")
+        timer.patch("vector_store", self.vector_db, "add", "query", "count")
+    
+    def _init_vector_db(self):
+        self.embedding_function = HashEmbedding()
+        return InMemoryVectorStore(self.embedding_function)
+    
+    def _init_llm(self):
+        llm = self._scripted_llm
+        
+        async def scripted_llm(prompt: str, max_tokens: int = 1000) -> str:
+            return await llm.generate(prompt, max_tokens)
+        
+        scripted_llm.stream = llm.stream
+        return scripted_llm
+
+class BenchmarkCustomAgent(_BenchmarkAgentMixin, AsyncCustomBabyAGI):
+    pass
+
+class BenchmarkEnhancedAgent(_BenchmarkAgentMixin, AsyncEnhancedBabyAGI):
+    def __init__(self, objective: str, llm: ScriptedLLM, timer: StageTimer):
+        super().__init__(objective, llm, timer)
+        self.tool_registry = StubToolRegistry()
+
+ENGINES = {"custom": BenchmarkCustomAgent, "enhanced": BenchmarkEnhancedAgent}
+
+@contextlib.contextmanager
+def config_overrides(**values: Any) -> Iterator[None]:
+    """临时修改配置（基准测试关闭检查点、缓存和录制，避免磁盘 I/O 干扰结果；关闭收敛检测，保证迭代次数固定；
+    超出内存上限的迭代记录写入临时目录）"""
+    originals = {name: getattr(config, name) for name in values}
+    try:
+        for name, value in values.items():
+            setattr(config, name, value)
+        yield
+    finally:
+        for name, value in originals.items():
+            setattr(config, name, value)
+
+def _peak_rss_mb() -> Optional[float]:
+    try:
+        import resource
+    except ImportError:
+        return None
+    # Linux 上单位为 KB，macOS 上为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def run_scenario(
+    engine: str,
+    iterations: int,
+    agents: int,
+    new_tasks: int = 1,
+    result_chars: int = 600,
+    llm_latency: float = 0.0
+) -> Dict[str, Any]:
+    """运行一组基准测试：agents 个 Agent 在同一个事件循环中各运行 iterations 次迭代
+    
+    各阶段耗时为每次迭代的平均累计耗时。多个 Agent 并发时，线程池中的向量存储调用相互重叠，
+    各阶段之和可能超过墙钟时间，此时不计算 other。
+    """
+    timer = StageTimer()
+    agent_class = ENGINES[engine]
+    
+    async def run_all() -> List[Dict[str, Any]]:
+        group = [
+            agent_class(f"基准测试目标 {i}", ScriptedLLM(timer, new_tasks, result_chars, llm_latency), timer)
+            for i in range(agents)
+        ]
+        return await asyncio.gather(*(agent.arun(iterations) for agent in group))
+    
+    with timer.patch_class("json_parse", JSONStreamExtractor, "feed", "finish"), \
+         timer.patch_class("serialization", Task, "to_dict"):
+        started = time.perf_counter()
+        results = asyncio.run(run_all())
+        with timer.measure("serialization"):
+            payload = json.dumps(results, ensure_ascii=False)
+        wall = time.perf_counter() - started
+    
+    # results["iterations"] 只包含内存中保留的最近迭代
+    completed = sum(result["iteration_count"] for result in results)
+    per_iteration = {
+        stage: round(seconds / completed * 1e6, 2) if completed else 0.0
+        for stage, seconds in timer.seconds.items()
+    }
+    total_us = wall / completed * 1e6 if completed else 0.0
+    per_iteration["total"] = round(total_us, 2)
+    per_iteration["framework"] = round(total_us - per_iteration["llm"], 2)
+    per_iteration["other"] = round(total_us - sum(per_iteration[stage] for stage in STAGES), 2) if agents == 1 else None
+    
+    return {
+        "engine": engine,
+        "iterations": iterations,
+        "agents": agents,
+        "scheduler_mode": config.SCHEDULER_MODE,
+        "planning_mode": config.PLANNING_MODE,
+        "completed_iterations": completed,
+        "statuses": sorted({result["status"] for result in results}),
+        "wall_seconds": round(wall, 4),
+        "iterations_per_second": round(completed / wall, 1) if wall else 0.0,
+        "per_iteration_us": per_iteration,
+        "stage_calls": dict(timer.calls),
+        "result_bytes": len(payload.encode("utf-8")),
+        "peak_rss_mb": _peak_rss_mb()
+    }
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, Any]:
+    parser = argparse.ArgumentParser(description="BabyAGI 主循环框架开销基准测试")
+    parser.add_argument("--engine", nargs="+", choices=sorted(ENGINES), default=["custom", "enhanced"])
+    parser.add_argument("--iterations", nargs="+", type=int, default=[10, 100])
+    parser.add_argument("--agents", nargs="+", type=int, default=[1, 10])
+    parser.add_argument("--scheduler", choices=["serial", "dag", "pipelined"], default="serial")
+    parser.add_argument("--planning", choices=["separate", "fused"], default="separate")
+    parser.add_argument("--prioritizer", choices=["llm", "local"], default="llm")
+    parser.add_argument("--dedup", action="store_true", help="启用任务去重")
+    parser.add_argument("--streaming", action="store_true", help="启用流式 LLM 调用")
+    parser.add_argument("--new-tasks", type=int, default=1, help="每次规划生成的新任务数")
+    parser.add_argument("--result-chars", type=int, default=600, help="假 LLM 执行结果的长度")
+    parser.add_argument("--llm-latency", type=float, default=0.0, help="假 LLM 每次调用的模拟延迟（秒）")
+    parser.add_argument("--output", help="结果 JSON 文件路径，默认输出到标准输出")
+    args = parser.parse_args(argv)
+    
+    # 基准测试只关心框架开销，日志输出会掩盖结果
+    babyagi_logger = logging.getLogger("babyagi")
+    log_level = babyagi_logger.level
+    babyagi_logger.setLevel(logging.WARNING)
+    
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items() if key != "output"},
+        "results": []
+    }
+    with contextlib.ExitStack() as stack:
+        stack.callback(babyagi_logger.setLevel, log_level)
+        history_dir = stack.enter_context(tempfile.TemporaryDirectory(prefix="babyagi-bench-"))
+        stack.enter_context(config_overrides(
+            SCHEDULER_MODE=args.scheduler,
+            PLANNING_MODE=args.planning,
+            PRIORITIZER=args.prioritizer,
+            TASK_DEDUP=args.dedup,
+            LLM_STREAMING=args.streaming,
+            CHECKPOINT_ENABLED=False,
+            LLM_CACHE_ENABLED=False,
+            LLM_TRACE_MODE="off",
+            CONVERGENCE_PATIENCE=0,
+            RUN_HISTORY_DIR=history_dir
+        ))
+        
+        for engine in args.engine:
+            for agents in args.agents:
+                for iterations in args.iterations:
+                    result = run_scenario(engine, iterations, agents, args.new_tasks, args.result_chars, args.llm_latency)
+                    report["results"].append(result)
+                    print(
+                        f"{engine:<9} agents={agents:<4} iterations={iterations:<6} "
+                        f"{result['per_iteration_us']['framework']:>10.1f} us/迭代  "
+                        f"{result['iterations_per_second']:>9.1f} 迭代/秒",
+                        file=sys.stderr
+                    )
+    
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+    else:
+        print(output)
+    return report
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from logger import get_logger
+
+logger = get_logger("checkpoint")
+
+class RunJournal:
+    """Agent 运行的追加式日志与快照
+    
+    每个运行对应目录 <directory>/<run_id>/：
+    journal.jsonl 逐行追加迭代事件（每条带递增序号），
+    snapshot.json 定期写入压缩后的完整状态，写入成功后清空日志。
+    恢复时读取快照，再重放序号大于快照的事件；崩溃时写了一半的最后一行会被忽略。
+    before_snapshot 在每次写入快照前调用（例如先把缓冲中的任务结果写入向量数据库）。
+    状态中只保留最近 max_completed 个已完成任务和最近 max_iterations 条迭代记录，
+    快照大小不随运行长度增长；任务结果只保存在已完成任务中，迭代记录不重复保存。
+    记录 run_finished 后运行已不需要恢复，整个运行目录随即删除，目录下只留下未结束的运行。
+    """
+    
+    JOURNAL_FILE = "journal.jsonl"
+    SNAPSHOT_FILE = "snapshot.json"
+    
+    def __init__(
+        self,
+        run_id: str,
+        directory: str,
+        snapshot_every: int = 20,
+        fsync: bool = True,
+        before_snapshot: Optional[Callable[[], None]] = None,
+        max_completed: int = 200,
+        max_iterations: int = 100
+    ):
+        self.run_id = run_id
+        self.path = Path(directory) / run_id
+        self.snapshot_every = max(1, snapshot_every)
+        self.fsync = fsync
+        self.before_snapshot = before_snapshot
+        self.max_completed = max(1, max_completed)
+        self.max_iterations = max(1, max_iterations)
+        self.state: Optional[Dict[str, Any]] = None
+        self._seq = 0
+        self._events_since_snapshot = 0
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def empty_state(run_id: str) -> Dict[str, Any]:
+        return {
+            "run_id": run_id,
+            "objective": None,
+            "initial_task": None,
+            "max_iterations": None,
+            "status": "created",
+            "current_iteration": 0,
+            "pending": {},
+            "completed": [],
+            "completed_count": 0,
+            "iterations": [],
+            "seq": 0
+        }
+    
+    @classmethod
+    def list_runs(cls, directory: str) -> List[str]:
+        """列出目录下所有有记录的运行 ID"""
+        root = Path(directory)
+        if not root.is_dir():
+            return []
+        return sorted(
+            entry.name for entry in root.iterdir()
+            if (entry / cls.JOURNAL_FILE).exists() or (entry / cls.SNAPSHOT_FILE).exists()
+        )
+    
+    def exists(self) -> bool:
+        return (self.path / self.JOURNAL_FILE).exists() or (self.path / self.SNAPSHOT_FILE).exists()
+    
+    def load_state(self) -> Optional[Dict[str, Any]]:
+        """从快照和日志重建运行状态，没有任何记录时返回 None"""
+        with self._lock:
+            return self._load_locked()
+    
+    def _load_locked(self) -> Optional[Dict[str, Any]]:
+        if not self.exists():
+            return None
+        
+        state = self.empty_state(self.run_id)
+        snapshot_path = self.path / self.SNAPSHOT_FILE
+        if snapshot_path.exists():
+            with open(snapshot_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        
+        replayed = 0
+        journal_path = self.path / self.JOURNAL_FILE
+        if journal_path.exists():
+            with open(journal_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        event = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"忽略不完整的日志记录: {self.run_id}")
+                        break
+                    if event["seq"] > state["seq"]:
+                        self._apply(state, event)
+                        replayed += 1
+        
+        self.state = state
+        self._seq = state["seq"]
+        self._events_since_snapshot = replayed
+        logger.info(f"已加载运行记录 {self.run_id}：第 {state['current_iteration']} 次迭代，重放 {replayed} 条事件")
+        return state
+    
+    def record(self, event_type: str, **data: Any) -> None:
+        """追加一条事件并更新内存状态，达到间隔时写入快照"""
+        with self._lock:
+            if self.state is None and self._load_locked() is None:
+                self.state = self.empty_state(self.run_id)
+            
+            self._seq += 1
+            event = {"seq": self._seq, "type": event_type, "time": time.time(), **data}
+            
+            self.path.mkdir(parents=True, exist_ok=True)
+            with open(self.path / self.JOURNAL_FILE, "a", encoding="utf-8") as f:
+                f.write(json.dumps(event, ensure_ascii=False) + "\n")
+                f.flush()
+                if self.fsync:
+                    os.fsync(f.fileno())
+            
+            self._apply(self.state, event)
+            self._events_since_snapshot += 1
+            if event_type == "run_finished":
+                self._remove_locked()
+            elif self._events_since_snapshot >= self.snapshot_every:
+                self._write_snapshot()
+    
+    def snapshot(self) -> None:
+        """立即写入快照并清空日志"""
+        with self._lock:
+            if self.state is not None:
+                self._write_snapshot()
+    
+    def _remove_locked(self) -> None:
+        """删除运行目录（之后再记录事件时从空状态重新开始）"""
+        for name in (self.JOURNAL_FILE, self.SNAPSHOT_FILE, Path(self.SNAPSHOT_FILE).with_suffix(".tmp").name):
+            try:
+                (self.path / name).unlink()
+            except FileNotFoundError:
+                pass
+        try:
+            self.path.rmdir()
+        except OSError as e:
+            logger.warning(f"删除运行目录 {self.path} 失败: {e}")
+        self.state = None
+        self._seq = 0
+        self._events_since_snapshot = 0
+        logger.debug(f"运行 {self.run_id} 已结束，已删除运行日志")
+    
+    def _write_snapshot(self) -> None:
+        if self.before_snapshot is not None:
+            try:
+                self.before_snapshot()
+            except Exception as e:
+                logger.warning(f"写入快照前的回调失败: {e}")
+        
+        snapshot_path = self.path / self.SNAPSHOT_FILE
+        tmp_path = snapshot_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, ensure_ascii=False)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, snapshot_path)
+        
+        # 快照落盘后日志中的事件已全部包含在快照里；在此之前崩溃时按序号去重
+        open(self.path / self.JOURNAL_FILE, "w").close()
+        self._events_since_snapshot = 0
+        logger.debug(f"运行 {self.run_id} 已写入快照（序号 {self.state['seq']}）")
+    
+    def _apply(self, state: Dict[str, Any], event: Dict[str, Any]) -> None:
+        """将事件应用到状态上"""
+        event_type = event["type"]
+        state["seq"] = event["seq"]
+        
+        if event_type == "run_started":
+            state["objective"] = event["objective"]
+            state["initial_task"] = event["initial_task"]
+            state["max_iterations"] = event["max_iterations"]
+            state["status"] = "running"
+        elif event_type == "run_resumed":
+            state["max_iterations"] = event["max_iterations"]
+            state["status"] = "running"
+        elif event_type == "tasks_added":
+            for task in event["tasks"]:
+                state["pending"][task["id"]] = dict(task)
+        elif event_type == "task_completed":
+            task = event["task"]
+            state["pending"].pop(task["id"], None)
+            state["completed_count"] = state.get("completed_count", len(state["completed"])) + 1
+            state["completed"].append(task)
+            del state["completed"][:-self.max_completed]
+            # 结果已在 task 中，迭代记录不再保存一份
+            iteration_result = {key: value for key, value in event["iteration_result"].items() if key != "result"}
+            state["iterations"].append(iteration_result)
+            del state["iterations"][:-self.max_iterations]
+            state["current_iteration"] = max(state["current_iteration"], event["iteration_result"]["iteration"])
+        elif event_type == "planned":
+            for task in event["new_tasks"]:
+                state["pending"][task["id"]] = dict(task)
+            for task_id, priority in event["priorities"].items():
+                if task_id in state["pending"]:
+                    state["pending"][task_id]["priority"] = priority
+            for iteration_result in reversed(state["iterations"]):
+                if iteration_result["iteration"] == event["iteration"]:
+                    iteration_result["new_tasks"] = event["new_tasks"]
+                    iteration_result["remaining_tasks"] = len(state["pending"])
+                    break
+        elif event_type == "run_finished":
+            state["status"] = event["status"]
@@ -12,16 +12,66 @@ class Config:
     LLM_PROVIDER: str = os.getenv("LLM_PROVIDER", "openai")
     OPENAI_API_KEY: Optional[str] = os.getenv("OPENAI_API_KEY")
     OPENAI_BASE_URL: Optional[str] = os.getenv("OPENAI_BASE_URL")
+    OPENAI_BASE_URLS: str = os.getenv("OPENAI_BASE_URLS", "")  # 逗号分隔的多个 OpenAI 兼容地址，优先于 OPENAI_BASE_URL
     OPENAI_MODEL: str = os.getenv("OPENAI_MODEL", "gpt-3.5-turbo")
     
     # Ollama 配置
     OLLAMA_BASE_URL: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+    OLLAMA_BASE_URLS: str = os.getenv("OLLAMA_BASE_URLS", "")  # 逗号分隔的多个 Ollama 地址，优先于 OLLAMA_BASE_URL
     OLLAMA_MODEL: str = os.getenv("OLLAMA_MODEL", "gpt-3.5-turbo:latest")
     
+    # LLM 客户端连接池与重试配置
+    LLM_TIMEOUT: float = float(os.getenv("LLM_TIMEOUT", "60"))
+    LLM_MAX_RETRIES: int = int(os.getenv("LLM_MAX_RETRIES", "3"))
+    LLM_RETRY_BACKOFF: float = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+    LLM_MAX_CONNECTIONS: int = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))  # 每个服务地址
+    LLM_ENDPOINT_COOLDOWN: float = float(os.getenv("LLM_ENDPOINT_COOLDOWN", "30"))
+    LLM_HEALTH_CHECK_INTERVAL: float = float(os.getenv("LLM_HEALTH_CHECK_INTERVAL", "30"))  # 配置多个地址时生效，0 表示只被动切换
+    
+    # 进程级 LLM 调度配置（所有 Agent 共享）
+    LLM_MAX_CONCURRENCY: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))  # 每个服务地址，0 表示不限
+    LLM_RATE_LIMIT: float = float(os.getenv("LLM_RATE_LIMIT", "0"))  # 每个服务地址每秒请求数，0 表示不限
+    LLM_RATE_BURST: int = int(os.getenv("LLM_RATE_BURST", "1"))
+    LLM_AGENT_WEIGHTS: str = os.getenv("LLM_AGENT_WEIGHTS", "")  # 格式: agent_id:权重,agent_id:权重
+    
+    # LLM 生成参数与响应缓存配置
+    LLM_TEMPERATURE: float = float(os.getenv("LLM_TEMPERATURE", "0.7"))
+    LLM_STREAMING: bool = os.getenv("LLM_STREAMING", "true").lower() == "true"  # 任务执行时流式接收输出
+    LLM_CACHE_ENABLED: bool = os.getenv("LLM_CACHE_ENABLED", "false").lower() == "true"
+    LLM_CACHE_MEMORY_ENTRIES: int = int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "1024"))
+    LLM_CACHE_PATH: str = os.getenv("LLM_CACHE_PATH", "./cache/llm_cache.sqlite3")  # 留空则只使用内存缓存
+    LLM_CACHE_TTL: int = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+    LLM_CACHE_MAX_MB: int = int(os.getenv("LLM_CACHE_MAX_MB", "100"))
+    
+    # 嵌入缓存配置（按模型和文本哈希缓存嵌入向量，内存 LRU + SQLite）
+    EMBEDDING_CACHE_ENABLED: bool = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    EMBEDDING_CACHE_MEMORY_ENTRIES: int = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096"))
+    EMBEDDING_CACHE_PATH: str = os.getenv("EMBEDDING_CACHE_PATH", "./cache/embedding_cache.sqlite3")  # 留空则只使用内存缓存
+    EMBEDDING_CACHE_MAX_MB: int = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "200"))
+    
+    # LLM 调用录制/回放（用于离线、可复现的基准测试）
+    LLM_TRACE_MODE: str = os.getenv("LLM_TRACE_MODE", "off")  # off, record, replay
+    LLM_TRACE_FILE: str = os.getenv("LLM_TRACE_FILE", "./traces/llm_trace.jsonl")
+    LLM_REPLAY_LATENCY: str = os.getenv("LLM_REPLAY_LATENCY", "0")  # 每次调用的模拟延迟秒数，recorded 表示使用录制耗时
+    
     # 向量数据库配置
     VECTOR_DB: str = os.getenv("VECTOR_DB", "chroma")
     CHROMA_PERSIST_DIR: str = os.getenv("CHROMA_PERSIST_DIR", "./chroma_db")
     
+    # 记忆命名空间（objective 按目标隔离，run 按运行隔离，shared 所有 Agent 共用一个集合）
+    VECTOR_NAMESPACE: str = os.getenv("VECTOR_NAMESPACE", "objective")
+    VECTOR_NAMESPACE_TTL_DAYS: float = float(os.getenv("VECTOR_NAMESPACE_TTL_DAYS", "0"))  # 0 表示不自动删除
+    VECTOR_NAMESPACE_REGISTRY: str = os.getenv("VECTOR_NAMESPACE_REGISTRY", "./cache/vector_namespaces.json")
+    
+    # NumPy 向量存储（VECTOR_DB=numpy；IVF 簇数为 0 表示精确检索）
+    NUMPY_VECTOR_DIR: str = os.getenv("NUMPY_VECTOR_DIR", "./vector_store")
+    NUMPY_IVF_LISTS: int = int(os.getenv("NUMPY_IVF_LISTS", "0"))
+    NUMPY_IVF_NPROBE: int = int(os.getenv("NUMPY_IVF_NPROBE", "4"))
+    
+    # 向量数据库写缓冲（任务结果按条数或时间批量写入，1 表示逐条写入）
+    VECTOR_WRITE_BATCH_SIZE: int = int(os.getenv("VECTOR_WRITE_BATCH_SIZE", "16"))
+    VECTOR_WRITE_FLUSH_INTERVAL: float = float(os.getenv("VECTOR_WRITE_FLUSH_INTERVAL", "2.0"))
+    
     # Pinecone 配置
     PINECONE_API_KEY: Optional[str] = os.getenv("PINECONE_API_KEY")
     PINECONE_ENVIRONMENT: Optional[str] = os.getenv("PINECONE_ENVIRONMENT")
@@ -31,6 +81,59 @@ class Config:
     MAX_ITERATIONS: int = int(os.getenv("MAX_ITERATIONS", "5"))
     OBJECTIVE: str = os.getenv("OBJECTIVE", "Develop a task list")
     
+    # 运行记录内存上限（超出的迭代记录写入磁盘，按页读取）
+    RUN_HISTORY_IN_MEMORY: int = int(os.getenv("RUN_HISTORY_IN_MEMORY", "100"))
+    RUN_HISTORY_DIR: str = os.getenv("RUN_HISTORY_DIR", "./run_history")
+    COMPLETED_TASKS_IN_MEMORY: int = int(os.getenv("COMPLETED_TASKS_IN_MEMORY", "200"))
+    
+    # 调度配置
+    SCHEDULER_MODE: str = os.getenv("SCHEDULER_MODE", "serial")  # serial, dag, pipelined
+    MAX_WORKERS: int = int(os.getenv("MAX_WORKERS", "4"))
+    
+    # 优先级排序配置
+    PRIORITIZER: str = os.getenv("PRIORITIZER", "llm")  # llm, local
+    LLM_PRIORITIZE_EVERY: int = int(os.getenv("LLM_PRIORITIZE_EVERY", "5"))
+    LLM_PRIORITIZE_CHURN: float = float(os.getenv("LLM_PRIORITIZE_CHURN", "0.6"))
+    
+    # 规划配置
+    PLANNING_MODE: str = os.getenv("PLANNING_MODE", "separate")  # separate, fused
+    
+    # 任务去重配置
+    TASK_DEDUP: bool = os.getenv("TASK_DEDUP", "true").lower() == "true"
+    DEDUP_SIMILARITY_THRESHOLD: float = float(os.getenv("DEDUP_SIMILARITY_THRESHOLD", "0.92"))
+    DEDUP_MAX_ENTRIES: int = int(os.getenv("DEDUP_MAX_ENTRIES", "1000"))  # 只与最近登记的这么多个任务比较
+    
+    # 上下文预取（执行当前任务时后台为队首 CONTEXT_PREFETCH_TOP_K 个任务检索上下文）
+    CONTEXT_PREFETCH: bool = os.getenv("CONTEXT_PREFETCH", "true").lower() == "true"
+    CONTEXT_PREFETCH_TOP_K: int = int(os.getenv("CONTEXT_PREFETCH_TOP_K", "2"))
+    
+    # 记忆分块与检索（结果按 token 切成重叠片段写入；检索时按距离阈值过滤、MMR 排序后填满 token 预算）
+    MEMORY_CHUNK_TOKENS: int = int(os.getenv("MEMORY_CHUNK_TOKENS", "200"))
+    MEMORY_CHUNK_OVERLAP: int = int(os.getenv("MEMORY_CHUNK_OVERLAP", "40"))
+    CONTEXT_TOKEN_BUDGET: int = int(os.getenv("CONTEXT_TOKEN_BUDGET", "600"))
+    CONTEXT_CANDIDATES: int = int(os.getenv("CONTEXT_CANDIDATES", "12"))
+    CONTEXT_MAX_DISTANCE: float = float(os.getenv("CONTEXT_MAX_DISTANCE", "0.6"))
+    CONTEXT_MMR_LAMBDA: float = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+    
+    # 收敛检测（结果新颖度连续 CONVERGENCE_PATIENCE 次低于阈值时提前停止，0 表示关闭）
+    CONVERGENCE_PATIENCE: int = int(os.getenv("CONVERGENCE_PATIENCE", "0"))
+    CONVERGENCE_NOVELTY_THRESHOLD: float = float(os.getenv("CONVERGENCE_NOVELTY_THRESHOLD", "0.08"))
+    CONVERGENCE_MIN_ITERATIONS: int = int(os.getenv("CONVERGENCE_MIN_ITERATIONS", "5"))
+    CONVERGENCE_LOOKBACK: int = int(os.getenv("CONVERGENCE_LOOKBACK", "50"))  # 新颖度只与最近这么多个结果比较
+    
+    # 提示词 token 预算（按阶段）
+    PROMPT_BUDGET_EXECUTE: int = int(os.getenv("PROMPT_BUDGET_EXECUTE", "3000"))
+    PROMPT_BUDGET_ANALYZE: int = int(os.getenv("PROMPT_BUDGET_ANALYZE", "2000"))
+    PROMPT_BUDGET_CREATE: int = int(os.getenv("PROMPT_BUDGET_CREATE", "2500"))
+    PROMPT_BUDGET_PRIORITIZE: int = int(os.getenv("PROMPT_BUDGET_PRIORITIZE", "2500"))
+    PROMPT_BUDGET_PLAN: int = int(os.getenv("PROMPT_BUDGET_PLAN", "3500"))
+    
+    # 运行日志与快照配置（崩溃后恢复）
+    CHECKPOINT_ENABLED: bool = os.getenv("CHECKPOINT_ENABLED", "true").lower() == "true"
+    CHECKPOINT_DIR: str = os.getenv("CHECKPOINT_DIR", "./checkpoints")
+    CHECKPOINT_SNAPSHOT_EVERY: int = int(os.getenv("CHECKPOINT_SNAPSHOT_EVERY", "20"))
+    CHECKPOINT_FSYNC: bool = os.getenv("CHECKPOINT_FSYNC", "true").lower() == "true"
+    
     # 日志配置
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
     LOG_FILE: str = os.getenv("LOG_FILE", "babyagi.log")
@@ -50,14 +153,58 @@ class Config:
     @classmethod
     def validate(cls) -> bool:
         """验证配置是否有效"""
-        if cls.LLM_PROVIDER == "openai" and not cls.OPENAI_API_KEY:
+        if cls.LLM_PROVIDER == "openai" and not cls.OPENAI_API_KEY and cls.LLM_TRACE_MODE != "replay":
             raise ValueError("使用 OpenAI 时必须设置 OPENAI_API_KEY")
         
+        if cls.LLM_TRACE_MODE not in ("off", "record", "replay"):
+            raise ValueError(f"不支持的 LLM 轨迹模式: {cls.LLM_TRACE_MODE}")
+        
+        if cls.VECTOR_NAMESPACE not in ("objective", "run", "shared"):
+            raise ValueError(f"不支持的记忆命名空间模式: {cls.VECTOR_NAMESPACE}")
+        
         if cls.VECTOR_DB == "pinecone" and (not cls.PINECONE_API_KEY or not cls.PINECONE_ENVIRONMENT):
             raise ValueError("使用 Pinecone 时必须设置 PINECONE_API_KEY 和 PINECONE_ENVIRONMENT")
         
         return True
     
+    @classmethod
+    def get_llm_base_urls(cls) -> list:
+        """获取当前 LLM 提供商的服务地址列表"""
+        if cls.LLM_PROVIDER == "openai":
+            urls, default = cls.OPENAI_BASE_URLS, cls.OPENAI_BASE_URL or "https://api.openai.com/v1"
+        else:
+            urls, default = cls.OLLAMA_BASE_URLS, cls.OLLAMA_BASE_URL
+        return [url.strip() for url in urls.split(",") if url.strip()] or [default]
+    
+    @classmethod
+    def get_llm_replay_latency(cls):
+        """解析回放时的模拟延迟：秒数，或 "recorded" 表示使用录制耗时"""
+        if cls.LLM_REPLAY_LATENCY.strip().lower() == "recorded":
+            return "recorded"
+        return float(cls.LLM_REPLAY_LATENCY or 0)
+    
+    @classmethod
+    def get_llm_agent_weights(cls) -> dict:
+        """解析各 Agent 的 LLM 调度权重"""
+        weights = {}
+        for item in cls.LLM_AGENT_WEIGHTS.split(","):
+            agent_id, _, weight = item.strip().rpartition(":")
+            if agent_id and weight:
+                weights[agent_id] = float(weight)
+        return weights
+    
+    @classmethod
+    def get_prompt_budgets(cls) -> dict:
+        """获取各阶段提示词 token 预算"""
+        return {
+            "execute": cls.PROMPT_BUDGET_EXECUTE,
+            "tool_decision": cls.PROMPT_BUDGET_ANALYZE,
+            "interpret": cls.PROMPT_BUDGET_EXECUTE,
+            "create": cls.PROMPT_BUDGET_CREATE,
+            "prioritize": cls.PROMPT_BUDGET_PRIORITIZE,
+            "plan": cls.PROMPT_BUDGET_PLAN
+        }
+    
     @classmethod
     def get_summary(cls) -> dict:
         """获取配置摘要（不包含敏感信息）"""
@@ -67,6 +214,8 @@ class Config:
             "ollama_model": cls.OLLAMA_MODEL if cls.LLM_PROVIDER == "ollama" else None,
             "vector_db": cls.VECTOR_DB,
             "max_iterations": cls.MAX_ITERATIONS,
+            "scheduler_mode": cls.SCHEDULER_MODE,
+            "planning_mode": cls.PLANNING_MODE,
             "log_level": cls.LOG_LEVEL
         }
 
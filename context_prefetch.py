@@ -0,0 +1,111 @@
+import asyncio
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from logger import get_logger
+
+logger = get_logger("context_prefetch")
+
+class ContextPrefetcher:
+    """待执行任务的上下文预取
+    
+    当前任务的 LLM 调用进行时，在后台线程中为队首 top_k 个待执行任务计算查询嵌入并检索相关上下文，按任务 ID 缓存。
+    查询嵌入只取决于任务内容，保留到任务出队为止；检索结果取决于记忆内容，每次写入记忆后整体失效，
+    由下一次 schedule 重新预取（只需重新检索，不再计算嵌入）。
+    """
+    
+    def __init__(
+        self,
+        search: Callable[[str, Optional[List[float]]], str],
+        embed: Optional[Callable[[List[str]], Any]] = None,
+        top_k: int = 2
+    ):
+        self._search = search
+        self._embed = embed
+        self.top_k = max(0, top_k)
+        self._generation = 0
+        # 任务 ID -> (记忆版本, 任务内容, 检索结果 Future)
+        self._entries: Dict[str, Tuple[int, str, asyncio.Future]] = {}
+        # 任务 ID -> (任务内容, 查询嵌入)
+        self._embeddings: Dict[str, Tuple[str, Optional[List[float]]]] = {}
+        self.stats = {"hits": 0, "misses": 0, "prefetched": 0, "invalidated": 0}
+        self._lock = threading.Lock()
+    
+    def _query_embedding(self, task_id: str, content: str) -> Optional[List[float]]:
+        if self._embed is None:
+            return None
+        with self._lock:
+            cached = self._embeddings.get(task_id)
+        if cached is not None and cached[0] == content:
+            return cached[1]
+        
+        try:
+            embedding = [float(value) for value in self._embed([content])[0]]
+        except Exception as e:
+            logger.warning(f"计算查询嵌入失败，改由向量数据库计算: {e}")
+            embedding = None
+        with self._lock:
+            self._embeddings[task_id] = (content, embedding)
+        return embedding
+    
+    def _fetch(self, task_id: str, content: str) -> str:
+        return self._search(content, self._query_embedding(task_id, content))
+    
+    def schedule(self, tasks: Sequence[Any]) -> None:
+        """为队首任务启动后台预取（需在事件循环中调用），已有当前记忆版本结果的任务跳过"""
+        upcoming = list(tasks[:self.top_k])
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # 只保留仍在队首的任务的查询嵌入
+            keep = {task.id for task in upcoming} | set(self._entries)
+            self._embeddings = {task_id: value for task_id, value in self._embeddings.items() if task_id in keep}
+            
+            for task in upcoming:
+                entry = self._entries.get(task.id)
+                if entry is not None and entry[0] == self._generation and entry[1] == task.content and entry[2].get_loop() is loop:
+                    continue
+                future = asyncio.ensure_future(asyncio.to_thread(self._fetch, task.id, task.content))
+                # 被丢弃的预取结果无人等待，取走异常避免告警
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self._entries[task.id] = (self._generation, task.content, future)
+                self.stats["prefetched"] += 1
+    
+    def invalidate(self) -> None:
+        """记忆内容已变化，丢弃全部预取结果（查询嵌入仍然有效）"""
+        with self._lock:
+            self._generation += 1
+            self.stats["invalidated"] += len(self._entries)
+            self._entries.clear()
+    
+    async def get(self, task: Any) -> str:
+        """取出任务的上下文：有当前记忆版本的预取结果时直接使用（仍在检索中则等待），否则立即检索"""
+        with self._lock:
+            entry = self._entries.pop(task.id, None)
+            generation = self._generation
+        
+        context = None
+        if entry is not None and entry[0] == generation and entry[1] == task.content \
+                and entry[2].get_loop() is asyncio.get_running_loop():
+            try:
+                context = await entry[2]
+            except Exception as e:
+                logger.warning(f"预取上下文失败，重新检索: {e}")
+            # 等待期间记忆发生了变化，预取结果可能缺少新写入的内容
+            if self._generation != generation:
+                context = None
+        
+        with self._lock:
+            self.stats["hits" if context is not None else "misses"] += 1
+        if context is None:
+            context = await asyncio.to_thread(self._fetch, task.id, task.content)
+        
+        with self._lock:
+            self._embeddings.pop(task.id, None)
+        return context
+    
+    def clear(self) -> None:
+        """清空全部缓存"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._embeddings.clear()
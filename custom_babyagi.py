@@ -1,22 +1,49 @@
+import asyncio
+import itertools
 import json
+import threading
 import time
 import uuid
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass
+from collections import deque
+from contextvars import ContextVar
+from typing import List, Dict, Any, Optional, Callable, Awaitable, Tuple, AsyncIterator, Iterator, Deque
+from dataclasses import dataclass, field
 
 import chromadb
 from chromadb.utils.embedding_functions import OpenAIEmbeddingFunction, DefaultEmbeddingFunction
-import openai
-import requests
 
 from config import config
 from logger import get_logger
+from task_queue import TaskQueue
+from prioritizer import EmbeddingPrioritizer
+from dedup import TaskDeduplicator
+from progress import ProgressMonitor
+from context_prefetch import ContextPrefetcher
+from prompt_builder import PromptBuilder, PromptSection, count_tokens
+from memory_retrieval import chunk_text, mmr_order
+from checkpoint import RunJournal
+from vector_writer import WriteBehindCollection
+from numpy_vector_store import NumpyVectorStore, delete_store
+from memory_namespaces import SHARED_NAMESPACE, get_namespace_registry, namespace_name
+from run_history import RunHistory
+from llm_cache import get_llm_cache
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache, get_embedding_cache
+from llm_client import get_llm_pool
+from llm_ledger import LLMLedger, LLMCallContext, current_llm_call
+from llm_replay import LLMTrace, LLMTraceMiss, get_llm_trace
+from json_stream import JSONStreamExtractor
 
 logger = get_logger("babyagi")
 
-@dataclass
+# LLM 调用失败时返回的文本前缀（这类响应不会被缓存）
+LLM_ERROR_PREFIX = "LLM 调用失败"
+
+# 当前协程所处的迭代序号，用于标记 LLM 调用记录
+current_iteration: ContextVar[Optional[int]] = ContextVar("current_iteration", default=None)
+
+@dataclass(slots=True)
 class Task:
-    """任务数据类"""
+    """任务数据类（使用 __slots__，不为每个实例分配属性字典）"""
     id: str
     content: str
     priority: int = 1
@@ -24,11 +51,16 @@ class Task:
     created_at: float = None
     completed_at: float = None
     result: str = None
+    dependencies: List[str] = field(default_factory=list)  # 依赖的任务 ID
     
     def __post_init__(self):
         if self.created_at is None:
             self.created_at = time.time()
     
+    def summary(self) -> Dict[str, Any]:
+        """迭代记录中使用的精简信息（结果单独记录，不重复保存）"""
+        return {"id": self.id, "content": self.content, "priority": self.priority}
+    
     def to_dict(self) -> Dict[str, Any]:
         return {
             "id": self.id,
@@ -37,42 +69,177 @@ class Task:
             "status": self.status,
             "created_at": self.created_at,
             "completed_at": self.completed_at,
-            "result": self.result
+            "result": self.result,
+            "dependencies": list(self.dependencies)
         }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Task":
+        """从 to_dict 的结果还原任务"""
+        return cls(**{name: data[name] for name in cls.__dataclass_fields__ if name in data})
 
-class CustomBabyAGI:
-    """自定义 BabyAGI 实现"""
+class AsyncCustomBabyAGI:
+    """异步 BabyAGI 引擎
+    
+    LLM 调用、上下文检索和主循环均为协程，多个 Agent 可以在同一个事件循环中协作运行。
+    """
     
-    def __init__(self, objective: str, initial_task: str = None):
+    # 使用中的记忆命名空间最多每隔这么多秒刷新一次最近使用时间
+    NAMESPACE_TOUCH_INTERVAL = 60.0
+    
+    def __init__(self, objective: str, initial_task: str = None, run_id: str = None):
         self.objective = objective
         self.initial_task = initial_task or f"制定实现以下目标的任务列表: {objective}"
+        self.run_id = run_id or str(uuid.uuid4())
         
         # 初始化组件
+        self.embedding_function = None
+        self.embedding_cache: Optional[EmbeddingCache] = None
+        # 记忆按目标或运行隔离到独立的集合，检索开销只取决于当前命名空间的大小
+        self.memory_namespace = namespace_name(config.VECTOR_NAMESPACE, objective, self.run_id)
+        self._namespace_touched_at = 0.0
+        # _init_vector_db 创建的后端（chroma 或 numpy）；注入的向量存储为 None，不登记到注册表
+        self._namespace_backend: Optional[str] = None
+        self._chroma_client = None
         self.vector_db = self._init_vector_db()
-        self.llm = self._init_llm()
+        self.llm_pool = None
+        # 已结束的运行在调度器中的排队统计（调度器在运行结束时清理 Agent 的状态）
+        self.llm_queue_stats = {"calls": 0, "queue_wait": 0.0, "max_queue_wait": 0.0}
+        self.llm_cache_stats = {"hits": 0, "misses": 0, "coalesced": 0}
+        self.llm_trace: Optional[LLMTrace] = None
+        if config.LLM_TRACE_MODE == "replay":
+            # 回放模式不连接 LLM 服务，响应全部来自轨迹文件
+            self.llm_trace = get_llm_trace()
+            self.allm = self._init_replay_llm(self.llm_trace)
+        else:
+            self.allm = self._ensure_async_llm(self._init_llm())
+            if config.LLM_CACHE_ENABLED:
+                self.allm = self._wrap_llm_cache(self.allm)
+            if config.LLM_TRACE_MODE == "record":
+                self.llm_trace = get_llm_trace()
+                self.allm = self._wrap_llm_trace(self.allm, self.llm_trace)
         
-        # 任务管理
-        self.task_list: List[Task] = []
-        self.completed_tasks: List[Task] = []
+        # 任务管理（堆优先级队列，按优先级数字从小到大出队）
+        self.task_list = TaskQueue()
         self.current_iteration = 0
         
+        # 已完成任务只在内存中保留最近的一部分，迭代记录超出上限后写入磁盘，按页读取
+        self.completed_tasks: Deque[Task] = deque(maxlen=config.COMPLETED_TASKS_IN_MEMORY)
+        self.completed_count = 0
+        self.history = RunHistory(self.run_id, config.RUN_HISTORY_DIR, config.RUN_HISTORY_IN_MEMORY)
+        
+        # 调度配置（dag 模式并发执行无依赖的就绪任务，pipelined 模式让规划与执行重叠）
+        self.scheduler_mode = config.SCHEDULER_MODE
+        self.max_workers = max(1, config.MAX_WORKERS)
+        self._task_lock = threading.RLock()
+        
+        # 优先级排序配置（local 模式用嵌入相似度排序，仅定期或队列变化较大时调用 LLM）
+        self.prioritizer_mode = config.PRIORITIZER
+        self.llm_prioritize_every = max(1, config.LLM_PRIORITIZE_EVERY)
+        self.llm_prioritize_churn = config.LLM_PRIORITIZE_CHURN
+        self._prioritizer: Optional[EmbeddingPrioritizer] = None
+        self._last_llm_prioritize_iteration = 0
+        self._last_llm_prioritized_ids: set = set()
+        self.prioritization_stats = {"llm": 0, "local": 0}
+        
+        # 规划配置（fused 模式单次 LLM 调用同时创建新任务并给出完整优先级顺序）
+        self.planning_mode = config.PLANNING_MODE
+        self.planning_stats = {"fused": 0, "separate": 0, "fused_fallback": 0}
+        
+        # 入队前去重（精确匹配 + 嵌入相似度）
+        self.deduplicator: Optional[TaskDeduplicator] = None
+        if config.TASK_DEDUP:
+            self.deduplicator = TaskDeduplicator(
+                self.embedding_function,
+                config.DEDUP_SIMILARITY_THRESHOLD,
+                max_entries=config.DEDUP_MAX_ENTRIES
+            )
+        
+        # 收敛检测：结果新颖度连续多次低于阈值且队列不再缩短时提前停止
+        self.progress = ProgressMonitor(
+            self.embedding_function,
+            novelty_threshold=config.CONVERGENCE_NOVELTY_THRESHOLD,
+            patience=config.CONVERGENCE_PATIENCE,
+            min_iterations=config.CONVERGENCE_MIN_ITERATIONS,
+            lookback=config.CONVERGENCE_LOOKBACK
+        )
+        
+        # 上下文预取：执行当前任务时在后台为队首任务检索上下文，写入记忆后失效
+        self.prefetcher: Optional[ContextPrefetcher] = None
+        if config.CONTEXT_PREFETCH:
+            self.prefetcher = ContextPrefetcher(
+                lambda query, embedding: self._get_relevant_context(query, query_embedding=embedding),
+                self.embedding_function,
+                config.CONTEXT_PREFETCH_TOP_K
+            )
+        
+        # 提示词 token 预算与 LLM 调用账本（按阶段统计 token、延迟、排队、重试和缓存命中）
+        self.prompt_budgets = config.get_prompt_budgets()
+        self.token_model = config.OPENAI_MODEL if config.LLM_PROVIDER == "openai" else None
+        self.ledger = LLMLedger(self.run_id)
+        
+        # 流式输出：执行中任务的已生成片段，可通过 get_status 查看
+        self.llm_streaming = config.LLM_STREAMING
+        self._in_progress: Dict[str, Dict[str, Any]] = {}
+        
+        # 运行日志与快照（用于崩溃后恢复）
+        self.journal: Optional[RunJournal] = None
+        if config.CHECKPOINT_ENABLED:
+            self.journal = RunJournal(
+                self.run_id,
+                config.CHECKPOINT_DIR,
+                snapshot_every=config.CHECKPOINT_SNAPSHOT_EVERY,
+                fsync=config.CHECKPOINT_FSYNC,
+                before_snapshot=self.flush_memory,
+                max_completed=config.COMPLETED_TASKS_IN_MEMORY,
+                max_iterations=config.RUN_HISTORY_IN_MEMORY
+            )
+        self._restored_iterations: Optional[List[Dict[str, Any]]] = None
+        self._restored_max_iterations: Optional[int] = None
+        
         logger.info(f"BabyAGI 初始化完成，目标: {objective}")
     
+    def _init_embedding_function(self):
+        """选择嵌入函数，返回 Chroma 集合使用的原始嵌入函数
+        
+        本地优先级排序复用同一个嵌入函数；启用嵌入缓存时由 Agent 计算嵌入后传给向量数据库，
+        相同文本的嵌入在迭代、Agent 和重启之间复用
+        """
+        if config.LLM_PROVIDER == "openai" and config.OPENAI_API_KEY:
+            embedding_model = "openai/text-embedding-ada-002"
+            embedding_function = OpenAIEmbeddingFunction(
+                api_key=config.OPENAI_API_KEY,
+                api_base=config.OPENAI_BASE_URL,
+                model_name="text-embedding-ada-002"
+            )
+        else:
+            embedding_model = "default/all-MiniLM-L6-v2"
+            embedding_function = DefaultEmbeddingFunction()
+        
+        self.embedding_function = embedding_function
+        if config.EMBEDDING_CACHE_ENABLED:
+            self.embedding_cache = get_embedding_cache()
+            self.embedding_function = CachedEmbeddingFunction(embedding_function, embedding_model, self.embedding_cache)
+        return embedding_function
+    
+    def _wrap_write_behind(self, collection):
+        """任务结果先进入写缓冲，按条数或时间批量写入"""
+        if config.VECTOR_WRITE_BATCH_SIZE > 1:
+            return WriteBehindCollection(
+                collection,
+                self.embedding_function,
+                batch_size=config.VECTOR_WRITE_BATCH_SIZE,
+                flush_interval=config.VECTOR_WRITE_FLUSH_INTERVAL
+            )
+        return collection
+    
     def _init_vector_db(self):
         """初始化向量数据库"""
         try:
             if config.VECTOR_DB == "chroma":
                 from chromadb.config import Settings
                 
-                # 选择嵌入函数
-                if config.LLM_PROVIDER == "openai" and config.OPENAI_API_KEY:
-                    embedding_function = OpenAIEmbeddingFunction(
-                        api_key=config.OPENAI_API_KEY,
-                        api_base=config.OPENAI_BASE_URL,
-                        model_name="text-embedding-ada-002"
-                    )
-                else:
-                    embedding_function = DefaultEmbeddingFunction()
+                embedding_function = self._init_embedding_function()
                 
                 # 创建 Chroma 客户端，使用一致的设置
                 client = chromadb.PersistentClient(
@@ -83,15 +250,37 @@ class CustomBabyAGI:
                     )
                 )
                 
-                # 获取或创建集合
+                self._chroma_client = client
+                
+                # 获取或创建当前命名空间的集合
                 collection = client.get_or_create_collection(
-                    name="babyagi_tasks",
+                    name=self.memory_namespace,
                     embedding_function=embedding_function,
                     metadata={"hnsw:space": "cosine"}
                 )
                 
-                logger.info(f"ChromaDB 初始化成功，存储路径: {config.CHROMA_PERSIST_DIR}")
-                return collection
+                logger.info(f"ChromaDB 初始化成功，存储路径: {config.CHROMA_PERSIST_DIR}，集合: {self.memory_namespace}")
+                self._namespace_backend = config.VECTOR_DB
+                self._touch_namespace()
+                self._retire_stale_namespaces()
+                return self._wrap_write_behind(collection)
+            
+            elif config.VECTOR_DB == "numpy":
+                # 进程内的内存映射向量矩阵，精确检索（可选 IVF 分区），不依赖向量数据库服务
+                self._init_embedding_function()
+                collection = NumpyVectorStore(
+                    config.NUMPY_VECTOR_DIR,
+                    self.memory_namespace,
+                    self.embedding_function,
+                    ivf_lists=config.NUMPY_IVF_LISTS,
+                    nprobe=config.NUMPY_IVF_NPROBE
+                )
+                
+                logger.info(f"NumPy 向量存储初始化成功，存储路径: {config.NUMPY_VECTOR_DIR}，集合: {self.memory_namespace}")
+                self._namespace_backend = config.VECTOR_DB
+                self._touch_namespace()
+                self._retire_stale_namespaces()
+                return self._wrap_write_behind(collection)
             
             else:
                 raise ValueError(f"不支持的向量数据库: {config.VECTOR_DB}")
@@ -100,80 +289,394 @@ class CustomBabyAGI:
             logger.error(f"向量数据库初始化失败: {e}")
             raise
     
+    def _touch_namespace(self, force: bool = True) -> None:
+        """更新当前命名空间的最近使用时间（shared 命名空间和注入的向量存储不登记，也不会被删除）
+        
+        写入和检索记忆时以 force=False 调用，最多每 NAMESPACE_TOUCH_INTERVAL 秒写一次注册表。
+        """
+        if self._namespace_backend is None or self.memory_namespace == SHARED_NAMESPACE:
+            return
+        now = time.time()
+        if not force and now - self._namespace_touched_at < self.NAMESPACE_TOUCH_INTERVAL:
+            return
+        self._namespace_touched_at = now
+        try:
+            get_namespace_registry().touch(
+                self._namespace_backend, self.memory_namespace, mode=config.VECTOR_NAMESPACE, objective=self.objective
+            )
+        except Exception as e:
+            logger.warning(f"登记记忆命名空间失败: {e}")
+    
+    def _drop_namespace(self, name: str) -> None:
+        """整体删除一个命名空间的集合"""
+        if config.VECTOR_DB == "chroma":
+            try:
+                self._chroma_client.delete_collection(name=name)
+            except ValueError:
+                # 集合已被删除
+                pass
+        elif config.VECTOR_DB == "numpy":
+            delete_store(config.NUMPY_VECTOR_DIR, name)
+        get_namespace_registry().remove(config.VECTOR_DB, name)
+    
+    def _retire_stale_namespaces(self) -> None:
+        """删除超过 VECTOR_NAMESPACE_TTL_DAYS 天未使用的命名空间"""
+        if config.VECTOR_NAMESPACE_TTL_DAYS <= 0:
+            return
+        stale = get_namespace_registry().stale(
+            config.VECTOR_DB, config.VECTOR_NAMESPACE_TTL_DAYS * 86400, exclude=[self.memory_namespace]
+        )
+        for name in stale:
+            try:
+                self._drop_namespace(name)
+                logger.info(f"已删除长期未使用的记忆命名空间: {name}")
+            except Exception as e:
+                logger.warning(f"删除记忆命名空间 {name} 失败: {e}")
+    
+    def retire_memory(self) -> bool:
+        """删除当前命名空间的全部记忆（shared 命名空间由所有 Agent 共用，不删除）"""
+        if self.memory_namespace == SHARED_NAMESPACE:
+            logger.warning("共享的记忆命名空间不能删除")
+            return False
+        if isinstance(self.vector_db, WriteBehindCollection):
+            self.vector_db.close()
+        try:
+            self._drop_namespace(self.memory_namespace)
+        except Exception as e:
+            logger.error(f"删除记忆命名空间 {self.memory_namespace} 失败: {e}")
+            return False
+        logger.info(f"已删除记忆命名空间: {self.memory_namespace}")
+        return True
+    
     def _init_llm(self):
-        """初始化 LLM 客户端"""
+        """初始化异步 LLM 客户端（进程内共享的多地址连接池）"""
         try:
-            if config.LLM_PROVIDER == "openai":
-                if not config.OPENAI_API_KEY:
-                    raise ValueError("使用 OpenAI 时必须设置 OPENAI_API_KEY")
-                
-                openai.api_key = config.OPENAI_API_KEY
-                openai.base_url = config.OPENAI_BASE_URL
-                
-                def openai_llm(prompt: str, max_tokens: int = 1000) -> str:
-                    try:
-                        response = openai.ChatCompletion.create(
-                            model=config.OPENAI_MODEL,
-                            messages=[{"role": "user", "content": prompt}],
-                            max_tokens=max_tokens,
-                            temperature=0.7
-                        )
-                        return response.choices[0].message.content.strip()
-                    except Exception as e:
-                        logger.error(f"OpenAI API 调用失败: {e}")
-                        return f"LLM 调用失败: {str(e)}"
-                
-                logger.info(f"OpenAI LLM 初始化成功，模型: {config.OPENAI_MODEL}")
-                return openai_llm
-            
-            elif config.LLM_PROVIDER == "ollama":
-                def ollama_llm(prompt: str, max_tokens: int = 1000) -> str:
-                    try:
-                        response = requests.post(
-                            f"{config.OLLAMA_BASE_URL}/api/generate",
-                            json={
-                                "model": config.OLLAMA_MODEL,
-                                "prompt": prompt,
-                                "stream": False,
-                                "options": {
-                                    "num_predict": max_tokens,
-                                    "temperature": 0.7
-                                }
-                            },
-                            timeout=60
-                        )
-                        response.raise_for_status()
-                        return response.json()["response"].strip()
-                    except Exception as e:
-                        logger.error(f"Ollama API 调用失败: {e}")
-                        return f"LLM 调用失败: {str(e)}"
-                
-                logger.info(f"Ollama LLM 初始化成功，模型: {config.OLLAMA_MODEL}")
-                return ollama_llm
-            
-            else:
+            if config.LLM_PROVIDER not in ("openai", "ollama"):
                 raise ValueError(f"不支持的 LLM 提供商: {config.LLM_PROVIDER}")
+            if config.LLM_PROVIDER == "openai" and not config.OPENAI_API_KEY:
+                raise ValueError("使用 OpenAI 时必须设置 OPENAI_API_KEY")
+            
+            pool = get_llm_pool()
+            self.llm_pool = pool
+            provider_name = "OpenAI" if config.LLM_PROVIDER == "openai" else "Ollama"
+            
+            async def pooled_llm(prompt: str, max_tokens: int = 1000) -> str:
+                try:
+                    response = await pool.generate(prompt, max_tokens, config.LLM_TEMPERATURE, agent_id=self.run_id)
+                    return response.strip()
+                except Exception as e:
+                    logger.error(f"{provider_name} API 调用失败: {e}")
+                    return f"{LLM_ERROR_PREFIX}: {str(e)}"
+            
+            async def pooled_stream(prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+                produced = False
+                upstream = pool.stream(prompt, max_tokens, config.LLM_TEMPERATURE, agent_id=self.run_id)
+                try:
+                    async for chunk in upstream:
+                        produced = True
+                        yield chunk
+                except Exception as e:
+                    logger.error(f"{provider_name} API 流式调用失败: {e}")
+                    if not produced:
+                        yield f"{LLM_ERROR_PREFIX}: {str(e)}"
+                finally:
+                    # 调用方提前停止读取时关闭连接，服务端随之停止生成
+                    await upstream.aclose()
+            
+            pooled_llm.stream = pooled_stream
+            logger.info(f"{provider_name} LLM 初始化成功，模型: {pool.model}")
+            return pooled_llm
                 
         except Exception as e:
             logger.error(f"LLM 初始化失败: {e}")
             raise
     
-    def execute_task(self, task: Task) -> str:
-        """执行单个任务"""
+    @staticmethod
+    def _init_replay_llm(trace: LLMTrace) -> Callable[..., Awaitable[str]]:
+        """从轨迹文件回放 LLM 响应"""
+        async def replay_llm(prompt: str, max_tokens: int = 1000) -> str:
+            try:
+                return await trace.replay(prompt, max_tokens)
+            except LLMTraceMiss as e:
+                logger.error(f"LLM 回放失败: {e}")
+                return f"{LLM_ERROR_PREFIX}: {str(e)}"
+        
+        async def replay_stream(prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+            try:
+                async for chunk in trace.replay_stream(prompt, max_tokens):
+                    yield chunk
+            except LLMTraceMiss as e:
+                logger.error(f"LLM 回放失败: {e}")
+                yield f"{LLM_ERROR_PREFIX}: {str(e)}"
+        
+        replay_llm.stream = replay_stream
+        logger.info(f"LLM 回放模式，轨迹文件: {trace.path}")
+        return replay_llm
+    
+    @staticmethod
+    def _wrap_llm_trace(llm: Callable[..., Awaitable[str]], trace: LLMTrace) -> Callable[..., Awaitable[str]]:
+        """录制 LLM 的每次请求和响应到轨迹文件"""
+        async def traced_llm(prompt: str, max_tokens: int = 1000) -> str:
+            started = time.monotonic()
+            response = await llm(prompt, max_tokens)
+            trace.record(prompt, max_tokens, response, time.monotonic() - started)
+            return response
+        
+        stream = getattr(llm, "stream", None)
+        if stream is not None:
+            async def traced_stream(prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+                started = time.monotonic()
+                chunks: List[str] = []
+                upstream = stream(prompt, max_tokens)
+                try:
+                    async for chunk in upstream:
+                        chunks.append(chunk)
+                        yield chunk
+                finally:
+                    # 调用方提前停止读取时只录制已产出的部分，回放时在同一位置结束
+                    await upstream.aclose()
+                    trace.record(prompt, max_tokens, "".join(chunks), time.monotonic() - started, chunks)
+            
+            traced_llm.stream = traced_stream
+        
+        return traced_llm
+    
+    @staticmethod
+    def _ensure_async_llm(llm: Callable[..., Any]) -> Callable[..., Awaitable[str]]:
+        """同步 LLM 函数放到线程池中执行，统一为协程接口"""
+        if asyncio.iscoroutinefunction(llm):
+            return llm
+        
+        async def async_llm(prompt: str, max_tokens: int = 1000) -> str:
+            return await asyncio.to_thread(llm, prompt, max_tokens)
+        
+        return async_llm
+    
+    def _wrap_llm_cache(self, llm: Callable[..., Awaitable[str]]) -> Callable[..., Awaitable[str]]:
+        """为 LLM 函数加上响应缓存，相同的请求直接返回缓存结果"""
+        cache = get_llm_cache()
+        provider = config.LLM_PROVIDER
+        model = config.OPENAI_MODEL if provider == "openai" else config.OLLAMA_MODEL
+        
+        async def cached_llm(prompt: str, max_tokens: int = 1000) -> str:
+            key = cache.make_key(provider, model, prompt, max_tokens, config.LLM_TEMPERATURE)
+            response, source = await cache.get_or_compute(
+                key,
+                lambda: llm(prompt, max_tokens),
+                cacheable=lambda value: not value.startswith(LLM_ERROR_PREFIX)
+            )
+            call = current_llm_call.get()
+            if call is not None:
+                call.cache = source
+            if source == "miss":
+                self.llm_cache_stats["misses"] += 1
+            elif source == "coalesced":
+                self.llm_cache_stats["coalesced"] += 1
+            else:
+                self.llm_cache_stats["hits"] += 1
+            return response
+        
+        stream = getattr(llm, "stream", None)
+        if stream is not None:
+            async def cached_stream(prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+                key = cache.make_key(provider, model, prompt, max_tokens, config.LLM_TEMPERATURE)
+                cached, tier = await cache.lookup(key)
+                call = current_llm_call.get()
+                if call is not None:
+                    call.cache = tier or "miss"
+                if cached is not None:
+                    self.llm_cache_stats["hits"] += 1
+                    yield cached
+                    return
+                
+                self.llm_cache_stats["misses"] += 1
+                chunks = []
+                upstream = stream(prompt, max_tokens)
+                try:
+                    async for chunk in upstream:
+                        chunks.append(chunk)
+                        yield chunk
+                finally:
+                    await upstream.aclose()
+                # 调用方（如 JSON 提取）提前停止时不会执行到这里：不完整的响应不能与完整响应共用同一个缓存键
+                await self._store_streamed(cache, key, chunks)
+            
+            cached_llm.stream = cached_stream
+        
+        return cached_llm
+    
+    @staticmethod
+    async def _store_streamed(cache: Any, key: str, chunks: List[str]) -> None:
+        """缓存流式响应，失败的调用不缓存"""
+        response = "".join(chunks)
+        if response and not response.startswith(LLM_ERROR_PREFIX):
+            await cache.store(key, response)
+    
+    def _render_prompt(self, phase: str, template: str, **values: Any) -> str:
+        """按阶段 token 预算组装提示词，超出预算时裁剪 PromptSection 片段"""
+        builder = PromptBuilder(self.prompt_budgets.get(phase, 4000), model=self.token_model)
+        prompt = builder.render(template, **values)
+        if builder.trimmed:
+            self.ledger.note_trimmed(phase)
+        return prompt
+    
+    @property
+    def token_usage(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段的 LLM 调用统计"""
+        return self.ledger.phases()
+    
+    @staticmethod
+    def _begin_call() -> LLMCallContext:
+        """开始一次 LLM 调用，下层的缓存、调度器和客户端会把信息写入返回的上下文"""
+        call = LLMCallContext()
+        current_llm_call.set(call)
+        return call
+    
+    async def _allm_call(self, phase: str, prompt: str, max_tokens: int = 1000) -> str:
+        """调用 LLM 并在账本中记录本次调用"""
+        call = self._begin_call()
+        response = await self.allm(prompt, max_tokens=max_tokens)
+        self._record_usage(phase, prompt, response, call)
+        return response
+    
+    def _record_usage(self, phase: str, prompt: str, response: str, call: LLMCallContext) -> None:
+        """记录一次 LLM 调用的 token 数、延迟、排队时间、重试次数和缓存命中情况"""
+        entry = self.ledger.record(
+            phase,
+            current_iteration.get(),
+            count_tokens(prompt, self.token_model),
+            count_tokens(response, self.token_model),
+            call
+        )
+        logger.debug(
+            f"LLM 调用 [{phase}] 第 {entry.iteration} 轮: 提示 {entry.prompt_tokens} tokens，"
+            f"输出 {entry.completion_tokens} tokens，耗时 {entry.latency:.3f}s，排队 {entry.queue_wait:.3f}s，"
+            f"重试 {entry.retries} 次，缓存 {entry.cache or '-'}"
+        )
+    
+    async def astream_llm(self, prompt: str, max_tokens: int = 1000) -> AsyncIterator[str]:
+        """流式调用 LLM，逐块产出生成的文本；LLM 不支持流式时整体作为一块产出"""
+        stream = getattr(self.allm, "stream", None)
+        if stream is None:
+            yield await self.allm(prompt, max_tokens=max_tokens)
+            return
+        
+        upstream = stream(prompt, max_tokens)
+        try:
+            async for chunk in upstream:
+                yield chunk
+        finally:
+            await upstream.aclose()
+    
+    async def _astream_call(
+        self,
+        phase: str,
+        prompt: str,
+        max_tokens: int = 1000,
+        task: Optional[Task] = None,
+        on_chunk: Optional[Callable[[str], Any]] = None
+    ) -> str:
+        """流式调用 LLM 并返回完整结果
+        
+        生成过程中的片段会传给 on_chunk，并记录在执行中任务的 partial_result 里。
+        """
+        if not self.llm_streaming:
+            response = await self._allm_call(phase, prompt, max_tokens=max_tokens)
+            if on_chunk is not None:
+                on_chunk(response)
+            return response
+        
+        chunks: List[str] = []
+        call = self._begin_call()
+        if task is not None:
+            with self._task_lock:
+                self._in_progress[task.id] = {"id": task.id, "content": task.content, "chunks": chunks}
+        
+        started = time.time()
+        try:
+            async for chunk in self.astream_llm(prompt, max_tokens=max_tokens):
+                if not chunks:
+                    logger.debug(f"LLM 流式调用 [{phase}]: 首个片段耗时 {time.time() - started:.3f}s")
+                chunks.append(chunk)
+                if on_chunk is not None:
+                    on_chunk(chunk)
+        finally:
+            if task is not None:
+                with self._task_lock:
+                    self._in_progress.pop(task.id, None)
+        
+        response = "".join(chunks).strip()
+        self._record_usage(phase, prompt, response, call)
+        return response
+    
+    async def _astream_json(
+        self,
+        phase: str,
+        prompt: str,
+        max_tokens: int = 1000,
+        kind: str = "array",
+        validator: Optional[Callable[[Any], bool]] = None
+    ) -> Tuple[Any, str]:
+        """流式调用 LLM 并增量提取 JSON，解析出合法的值后立即停止生成
+        
+        返回 (解析结果, 已接收的文本)，没有找到合法 JSON 时解析结果为 None。
+        """
+        extractor = JSONStreamExtractor(kind, validator)
+        if not self.llm_streaming:
+            response = await self._allm_call(phase, prompt, max_tokens=max_tokens)
+            extractor.feed(response)
+            extractor.finish()
+            return extractor.value, response
+        
+        call = self._begin_call()
+        stream = self.astream_llm(prompt, max_tokens=max_tokens)
+        try:
+            async for chunk in stream:
+                if extractor.feed(chunk):
+                    logger.debug(f"LLM 调用 [{phase}]: 已解析出完整 JSON，停止生成")
+                    break
+        finally:
+            await stream.aclose()
+        extractor.finish()
+        
+        self._record_usage(phase, prompt, extractor.text, call)
+        return extractor.value, extractor.text
+    
+    @staticmethod
+    def _is_task_list(value: Any) -> bool:
+        return isinstance(value, list) and all(isinstance(item, dict) for item in value)
+    
+    @staticmethod
+    def _is_priority_list(value: Any) -> bool:
+        return isinstance(value, list) and all(
+            isinstance(item, dict) and "id" in item and "priority" in item for item in value
+        )
+    
+    @staticmethod
+    def _is_plan(value: Any) -> bool:
+        return (
+            isinstance(value, dict)
+            and isinstance(value.get("new_tasks", []), list)
+            and isinstance(value.get("priority_order"), list)
+        )
+    
+    async def aexecute_task(self, task: Task, on_chunk: Optional[Callable[[str], Any]] = None) -> str:
+        """执行单个任务，on_chunk 会依次收到流式生成的结果片段"""
         logger.info(f"开始执行任务: {task.content}")
         task.status = "in_progress"
         
         try:
-            # 获取相关上下文
-            context = self._get_relevant_context(task.content)
+            # 获取相关上下文（优先使用预取结果），并为接下来的任务启动预取
+            context = await self._aget_task_context(task)
+            self._schedule_prefetch()
             
             # 构建执行提示
-            prompt = f"""
+            prompt = self._render_prompt("execute", """
 你是一个高效的任务执行助手。请根据以下信息执行任务：
 
-目标: {self.objective}
+目标: {objective}
 
-当前任务: {task.content}
+当前任务: {task}
 
 相关上下文:
 {context}
@@ -185,10 +688,10 @@ class CustomBabyAGI:
 4. 对实现总体目标的贡献
 
 执行结果:
-"""
+""", objective=self.objective, task=task.content, context=PromptSection(context))
             
             # 调用 LLM 执行任务
-            result = self.llm(prompt, max_tokens=1500)
+            result = await self._astream_call("execute", prompt, max_tokens=1500, task=task, on_chunk=on_chunk)
             
             # 更新任务状态
             task.result = result
@@ -196,7 +699,7 @@ class CustomBabyAGI:
             task.completed_at = time.time()
             
             # 存储到向量数据库
-            self._store_task_result(task)
+            await self._astore_task_result(task)
             
             logger.info(f"任务执行完成: {task.id}")
             return result
@@ -207,18 +710,18 @@ class CustomBabyAGI:
             task.result = f"执行失败: {str(e)}"
             return task.result
     
-    def create_new_tasks(self, completed_task: Task) -> List[Task]:
+    async def acreate_new_tasks(self, completed_task: Task) -> List[Task]:
         """基于已完成任务创建新任务"""
-        prompt = f"""
+        prompt = self._render_prompt("create", """
 基于以下已完成的任务，创建新的任务来推进总体目标的实现。
 
-总体目标: {self.objective}
+总体目标: {objective}
 
-已完成任务: {completed_task.content}
-任务结果: {completed_task.result}
+已完成任务: {completed_task}
+任务结果: {result}
 
 现有任务列表:
-{self._format_task_list()}
+{task_list}
 
 请分析当前进展，并创建 1-3 个新任务来继续推进目标实现。
 每个任务应该：
@@ -227,61 +730,256 @@ class CustomBabyAGI:
 3. 基于已完成任务的结果
 4. 避免重复现有任务
 
+如果某个任务必须等待其他任务完成后才能执行，请在 depends_on 中列出依赖：
+可以填写现有任务列表中的任务ID，也可以填写本次返回数组中任务的序号（从 1 开始）。
+没有依赖的任务可以并行执行，depends_on 留空即可。
+
 请以 JSON 格式返回新任务列表：
 [
-  {{"content": "任务描述1", "priority": 优先级数字}},
-  {{"content": "任务描述2", "priority": 优先级数字}}
+  {{"content": "任务描述1", "priority": 优先级数字, "depends_on": []}},
+  {{"content": "任务描述2", "priority": 优先级数字, "depends_on": [1]}}
 ]
 
 如果不需要创建新任务，返回空数组 []。
-"""
+""",
+            objective=self.objective,
+            completed_task=completed_task.content,
+            result=PromptSection(completed_task.result or "", priority=2),
+            task_list=PromptSection(self._format_task_list(), priority=1)
+        )
         
         try:
-            response = self.llm(prompt, max_tokens=800)
-            
-            # 尝试解析 JSON
-            try:
-                new_tasks_data = json.loads(response.strip())
-                if not isinstance(new_tasks_data, list):
-                    logger.warning("LLM 返回的不是列表格式，尝试提取任务")
-                    return []
-                
-                new_tasks = []
-                for task_data in new_tasks_data:
-                    if isinstance(task_data, dict) and "content" in task_data:
-                        task = Task(
-                            id=str(uuid.uuid4()),
-                            content=task_data["content"],
-                            priority=task_data.get("priority", 1)
-                        )
-                        new_tasks.append(task)
-                
-                logger.info(f"创建了 {len(new_tasks)} 个新任务")
-                return new_tasks
-                
-            except json.JSONDecodeError:
+            new_tasks_data, response = await self._astream_json(
+                "create", prompt, max_tokens=800, kind="array", validator=self._is_task_list
+            )
+            if new_tasks_data is None:
                 logger.warning(f"无法解析 LLM 返回的 JSON: {response}")
                 return []
-                
+            
+            new_tasks = self._build_tasks(new_tasks_data)
+            logger.info(f"创建了 {len(new_tasks)} 个新任务")
+            return new_tasks
+            
         except Exception as e:
             logger.error(f"创建新任务失败: {e}")
             return []
     
-    def prioritize_tasks(self) -> None:
+    def _build_tasks(self, new_tasks_data: List[Any]) -> List[Task]:
+        """将 LLM 返回的任务数据转换为 Task 列表，并解析依赖关系"""
+        entries = [
+            task_data for task_data in new_tasks_data
+            if isinstance(task_data, dict) and "content" in task_data
+        ]
+        new_tasks = [
+            Task(
+                id=str(uuid.uuid4()),
+                content=task_data["content"],
+                priority=task_data.get("priority", 1)
+            )
+            for task_data in entries
+        ]
+        
+        with self._task_lock:
+            known_ids = set(self.task_list.task_ids())
+            known_ids.update(task.id for task in self.completed_tasks)
+        
+        for task, task_data in zip(new_tasks, entries):
+            depends_on = task_data.get("depends_on") or []
+            if not isinstance(depends_on, list):
+                depends_on = [depends_on]
+            
+            for ref in depends_on:
+                ref_str = str(ref).strip()
+                if ref_str in known_ids:
+                    dep_id = ref_str
+                elif ref_str.isdigit() and 1 <= int(ref_str) <= len(new_tasks):
+                    # 同批次任务按序号引用
+                    dep_id = new_tasks[int(ref_str) - 1].id
+                else:
+                    logger.debug(f"忽略无法识别的任务依赖: {ref}")
+                    continue
+                
+                if dep_id != task.id and dep_id not in task.dependencies:
+                    task.dependencies.append(dep_id)
+        
+        return new_tasks
+    
+    async def aplan_tasks(self, completed_task: Task) -> Optional[Tuple[List[Task], Dict[str, int]]]:
+        """单次 LLM 调用同时创建新任务并重新排序
+        
+        返回 (新任务列表, 任务ID到优先级的映射)，响应无法解析时返回 None。
+        """
+        prompt = self._render_prompt("plan", """
+基于以下已完成的任务，创建新的任务来推进总体目标的实现，并为全部待执行任务重新排序。
+
+总体目标: {objective}
+
+已完成任务: {completed_task}
+任务结果: {result}
+
+现有任务列表:
+{task_list}
+
+已完成任务摘要:
+{completed_summary}
+{extra_context}
+请分析当前进展，并创建 0-3 个新任务来继续推进目标实现。
+每个任务应该：
+1. 具体可执行
+2. 与总体目标相关
+3. 基于已完成任务的结果
+4. 避免重复现有任务
+
+如果某个任务必须等待其他任务完成后才能执行，请在 depends_on 中列出依赖：
+可以填写现有任务列表中的任务ID，也可以填写 new_tasks 数组中任务的序号（从 1 开始）。
+
+然后在 priority_order 中按执行顺序（最重要的在前）列出全部待执行任务：
+现有任务填写任务ID，新任务填写它在 new_tasks 中的序号。
+
+请以 JSON 格式返回：
+{{
+  "new_tasks": [
+    {{"content": "任务描述1", "depends_on": []}}
+  ],
+  "priority_order": ["现有任务ID", 1]
+}}
+""",
+            objective=self.objective,
+            completed_task=completed_task.content,
+            result=PromptSection(completed_task.result or "", priority=2),
+            task_list=PromptSection(self._format_task_list(), priority=1),
+            completed_summary=PromptSection(self._format_completed_tasks(), priority=3, keep="tail"),
+            extra_context=PromptSection(self._planning_extra_context(), priority=4)
+        )
+        
+        try:
+            plan, response = await self._astream_json(
+                "plan", prompt, max_tokens=1000, kind="object", validator=self._is_plan
+            )
+        except Exception as e:
+            logger.warning(f"合并规划调用失败: {e}")
+            return None
+        
+        if plan is None:
+            logger.warning(f"无法解析合并规划结果: {response}")
+            return None
+        
+        new_tasks = self._build_tasks(plan.get("new_tasks", []))
+        priority_order = plan["priority_order"]
+        
+        with self._task_lock:
+            pending_ids = [task.id for task in self.task_list.snapshot()]
+        
+        # 按返回顺序分配优先级，未被提及的任务保持原相对顺序排在后面
+        ordered_ids = []
+        for ref in priority_order:
+            ref_str = str(ref).strip()
+            if ref_str.isdigit() and 1 <= int(ref_str) <= len(new_tasks) and ref_str not in pending_ids:
+                task_id = new_tasks[int(ref_str) - 1].id
+            elif ref_str in pending_ids:
+                task_id = ref_str
+            else:
+                logger.debug(f"忽略无法识别的任务引用: {ref}")
+                continue
+            if task_id not in ordered_ids:
+                ordered_ids.append(task_id)
+        
+        listed = set(ordered_ids)
+        ordered_ids.extend(task_id for task_id in pending_ids if task_id not in listed)
+        ordered_ids.extend(task.id for task in new_tasks if task.id not in listed)
+        priority_map = {task_id: position for position, task_id in enumerate(ordered_ids, 1)}
+        
+        for task in new_tasks:
+            task.priority = priority_map[task.id]
+        
+        logger.info(f"合并规划创建了 {len(new_tasks)} 个新任务，排序 {len(priority_map)} 个任务")
+        return new_tasks, priority_map
+    
+    def _planning_extra_context(self) -> str:
+        """合并规划提示词中的附加上下文，子类可覆盖"""
+        return ""
+    
+    async def aprioritize_tasks(self) -> None:
         """重新排序任务优先级"""
         if len(self.task_list) <= 1:
             return
         
-        prompt = f"""
+        if self.prioritizer_mode == "local" and not self._should_use_llm_prioritizer():
+            try:
+                await self._aprioritize_locally()
+                return
+            except Exception as e:
+                logger.warning(f"本地优先级排序失败，改用 LLM 排序: {e}")
+        
+        await self._aprioritize_with_llm()
+    
+    def _should_use_llm_prioritizer(self) -> bool:
+        """local 模式下判断是否需要调用 LLM：每 N 次迭代或队列变化较大时"""
+        if self.embedding_function is None:
+            return True
+        
+        if self.current_iteration - self._last_llm_prioritize_iteration >= self.llm_prioritize_every:
+            return True
+        
+        with self._task_lock:
+            pending_ids = set(self.task_list.task_ids())
+        churn = len(pending_ids - self._last_llm_prioritized_ids) / max(1, len(pending_ids))
+        return churn >= self.llm_prioritize_churn
+    
+    async def _aprioritize_locally(self) -> None:
+        """基于嵌入相似度在本地排序，不调用 LLM"""
+        if self._prioritizer is None:
+            self._prioritizer = EmbeddingPrioritizer(self.embedding_function)
+        
+        with self._task_lock:
+            pending = self.task_list.snapshot()
+            completed = list(self.completed_tasks)
+        
+        priority_map = await asyncio.to_thread(self._prioritizer.rank, self.objective, pending, completed)
+        with self._task_lock:
+            updated = self.task_list.reprioritize(priority_map)
+        
+        self.prioritization_stats["local"] += 1
+        logger.info(f"本地优先级排序完成，更新 {updated} 个任务")
+    
+    async def _adeduplicate(self, new_tasks: List[Task]) -> List[Task]:
+        """过滤与已有任务重复的新任务，依赖被拒绝任务的改为依赖与之重复的任务"""
+        if self.deduplicator is None or not new_tasks:
+            return new_tasks
+        
+        accepted, duplicates = await asyncio.to_thread(self.deduplicator.filter, new_tasks)
+        if duplicates:
+            for task in accepted:
+                dependencies = []
+                for dep_id in task.dependencies:
+                    dep_id = duplicates.get(dep_id, dep_id)
+                    if dep_id != task.id and dep_id not in dependencies:
+                        dependencies.append(dep_id)
+                task.dependencies = dependencies
+            logger.info(f"去重拒绝了 {len(duplicates)} 个重复任务")
+        return accepted
+    
+    def _mark_llm_prioritized(self) -> None:
+        """记录 LLM 排序时的迭代次数和队列内容，供 local 模式判断下次何时调用 LLM"""
+        with self._task_lock:
+            self._last_llm_prioritize_iteration = self.current_iteration
+            self._last_llm_prioritized_ids = set(self.task_list.task_ids())
+        self.prioritization_stats["llm"] += 1
+    
+    async def _aprioritize_with_llm(self) -> None:
+        """调用 LLM 重新分配优先级"""
+        self._mark_llm_prioritized()
+        
+        prompt = self._render_prompt("prioritize", """
 请为以下任务列表重新分配优先级，以最有效地实现总体目标。
 
-总体目标: {self.objective}
+总体目标: {objective}
 
 当前任务列表:
-{self._format_task_list()}
+{task_list}
 
 已完成任务摘要:
-{self._format_completed_tasks()}
+{completed_summary}
 
 请分析每个任务的重要性和紧急性，然后返回重新排序的任务列表。
 优先级数字越小表示优先级越高（1 = 最高优先级）。
@@ -290,168 +988,713 @@ class CustomBabyAGI:
 [
   {{"id": "任务ID", "priority": 新优先级数字}}
 ]
-"""
+""",
+            objective=self.objective,
+            task_list=PromptSection(self._format_task_list(), priority=1),
+            completed_summary=PromptSection(self._format_completed_tasks(), priority=2, keep="tail")
+        )
         
         try:
-            response = self.llm(prompt, max_tokens=600)
-            priority_data = json.loads(response.strip())
+            priority_data, response = await self._astream_json(
+                "prioritize", prompt, max_tokens=600, kind="array", validator=self._is_priority_list
+            )
+            if priority_data is None:
+                raise ValueError(f"无法解析 LLM 返回的 JSON: {response}")
             
             # 更新任务优先级
             priority_map = {item["id"]: item["priority"] for item in priority_data}
-            for task in self.task_list:
-                if task.id in priority_map:
-                    task.priority = priority_map[task.id]
-            
-            # 按优先级排序
-            self.task_list.sort(key=lambda t: t.priority)
-            logger.info("任务优先级重新排序完成")
+            with self._task_lock:
+                updated = self.task_list.reprioritize(priority_map)
+            logger.info(f"任务优先级重新排序完成，更新 {updated} 个任务")
             
         except Exception as e:
-            logger.warning(f"任务优先级排序失败，使用默认排序: {e}")
-            self.task_list.sort(key=lambda t: t.priority)
+            logger.warning(f"任务优先级排序失败，保持现有优先级: {e}")
     
-    def _get_relevant_context(self, query: str, n_results: int = 3) -> str:
-        """获取相关上下文"""
+    def _get_relevant_context(self, query: str, token_budget: Optional[int] = None, query_embedding: Optional[List[float]] = None) -> str:
+        """获取相关上下文（提供 query_embedding 时不再由向量数据库计算查询嵌入）
+        
+        检索 CONTEXT_CANDIDATES 个最近的结果片段，丢弃余弦距离超过 CONTEXT_MAX_DISTANCE 的片段，
+        按 MMR 排序后依次放入，直到用完 token_budget（默认 CONTEXT_TOKEN_BUDGET）。
+        """
         try:
-            if self.vector_db.count() == 0:
+            self._touch_namespace(force=False)
+            stored = self.vector_db.count()
+            if stored == 0:
                 return "暂无相关历史信息。"
             
+            # MMR 需要查询嵌入，由 Agent 计算（启用嵌入缓存时直接命中）
+            if query_embedding is None and self.embedding_function is not None:
+                query_embedding = self.embedding_function([query])[0]
+            if query_embedding is not None:
+                query_args = {"query_embeddings": [query_embedding]}
+            else:
+                query_args = {"query_texts": [query]}
+            # 候选片段的嵌入随检索结果一并返回，MMR 不必重新计算（候选数量有上限，返回的数据量有限）
             results = self.vector_db.query(
-                query_texts=[query],
-                n_results=min(n_results, self.vector_db.count())
+                **query_args,
+                n_results=min(config.CONTEXT_CANDIDATES, stored),
+                include=["documents", "metadatas", "distances", "embeddings"]
             )
             
             if not results["documents"] or not results["documents"][0]:
                 return "暂无相关历史信息。"
             
+            documents, metadatas = results["documents"][0], results["metadatas"][0]
+            embeddings = results.get("embeddings")
+            embeddings = embeddings[0] if embeddings is not None and embeddings[0] is not None else [None] * len(documents)
+            candidates = list(zip(documents, metadatas, embeddings))
+            if results.get("distances"):
+                candidates = [
+                    candidate for candidate, distance in zip(candidates, results["distances"][0])
+                    if distance <= config.CONTEXT_MAX_DISTANCE
+                ]
+            if not candidates:
+                return "暂无相关历史信息。"
+            if len(candidates) > 1 and query_embedding is not None:
+                vectors = [vector for _, _, vector in candidates]
+                if any(vector is None for vector in vectors):
+                    # 向量数据库没有返回嵌入时才重新计算
+                    vectors = self.embedding_function([doc for doc, _, _ in candidates])
+                candidates = [candidates[i] for i in mmr_order(query_embedding, vectors, config.CONTEXT_MMR_LAMBDA)]
+            
+            budget = token_budget if token_budget is not None else config.CONTEXT_TOKEN_BUDGET
             context_parts = []
-            for doc, metadata in zip(results["documents"][0], results["metadatas"][0]):
-                context_parts.append(f"- {metadata.get('task', '未知任务')}: {doc[:200]}...")
+            for doc, metadata, _ in candidates:
+                line = f"- {metadata.get('task', '未知任务')}: {doc}"
+                tokens = count_tokens(line + "\n", self.token_model)
+                if tokens <= budget:
+                    context_parts.append(line)
+                    budget -= tokens
             
-            return "\n".join(context_parts)
+            return "\n".join(context_parts) if context_parts else "暂无相关历史信息。"
             
         except Exception as e:
             logger.warning(f"获取相关上下文失败: {e}")
             return "获取历史信息时出现错误。"
     
+    async def _aget_relevant_context(self, query: str, token_budget: Optional[int] = None) -> str:
+        """异步获取相关上下文（Chroma 为同步客户端，放到线程池中查询）"""
+        return await asyncio.to_thread(self._get_relevant_context, query, token_budget)
+    
+    async def _aget_task_context(self, task: Task) -> str:
+        """获取任务的相关上下文，启用预取时优先使用预取结果"""
+        if self.prefetcher is None:
+            return await self._aget_relevant_context(task.content)
+        return await self.prefetcher.get(task)
+    
+    def _schedule_prefetch(self) -> None:
+        """为队首的待执行任务启动上下文预取"""
+        if self.prefetcher is None or self.prefetcher.top_k == 0:
+            return
+        with self._task_lock:
+            upcoming = self.task_list.snapshot()[:self.prefetcher.top_k]
+        self.prefetcher.schedule(upcoming)
+    
+    async def _astore_task_result(self, task: Task) -> None:
+        """异步存储任务结果到向量数据库"""
+        await asyncio.to_thread(self._store_task_result, task)
+        if self.prefetcher is not None:
+            # 记忆已变化，预取结果作废，趁后续规划调用 LLM 时重新预取
+            self.prefetcher.invalidate()
+            self._schedule_prefetch()
+    
     def _store_task_result(self, task: Task) -> None:
-        """存储任务结果到向量数据库"""
+        """存储任务结果到向量数据库
+        
+        结果按 MEMORY_CHUNK_TOKENS 切成相互重叠的片段分别写入，第一个片段的 ID 为任务 ID，
+        其余为 "<任务 ID>#<序号>"。
+        """
         try:
+            self._touch_namespace(force=False)
+            chunks = chunk_text(task.result, config.MEMORY_CHUNK_TOKENS, config.MEMORY_CHUNK_OVERLAP, self.token_model)
+            # 启用嵌入缓存时由 Agent 计算嵌入，否则交给向量数据库计算（写缓冲在批量写入时统一计算）
+            embeddings = None
+            if self.embedding_cache is not None and not isinstance(self.vector_db, WriteBehindCollection):
+                embeddings = self.embedding_function(chunks)
+            completed_at = task.completed_at or time.time()
             self.vector_db.add(
-                documents=[task.result],
+                documents=chunks,
+                embeddings=embeddings,
                 metadatas=[{
                     "task_id": task.id,
                     "task": task.content,
                     "status": task.status,
-                    "completed_at": task.completed_at or time.time()
-                }],
-                ids=[task.id]
+                    "completed_at": completed_at,
+                    "chunk": index,
+                    "chunks": len(chunks)
+                } for index in range(len(chunks))],
+                ids=[task.id if index == 0 else f"{task.id}#{index}" for index in range(len(chunks))]
             )
         except Exception as e:
             logger.error(f"存储任务结果失败: {e}")
     
+    def flush_memory(self) -> None:
+        """把写缓冲中的任务结果立即写入向量数据库"""
+        if isinstance(self.vector_db, WriteBehindCollection):
+            self.vector_db.flush()
+    
+    def close_memory(self) -> None:
+        """写入剩余结果并停止写缓冲的后台线程（运行结束或删除 Agent 时调用，再次写入时自动重启）"""
+        if isinstance(self.vector_db, WriteBehindCollection):
+            self.vector_db.close()
+    
     def _format_task_list(self) -> str:
         """格式化任务列表为字符串"""
-        if not self.task_list:
+        with self._task_lock:
+            tasks = self.task_list.snapshot()
+        
+        if not tasks:
             return "无待执行任务"
         
         formatted = []
-        for i, task in enumerate(self.task_list, 1):
-            formatted.append(f"{i}. [{task.priority}] {task.content} (ID: {task.id})")
+        for i, task in enumerate(tasks, 1):
+            line = f"{i}. [{task.priority}] {task.content} (ID: {task.id})"
+            if task.dependencies:
+                line += f" (依赖: {', '.join(task.dependencies)})"
+            formatted.append(line)
         return "\n".join(formatted)
     
     def _format_completed_tasks(self) -> str:
         """格式化已完成任务摘要"""
-        if not self.completed_tasks:
+        with self._task_lock:
+            recent_tasks = self._recent_completed(3)  # 只显示最近3个
+        
+        if not recent_tasks:
             return "暂无已完成任务"
         
         formatted = []
-        for task in self.completed_tasks[-3:]:  # 只显示最近3个
+        for task in recent_tasks:
             result_preview = task.result[:100] + "..." if len(task.result) > 100 else task.result
             formatted.append(f"- {task.content}: {result_preview}")
         return "\n".join(formatted)
     
-    def run(self, max_iterations: int = None) -> Dict[str, Any]:
-        """运行 BabyAGI 主循环"""
-        max_iterations = max_iterations or config.MAX_ITERATIONS
+    def _recent_completed(self, limit: int) -> List[Task]:
+        """最近完成的 limit 个任务（调用方需持有 _task_lock）"""
+        start = max(0, len(self.completed_tasks) - limit)
+        return list(itertools.islice(self.completed_tasks, start, None))
+    
+    def _journal(self, event_type: str, **data: Any) -> None:
+        """写入运行日志，失败时只记录警告不影响运行"""
+        if self.journal is None:
+            return
+        try:
+            self.journal.record(event_type, **data)
+        except Exception as e:
+            logger.warning(f"写入运行日志失败: {e}")
+    
+    async def _ajournal(self, event_type: str, **data: Any) -> None:
+        """在线程池中写入运行日志：fsync 和快照（包括快照前写入向量数据库）不阻塞共享的事件循环"""
+        if self.journal is None:
+            return
+        await asyncio.to_thread(self._journal, event_type, **data)
+    
+    def _release_llm_queue(self) -> None:
+        """运行结束后让调度器清理本 Agent 的排队状态，统计累加到 llm_queue_stats"""
+        if self.llm_pool is None:
+            return
+        stats = self.llm_pool.governor.forget(self.run_id)
+        self.llm_queue_stats["calls"] += stats["calls"]
+        self.llm_queue_stats["queue_wait"] += stats["queue_wait"]
+        self.llm_queue_stats["max_queue_wait"] = max(self.llm_queue_stats["max_queue_wait"], stats["max_queue_wait"])
+    
+    def _llm_queue_summary(self) -> Optional[Dict[str, float]]:
+        if self.llm_pool is None:
+            return None
+        live = self.llm_pool.governor.agent_stats(self.run_id)
+        return {
+            "calls": self.llm_queue_stats["calls"] + live["calls"],
+            "queue_wait": self.llm_queue_stats["queue_wait"] + live["queue_wait"],
+            "max_queue_wait": max(self.llm_queue_stats["max_queue_wait"], live["max_queue_wait"])
+        }
+    
+    async def _aclose_memory(self) -> None:
+        """在线程池中关闭写缓冲（批量计算嵌入并写入向量数据库）"""
+        if isinstance(self.vector_db, WriteBehindCollection):
+            await asyncio.to_thread(self.close_memory)
+    
+    @classmethod
+    def resume(cls, run_id: str, directory: str = None):
+        """从运行日志恢复 Agent，已完成的任务不会重新调用 LLM
         
-        # 添加初始任务
-        initial_task = Task(
-            id=str(uuid.uuid4()),
-            content=self.initial_task,
-            priority=1
+        返回的 Agent 调用 run/arun 后从中断处继续执行。
+        """
+        journal = RunJournal(
+            run_id,
+            directory or config.CHECKPOINT_DIR,
+            snapshot_every=config.CHECKPOINT_SNAPSHOT_EVERY,
+            fsync=config.CHECKPOINT_FSYNC,
+            max_completed=config.COMPLETED_TASKS_IN_MEMORY,
+            max_iterations=config.RUN_HISTORY_IN_MEMORY
         )
-        self.task_list.append(initial_task)
+        state = journal.load_state()
+        if state is None or state["objective"] is None:
+            raise ValueError(f"找不到可恢复的运行记录: {run_id}")
         
-        logger.info(f"开始运行 BabyAGI，最大迭代次数: {max_iterations}")
+        agent = cls(state["objective"], state["initial_task"], run_id=run_id)
+        journal.before_snapshot = agent.flush_memory
+        agent.journal = journal
+        agent._restore_state(state)
+        return agent
+    
+    def _restore_state(self, state: Dict[str, Any]) -> None:
+        """用日志中的状态替换当前任务队列和已完成任务"""
+        completed = [Task.from_dict(data) for data in state["completed"]]
+        pending = [Task.from_dict(data) for data in state["pending"].values()]
         
-        results = {
-            "objective": self.objective,
-            "initial_task": self.initial_task,
-            "iterations": [],
-            "completed_tasks": [],
-            "status": "running"
+        with self._task_lock:
+            self.current_iteration = state["current_iteration"]
+            self.completed_tasks = deque(completed, maxlen=config.COMPLETED_TASKS_IN_MEMORY)
+            self.completed_count = state.get("completed_count", len(completed))
+            self.task_list.clear()
+            self.task_list.extend(pending)
+        # 日志中的迭代记录不含结果，从已完成任务中补回
+        results = {task.id: task.result for task in completed}
+        self._restored_iterations = [
+            dict(iteration_result, result=results.get(iteration_result.get("task", {}).get("id"), iteration_result.get("result")))
+            for iteration_result in state["iterations"]
+        ]
+        self._restored_max_iterations = state.get("max_iterations")
+        
+        if self.deduplicator is not None:
+            self.deduplicator.add(completed + pending)
+        self._restore_memory(completed)
+        
+        logger.info(f"已恢复运行 {self.run_id}：已完成 {len(completed)} 个任务，待执行 {len(pending)} 个任务")
+    
+    def _restore_memory(self, completed: List[Task]) -> None:
+        """补写中断前还在写缓冲中、未进入向量数据库的任务结果"""
+        stored_tasks = [task for task in completed if task.result]
+        if not stored_tasks:
+            return
+        try:
+            existing = set(self.vector_db.get(ids=[task.id for task in stored_tasks])["ids"])
+            missing = [task for task in stored_tasks if task.id not in existing]
+            for task in missing:
+                self._store_task_result(task)
+            self.flush_memory()
+            if missing:
+                logger.info(f"已补写 {len(missing)} 条中断前未写入向量数据库的任务结果")
+        except Exception as e:
+            logger.warning(f"检查向量数据库中的任务结果失败: {e}")
+    
+    async def _aprocess_task(self, task: Task, iteration: int) -> Dict[str, Any]:
+        """执行任务并基于结果生成、排序新任务，返回本次迭代记录"""
+        iteration_result = await self._aexecute_step(task, iteration)
+        if task.status == "completed":
+            await self._aplan_step(task, iteration_result)
+        return iteration_result
+    
+    async def _aexecute_step(self, task: Task, iteration: int) -> Dict[str, Any]:
+        """执行任务并移入已完成列表"""
+        current_iteration.set(iteration)
+        iteration_result = {
+            "iteration": iteration,
+            "task": task.summary(),
+            "timestamp": time.time()
         }
         
+        # 执行任务
+        task_result = await self.aexecute_task(task)
+        iteration_result["result"] = task_result
+        
+        # 移动到已完成列表
+        with self._task_lock:
+            self.completed_tasks.append(task)
+            self.completed_count += 1
+            iteration_result["remaining_tasks"] = len(self.task_list)
+        # 结果已在 task 中，日志里的迭代记录不再重复保存
+        await self._ajournal(
+            "task_completed",
+            task=task.to_dict(),
+            iteration_result={key: value for key, value in iteration_result.items() if key != "result"}
+        )
+        return iteration_result
+    
+    async def _aplan_step(self, task: Task, iteration_result: Dict[str, Any]) -> None:
+        """基于已完成任务创建新任务并重新排序"""
+        current_iteration.set(iteration_result.get("iteration"))
+        plan = None
+        if self.planning_mode == "fused":
+            plan = await self.aplan_tasks(task)
+            if plan is None:
+                self.planning_stats["fused_fallback"] += 1
+        
+        if plan is not None:
+            new_tasks, priority_map = plan
+            new_tasks = await self._adeduplicate(new_tasks)
+            with self._task_lock:
+                self.task_list.extend(new_tasks)
+                self.task_list.reprioritize(priority_map)
+            self._mark_llm_prioritized()
+            self.planning_stats["fused"] += 1
+            iteration_result["new_tasks"] = [new_task.to_dict() for new_task in new_tasks]
+        else:
+            # 创建新任务
+            new_tasks = await self._adeduplicate(await self.acreate_new_tasks(task))
+            with self._task_lock:
+                self.task_list.extend(new_tasks)
+            iteration_result["new_tasks"] = [new_task.to_dict() for new_task in new_tasks]
+            
+            # 排序调用 LLM 期间先为当前队首任务预取上下文
+            self._schedule_prefetch()
+            
+            # 重新排序任务
+            await self.aprioritize_tasks()
+            self.planning_stats["separate"] += 1
+        
+        with self._task_lock:
+            iteration_result["remaining_tasks"] = len(self.task_list)
+            priorities = {pending.id: pending.priority for pending in self.task_list.snapshot()}
+        await self._ajournal(
+            "planned",
+            iteration=iteration_result.get("iteration"),
+            new_tasks=iteration_result["new_tasks"],
+            priorities=priorities
+        )
+        self._schedule_prefetch()
+    
+    async def _arecord_iteration(self, task: Task, iteration_result: Dict[str, Any]) -> bool:
+        """记录迭代结果并更新收敛检测，返回运行是否已收敛"""
+        if task.status == "completed":
+            with self._task_lock:
+                queue_size = len(self.task_list)
+            sample = await asyncio.to_thread(self.progress.observe, task.result or "", queue_size)
+            iteration_result["novelty"] = sample["novelty"]
+        self.history.append(iteration_result)
+        return self.progress.converged
+    
+    def _mark_converged(self, results: Dict[str, Any]) -> None:
+        logger.info(f"连续 {self.progress.stale_streak} 次迭代结果缺乏新内容，判定已收敛，提前停止")
+        results["status"] = "converged"
+    
+    def _take_ready_tasks(self, limit: int, running_ids: set) -> List[Task]:
+        """按优先级顺序取出依赖已满足的就绪任务"""
+        with self._task_lock:
+            ready = []
+            for task in self.task_list.snapshot():
+                if len(ready) >= limit:
+                    break
+                if not any(dep in self.task_list or dep in running_ids for dep in task.dependencies):
+                    ready.append(task)
+            
+            for task in ready:
+                self.task_list.remove(task.id)
+            return ready
+    
+    async def _arun_serial(self, max_iterations: int, results: Dict[str, Any], start_iteration: int = 0) -> None:
+        """串行调度：每次执行优先级最高的任务"""
+        for iteration in range(start_iteration, max_iterations):
+            self.current_iteration = iteration + 1
+            logger.info(f"开始第 {self.current_iteration} 次迭代")
+            
+            if not self.task_list:
+                logger.info("任务列表为空，停止执行")
+                results["status"] = "completed_no_tasks"
+                break
+            
+            # 执行优先级最高的任务
+            with self._task_lock:
+                current_task = self.task_list.pop()
+            iteration_result = await self._aprocess_task(current_task, self.current_iteration)
+            converged = await self._arecord_iteration(current_task, iteration_result)
+            
+            logger.info(f"第 {self.current_iteration} 次迭代完成，剩余任务: {len(self.task_list)}")
+            if converged:
+                self._mark_converged(results)
+                break
+    
+    async def _arun_pipelined(self, max_iterations: int, results: Dict[str, Any], start_iteration: int = 0) -> None:
+        """流水线调度：上一任务的生成/排序在后台进行时，立即执行当前优先级最高的任务"""
+        planning: Optional[asyncio.Task] = None
+        
         try:
-            for iteration in range(max_iterations):
+            for iteration in range(start_iteration, max_iterations):
                 self.current_iteration = iteration + 1
                 logger.info(f"开始第 {self.current_iteration} 次迭代")
                 
+                if not self.task_list and planning is not None:
+                    # 队列已空，只能等待后台规划产出新任务
+                    await planning
+                    planning = None
+                
                 if not self.task_list:
                     logger.info("任务列表为空，停止执行")
                     results["status"] = "completed_no_tasks"
                     break
                 
-                # 执行优先级最高的任务
-                current_task = self.task_list.pop(0)
-                
-                iteration_result = {
-                    "iteration": self.current_iteration,
-                    "task": current_task.to_dict(),
-                    "timestamp": time.time()
-                }
-                
-                # 执行任务
-                task_result = self.execute_task(current_task)
-                iteration_result["result"] = task_result
+                # 执行当前优先级最高的任务，与上一轮的规划并行
+                with self._task_lock:
+                    current_task = self.task_list.pop()
+                iteration_result = await self._aexecute_step(current_task, self.current_iteration)
+                converged = await self._arecord_iteration(current_task, iteration_result)
+                if converged:
+                    # 已收敛，不再为本轮结果规划新任务
+                    self._mark_converged(results)
+                    break
                 
-                # 移动到已完成列表
-                self.completed_tasks.append(current_task)
+                # 同一时间只保留一个后台规划，新规划需要看到上一轮合并后的队列
+                if planning is not None:
+                    await planning
+                    planning = None
                 
-                # 创建新任务
                 if current_task.status == "completed":
-                    new_tasks = self.create_new_tasks(current_task)
-                    self.task_list.extend(new_tasks)
-                    iteration_result["new_tasks"] = [task.to_dict() for task in new_tasks]
+                    planning = asyncio.create_task(self._aplan_step(current_task, iteration_result))
+                    # 让后台规划先发出请求，再开始下一任务的执行
+                    await asyncio.sleep(0)
+                
+                logger.info(f"第 {self.current_iteration} 次迭代完成，剩余任务: {len(self.task_list)}")
+            
+            if planning is not None:
+                await planning
+                planning = None
+        finally:
+            if planning is not None:
+                planning.cancel()
+    
+    async def _arun_dag(self, max_iterations: int, results: Dict[str, Any], start_iteration: int = 0) -> None:
+        """DAG 调度：以最多 max_workers 个并发协程执行依赖已满足的就绪任务"""
+        dispatched = start_iteration
+        running: Dict[asyncio.Task, Task] = {}
+        converged = False
+        
+        try:
+            while True:
+                capacity = min(self.max_workers - len(running), max_iterations - dispatched)
+                if capacity > 0 and not converged:
+                    running_ids = {task.id for task in running.values()}
+                    ready = self._take_ready_tasks(capacity, running_ids)
                     
-                    # 重新排序任务
-                    self.prioritize_tasks()
+                    if not ready and not running and self.task_list:
+                        # 依赖无法满足（循环依赖或依赖丢失），释放优先级最高的任务避免死锁
+                        with self._task_lock:
+                            blocked = self.task_list.peek()
+                            logger.warning(f"任务依赖无法满足，忽略其依赖继续执行: {blocked.id}")
+                            blocked.dependencies = []
+                        continue
+                    
+                    for task in ready:
+                        dispatched += 1
+                        self.current_iteration = dispatched
+                        logger.info(f"开始第 {dispatched} 次迭代（并发任务数: {len(running) + 1}）")
+                        running[asyncio.create_task(self._aprocess_task(task, dispatched))] = task
                 
-                iteration_result["remaining_tasks"] = len(self.task_list)
-                results["iterations"].append(iteration_result)
+                if not running:
+                    if converged:
+                        self._mark_converged(results)
+                    elif not self.task_list:
+                        logger.info("任务列表为空，停止执行")
+                        results["status"] = "completed_no_tasks"
+                    break
                 
-                logger.info(f"第 {self.current_iteration} 次迭代完成，剩余任务: {len(self.task_list)}")
+                done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    task = running.pop(future)
+                    iteration_result = future.result()
+                    # 收敛后不再派发新任务，等待已在执行的任务完成
+                    converged = await self._arecord_iteration(task, iteration_result) or converged
+                    logger.info(f"第 {iteration_result['iteration']} 次迭代完成（任务 {task.id}），剩余任务: {len(self.task_list)}")
+        finally:
+            # 被取消或出错时不遗留后台协程
+            for future in running:
+                future.cancel()
+
+    
+    async def arun(self, max_iterations: int = None) -> Dict[str, Any]:
+        """运行 BabyAGI 主循环"""
+        restored_iterations, self._restored_iterations = self._restored_iterations, None
+        resumed = restored_iterations is not None
+        max_iterations = max_iterations or (resumed and self._restored_max_iterations) or config.MAX_ITERATIONS
+        
+        if resumed:
+            # 从日志恢复：沿用已恢复的任务队列和迭代计数
+            start_iteration = self.current_iteration
+            await self._ajournal("run_resumed", max_iterations=max_iterations)
+        else:
+            # 添加初始任务
+            start_iteration = 0
+            initial_task = Task(
+                id=str(uuid.uuid4()),
+                content=self.initial_task,
+                priority=1
+            )
+            with self._task_lock:
+                self.task_list.push(initial_task)
+            if self.deduplicator is not None:
+                await asyncio.to_thread(self.deduplicator.add, [initial_task])
+            await self._ajournal(
+                "run_started",
+                objective=self.objective,
+                initial_task=self.initial_task,
+                max_iterations=max_iterations
+            )
+            await self._ajournal("tasks_added", tasks=[initial_task.to_dict()])
+        
+        logger.info(f"开始运行 BabyAGI，最大迭代次数: {max_iterations}，调度模式: {self.scheduler_mode}")
+        
+        self.history.clear()
+        self.progress.reset()
+        if self.prefetcher is not None:
+            self.prefetcher.clear()
+        for iteration_result in restored_iterations or []:
+            self.history.append(iteration_result)
+        
+        results = {
+            "objective": self.objective,
+            "initial_task": self.initial_task,
+            "scheduler_mode": self.scheduler_mode,
+            "run_id": self.run_id,
+            "iterations": [],
+            "completed_tasks": [],
+            "status": "running"
+        }
+        
+        try:
+            if self.scheduler_mode == "dag":
+                await self._arun_dag(max_iterations, results, start_iteration)
+            elif self.scheduler_mode == "pipelined":
+                await self._arun_pipelined(max_iterations, results, start_iteration)
+            else:
+                await self._arun_serial(max_iterations, results, start_iteration)
             
-            results["completed_tasks"] = [task.to_dict() for task in self.completed_tasks]
-            results["status"] = "completed" if self.current_iteration < max_iterations else "max_iterations_reached"
+            self._collect_results(results)
+            results["duplicates_rejected"] = self.deduplicator.rejected if self.deduplicator else 0
+            results["token_usage"] = self.token_usage
+            results["llm_calls"] = self.ledger.totals()
+            results["progress"] = self.progress.summary()
+            if results["status"] != "converged":
+                results["status"] = "completed" if self.current_iteration < max_iterations else "max_iterations_reached"
             
+            await self._aclose_memory()
+            self._release_llm_queue()
+            await asyncio.to_thread(self._touch_namespace)
+            await self._ajournal("run_finished", status=results["status"])
             logger.info(f"BabyAGI 运行完成，状态: {results['status']}")
             return results
             
+        except asyncio.CancelledError:
+            await self._aclose_memory()
+            self._release_llm_queue()
+            await self._ajournal("run_finished", status="stopped")
+            raise
         except Exception as e:
             logger.error(f"BabyAGI 运行出错: {e}")
             results["status"] = "error"
             results["error"] = str(e)
+            self._collect_results(results)
+            await self._aclose_memory()
+            self._release_llm_queue()
+            await self._ajournal("run_finished", status="error")
             return results
     
+    def _collect_results(self, results: Dict[str, Any]) -> None:
+        """写入内存中保留的最近迭代和已完成任务，完整的迭代记录通过 get_iterations 分页读取"""
+        with self._task_lock:
+            results["completed_tasks"] = [task.to_dict() for task in self.completed_tasks]
+            results["completed_count"] = self.completed_count
+        results["iterations"] = sorted(self.history.recent(), key=lambda item: item["iteration"])
+        results["iteration_count"] = len(self.history)
+    
+    def get_iterations(self, offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+        """分页读取迭代记录（按完成顺序），包括已写入磁盘的早期记录"""
+        return {
+            "total": len(self.history),
+            "offset": offset,
+            "limit": limit,
+            "iterations": self.history.page(offset, limit)
+        }
+    
     def get_status(self) -> Dict[str, Any]:
         """获取当前状态"""
-        return {
-            "objective": self.objective,
-            "current_iteration": self.current_iteration,
-            "pending_tasks": len(self.task_list),
-            "completed_tasks": len(self.completed_tasks),
-            "task_list": [task.to_dict() for task in self.task_list],
-            "recent_completed": [task.to_dict() for task in self.completed_tasks[-3:]]
-        }
\ No newline at end of file
+        with self._task_lock:
+            return {
+                "run_id": self.run_id,
+                "objective": self.objective,
+                "scheduler_mode": self.scheduler_mode,
+                "current_iteration": self.current_iteration,
+                "pending_tasks": len(self.task_list),
+                "prioritization": dict(self.prioritization_stats),
+                "planning": dict(self.planning_stats),
+                "deduplication": dict(self.deduplicator.stats) if self.deduplicator else None,
+                "context_prefetch": dict(self.prefetcher.stats) if self.prefetcher else None,
+                "embedding_cache": self.embedding_cache.summary() if self.embedding_cache else None,
+                "memory_namespace": self.memory_namespace,
+                "vector_writes": dict(self.vector_db.stats) if isinstance(self.vector_db, WriteBehindCollection) else None,
+                "progress": self.progress.summary(),
+                "token_usage": self.token_usage,
+                "llm_calls": {"totals": self.ledger.totals(), "recent": self.ledger.recent(10)},
+                "llm_cache": dict(self.llm_cache_stats),
+                "llm_trace": dict(self.llm_trace.stats, mode=self.llm_trace.mode) if self.llm_trace is not None else None,
+                "llm_endpoints": self.llm_pool.status() if self.llm_pool is not None else [],
+                "llm_queue": self._llm_queue_summary(),
+                "completed_tasks": self.completed_count,
+                "history": self.history.stats(),
+                "task_list": [task.to_dict() for task in self.task_list.snapshot()],
+                "in_progress": [
+                    {"id": entry["id"], "content": entry["content"], "partial_result": "".join(entry["chunks"])}
+                    for entry in self._in_progress.values()
+                ],
+                "recent_completed": [task.to_dict() for task in self._recent_completed(3)]
+            }
+
+
+class CustomBabyAGI(AsyncCustomBabyAGI):
+    """自定义 BabyAGI 实现
+    
+    同步接口，内部在实例私有的事件循环上驱动 AsyncCustomBabyAGI 的协程。
+    私有事件循环在第一次调用同步接口时才创建，只在共享事件循环上运行 a 前缀方法的 Agent 不会占用它。
+    在已运行的事件循环中请直接使用 a 前缀的异步方法。
+    """
+    
+    def __init__(self, objective: str, initial_task: str = None, run_id: str = None):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_lock = threading.Lock()
+        super().__init__(objective, initial_task, run_id)
+    
+    def _run_sync(self, coro: Awaitable[Any]) -> Any:
+        """在私有事件循环上同步执行协程"""
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+            return self._loop.run_until_complete(coro)
+    
+    def llm(self, prompt: str, max_tokens: int = 1000, phase: str = "direct") -> str:
+        """同步调用 LLM（与异步调用一样按 phase 记入账本）"""
+        return self._run_sync(self._allm_call(phase, prompt, max_tokens=max_tokens))
+    
+    def stream_llm(self, prompt: str, max_tokens: int = 1000) -> Iterator[str]:
+        """同步流式调用 LLM，逐块返回生成的文本"""
+        stream = self.astream_llm(prompt, max_tokens)
+        try:
+            while True:
+                try:
+                    yield self._run_sync(stream.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run_sync(stream.aclose())
+    
+    def execute_task(self, task: Task, on_chunk: Optional[Callable[[str], Any]] = None) -> str:
+        """执行单个任务"""
+        return self._run_sync(self.aexecute_task(task, on_chunk))
+    
+    def create_new_tasks(self, completed_task: Task) -> List[Task]:
+        """基于已完成任务创建新任务"""
+        return self._run_sync(self.acreate_new_tasks(completed_task))
+    
+    def prioritize_tasks(self) -> None:
+        """重新排序任务优先级"""
+        return self._run_sync(self.aprioritize_tasks())
+    
+    def run(self, max_iterations: int = None) -> Dict[str, Any]:
+        """运行 BabyAGI 主循环"""
+        return self._run_sync(self.arun(max_iterations))
+    
+    def close(self) -> None:
+        """关闭私有事件循环及其上的 LLM 连接（之后再调用同步接口时重新创建）"""
+        with self._loop_lock:
+            loop, self._loop = self._loop, None
+            if loop is None:
+                return
+            if self.llm_pool is not None:
+                loop.run_until_complete(self.llm_pool.aclose())
+            loop.close()
@@ -0,0 +1,145 @@
+import hashlib
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from logger import get_logger
+
+logger = get_logger("dedup")
+
+# 归一化时去掉的字符：空白、标点和下划线
+_NON_WORD = re.compile(r"[\W_]+", re.UNICODE)
+
+class TaskDeduplicator:
+    """入队前的任务去重索引
+    
+    两级检查：归一化文本哈希用于识别完全重复的任务，
+    嵌入余弦相似度用于识别措辞不同但语义相同的任务。
+    索引只保留最近登记的 max_entries 个任务（包括之后完成的），
+    哈希按登记顺序淘汰，嵌入矩阵写满后按环形覆盖最早的行，内存不随运行长度增长。
+    """
+    
+    def __init__(
+        self,
+        embedding_function: Optional[Callable[[List[str]], Any]] = None,
+        similarity_threshold: float = 0.92,
+        max_entries: int = 1000
+    ):
+        self.embedding_function = embedding_function
+        self.similarity_threshold = similarity_threshold
+        self.max_entries = max(1, max_entries)
+        self._hashes: "OrderedDict[str, str]" = OrderedDict()
+        # 嵌入矩阵按容量倍增预分配（最多 max_entries 行），前 len(_vector_ids) 行有效；写满后覆盖第 _next 行
+        self._vector_ids: List[str] = []
+        self._vectors: Optional[np.ndarray] = None
+        self._next = 0
+        self.stats = {"exact": 0, "semantic": 0}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """归一化任务文本：统一全半角和大小写，去掉空白和标点"""
+        text = unicodedata.normalize("NFKC", text).casefold()
+        return _NON_WORD.sub("", text)
+    
+    @classmethod
+    def content_hash(cls, text: str) -> str:
+        """归一化文本的哈希，用于精确去重"""
+        return hashlib.blake2b(cls.normalize(text).encode("utf-8"), digest_size=16).hexdigest()
+    
+    @property
+    def rejected(self) -> int:
+        """累计拒绝的重复任务数"""
+        return self.stats["exact"] + self.stats["semantic"]
+    
+    def _embed(self, texts: Sequence[str]) -> Optional[np.ndarray]:
+        if self.embedding_function is None or not texts:
+            return None
+        try:
+            vectors = np.asarray(self.embedding_function(list(texts)), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f"计算任务嵌入失败，仅进行精确去重: {e}")
+            return None
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+    
+    def _add_vector(self, task_id: str, vector: np.ndarray) -> None:
+        size = len(self._vector_ids)
+        if self._vectors is None:
+            self._vectors = np.empty((min(16, self.max_entries), vector.shape[0]), dtype=np.float32)
+        elif size == self.max_entries:
+            self._vectors[self._next] = vector
+            self._vector_ids[self._next] = task_id
+            self._next = (self._next + 1) % self.max_entries
+            return
+        elif size == len(self._vectors):
+            grown = np.empty((min(size * 2, self.max_entries), self._vectors.shape[1]), dtype=np.float32)
+            grown[:size] = self._vectors
+            self._vectors = grown
+        self._vectors[size] = vector
+        self._vector_ids.append(task_id)
+    
+    def _most_similar(self, vector: np.ndarray) -> Tuple[Optional[str], float]:
+        size = len(self._vector_ids)
+        if size == 0 or vector.shape[0] != self._vectors.shape[1]:
+            return None, 0.0
+        similarities = self._vectors[:size] @ vector
+        best = int(np.argmax(similarities))
+        return self._vector_ids[best], float(similarities[best])
+    
+    def add(self, tasks: Sequence[Any]) -> None:
+        """将任务登记到索引中（不做重复检查）"""
+        self.filter(tasks, check=False)
+    
+    def filter(self, tasks: Sequence[Any], check: bool = True) -> Tuple[List[Any], Dict[str, str]]:
+        """过滤重复任务
+        
+        返回 (保留的任务, 被拒绝任务 ID -> 与之重复的已有任务 ID)。
+        同一批次内的任务也会相互去重。
+        """
+        vectors = self._embed([task.content for task in tasks])
+        
+        with self._lock:
+            return self._filter_locked(tasks, vectors, check)
+    
+    def _filter_locked(
+        self,
+        tasks: Sequence[Any],
+        vectors: Optional[np.ndarray],
+        check: bool
+    ) -> Tuple[List[Any], Dict[str, str]]:
+        accepted: List[Any] = []
+        duplicates: Dict[str, str] = {}
+        for index, task in enumerate(tasks):
+            digest = self.content_hash(task.content)
+            vector = vectors[index] if vectors is not None else None
+            
+            if check:
+                match = self._hashes.get(digest)
+                if match is not None:
+                    self.stats["exact"] += 1
+                    duplicates[task.id] = match
+                    logger.info(f"拒绝重复任务: {task.content}")
+                    continue
+                
+                if vector is not None:
+                    match, similarity = self._most_similar(vector)
+                    if match is not None and similarity >= self.similarity_threshold:
+                        self.stats["semantic"] += 1
+                        duplicates[task.id] = match
+                        logger.info(f"拒绝语义重复任务（相似度 {similarity:.3f}）: {task.content}")
+                        continue
+            
+            if digest not in self._hashes:
+                self._hashes[digest] = task.id
+                if len(self._hashes) > self.max_entries:
+                    self._hashes.popitem(last=False)
+            if vector is not None:
+                self._add_vector(task.id, vector)
+            accepted.append(task)
+        
+        return accepted, duplicates
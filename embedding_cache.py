@@ -0,0 +1,173 @@
+import hashlib
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from config import config
+from llm_cache import MemoryCacheTier
+from logger import get_logger
+
+logger = get_logger("embedding_cache")
+
+class EmbeddingStore:
+    """持久化的嵌入向量存储（SQLite，向量以 float32 字节保存），超出总大小后按写入时间淘汰"""
+    
+    def __init__(self, path: str, max_bytes: int = 200 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS embedding_cache (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_created ON embedding_cache (created_at)")
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache").fetchone()[0]
+    
+    def get_many(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        """批量读取，返回已存在的 key -> 向量"""
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            # SQLite 默认最多 999 个绑定参数
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embedding_cache WHERE key IN ({', '.join('?' * len(chunk))})",
+                    chunk
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+    
+    def set_many(self, items: Dict[str, np.ndarray]) -> None:
+        """批量写入"""
+        now = time.time()
+        rows = [(key, vector.astype(np.float32).tobytes(), now) for key, vector in items.items()]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embedding_cache (key, vector, created_at) VALUES (?, ?, ?)", rows)
+            self._total_bytes += sum(len(row[1]) for row in rows)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+    
+    def _evict(self) -> None:
+        """删除最早写入的向量，直到总大小降到上限的 90%"""
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(LENGTH(vector)), 0) FROM embedding_cache").fetchone()[0]
+        evicted = 0
+        rows = self._conn.execute("SELECT key, LENGTH(vector) FROM embedding_cache ORDER BY created_at").fetchall()
+        for key, size in rows:
+            if self._total_bytes <= self.max_bytes * 0.9:
+                break
+            self._conn.execute("DELETE FROM embedding_cache WHERE key = ?", (key,))
+            self._total_bytes -= size
+            evicted += 1
+        logger.debug(f"嵌入缓存淘汰 {evicted} 条记录，当前大小 {self._total_bytes} 字节")
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+    
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class EmbeddingCache:
+    """内容寻址的嵌入缓存
+    
+    按 (模型, 文本) 的哈希先查进程内 LRU，再查磁盘存储，磁盘命中后回填内存；
+    进程内所有 Agent 共享，重启后仍可复用已计算的嵌入。
+    """
+    
+    def __init__(self, memory: MemoryCacheTier, store: Optional[EmbeddingStore] = None):
+        self.memory = memory
+        self.store = store
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        return hashlib.blake2b(f"{model}\0{text}".encode("utf-8"), digest_size=20).hexdigest()
+    
+    def embed(self, model: str, texts: List[str], compute: Callable[[List[str]], Any]) -> List[np.ndarray]:
+        """返回 texts 的嵌入，只对未缓存的（去重后的）文本调用 compute"""
+        keys = [self.make_key(model, text) for text in texts]
+        vectors: Dict[str, np.ndarray] = {}
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                vectors[key] = vector
+        memory_hits = len(vectors)
+        
+        missing = list(dict.fromkeys(key for key in keys if key not in vectors))
+        disk_hits = 0
+        if missing and self.store is not None:
+            stored = self.store.get_many(missing)
+            for key, vector in stored.items():
+                vectors[key] = vector
+                self.memory.set(key, vector)
+            disk_hits = len(stored)
+            missing = [key for key in missing if key not in stored]
+        
+        if missing:
+            wanted = set(missing)
+            pending = {key: text for key, text in zip(keys, texts) if key in wanted}
+            computed = compute(list(pending.values()))
+            fresh = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(pending, computed)}
+            for key, vector in fresh.items():
+                vectors[key] = vector
+                self.memory.set(key, vector)
+            if self.store is not None:
+                self.store.set_many(fresh)
+        
+        with self._lock:
+            self.stats["memory_hits"] += memory_hits
+            self.stats["disk_hits"] += disk_hits
+            self.stats["misses"] += len(missing)
+        return [vectors[key] for key in keys]
+    
+    def summary(self) -> Dict[str, Any]:
+        """命中统计（按去重后的文本计算磁盘命中和未命中）"""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = sum(stats.values())
+        stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 4) if lookups else 0.0
+        return stats
+
+class CachedEmbeddingFunction:
+    """带缓存的嵌入函数，与被包装的嵌入函数调用方式相同
+    
+    Agent 写入和检索向量数据库时用它计算嵌入后直接传给 Chroma，本地优先级排序、去重和收敛检测也使用同一个实例。
+    """
+    
+    def __init__(self, base: Callable[[List[str]], Any], model: str, cache: "EmbeddingCache"):
+        self.base = base
+        self.model = model
+        self.cache = cache
+    
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return [vector.tolist() for vector in self.cache.embed(self.model, list(input), self.base)]
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    """获取进程内共享的嵌入缓存（按配置创建内存和磁盘存储）"""
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            store = None
+            if config.EMBEDDING_CACHE_PATH:
+                store = EmbeddingStore(config.EMBEDDING_CACHE_PATH, max_bytes=config.EMBEDDING_CACHE_MAX_MB * 1024 * 1024)
+            _embedding_cache = EmbeddingCache(MemoryCacheTier(config.EMBEDDING_CACHE_MEMORY_ENTRIES), store)
+            logger.info(f"嵌入缓存已启用，磁盘存储: {config.EMBEDDING_CACHE_PATH or '无'}")
+        return _embedding_cache
@@ -1,39 +1,40 @@
 import json
-import re
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Callable
 
-from custom_babyagi import CustomBabyAGI, Task
+from custom_babyagi import AsyncCustomBabyAGI, CustomBabyAGI, Task
+from prompt_builder import PromptSection
 from tools import tool_registry
 from logger import get_logger
 
 logger = get_logger("enhanced_babyagi")
 
-class EnhancedBabyAGI(CustomBabyAGI):
-    """增强版 BabyAGI，集成工具系统"""
+class AsyncEnhancedBabyAGI(AsyncCustomBabyAGI):
+    """增强版 BabyAGI 异步引擎，集成工具系统"""
     
-    def __init__(self, objective: str, initial_task: str = None):
-        super().__init__(objective, initial_task)
+    def __init__(self, objective: str, initial_task: str = None, run_id: str = None):
+        super().__init__(objective, initial_task, run_id)
         self.tool_registry = tool_registry
         logger.info("增强版 BabyAGI 初始化完成，已集成工具系统")
     
-    def execute_task(self, task: Task) -> str:
-        """增强的任务执行方法，支持工具调用"""
+    async def aexecute_task(self, task: Task, on_chunk: Optional[Callable[[str], Any]] = None) -> str:
+        """增强的任务执行方法，支持工具调用，on_chunk 会依次收到流式生成的结果片段"""
         logger.info(f"开始执行增强任务: {task.content}")
         task.status = "in_progress"
         
         try:
-            # 获取相关上下文
-            context = self._get_relevant_context(task.content)
+            # 获取相关上下文（优先使用预取结果），并为接下来的任务启动预取
+            context = await self._aget_task_context(task)
+            self._schedule_prefetch()
             
             # 分析任务是否需要工具
-            tool_decision = self._analyze_tool_requirement(task, context)
+            tool_decision = await self._aanalyze_tool_requirement(task, context)
             
             if tool_decision["use_tool"]:
                 # 使用工具执行任务
-                result = self._execute_task_with_tools(task, tool_decision, context)
+                result = await self._aexecute_task_with_tools(task, tool_decision, context, on_chunk)
             else:
                 # 使用 LLM 直接处理任务
-                result = self._execute_task_with_llm(task, context)
+                result = await self._aexecute_task_with_llm(task, context, on_chunk=on_chunk)
             
             # 更新任务状态
             task.result = result
@@ -41,7 +42,7 @@ class EnhancedBabyAGI(CustomBabyAGI):
             task.completed_at = time.time()
             
             # 存储到向量数据库
-            self._store_task_result(task)
+            await self._astore_task_result(task)
             
             logger.info(f"增强任务执行完成: {task.id}")
             return result
@@ -52,7 +53,7 @@ class EnhancedBabyAGI(CustomBabyAGI):
             task.result = f"执行失败: {str(e)}"
             return task.result
     
-    def _analyze_tool_requirement(self, task: Task, context: str) -> Dict[str, Any]:
+    async def _aanalyze_tool_requirement(self, task: Task, context: str) -> Dict[str, Any]:
         """分析任务是否需要使用工具"""
         available_tools = self.tool_registry.list_tools()
         tools_description = "\n".join([
@@ -60,12 +61,12 @@ class EnhancedBabyAGI(CustomBabyAGI):
             for tool in available_tools
         ])
         
-        prompt = f"""
+        prompt = self._render_prompt("tool_decision", """
 你是一个任务分析专家。请分析以下任务是否需要使用工具来执行，如果需要，请指定使用哪个工具和相应参数。
 
-总体目标: {self.objective}
+总体目标: {objective}
 
-当前任务: {task.content}
+当前任务: {task}
 
 相关上下文:
 {context}
@@ -89,32 +90,39 @@ class EnhancedBabyAGI(CustomBabyAGI):
 4. 参数应该具体明确，避免模糊描述
 
 决策结果:
-"""
+""",
+            objective=self.objective,
+            task=task.content,
+            context=PromptSection(context, priority=2),
+            tools_description=PromptSection(tools_description, priority=1)
+        )
         
         try:
-            response = self.llm(prompt, max_tokens=800)
-            
-            # 尝试提取 JSON
-            json_match = re.search(r'\{[^{}]*(?:\{[^{}]*\}[^{}]*)*\}', response)
-            if json_match:
-                decision_json = json_match.group()
-                decision = json.loads(decision_json)
-                
-                # 验证决策格式
-                if "use_tool" not in decision:
-                    decision["use_tool"] = False
-                
-                logger.info(f"工具决策: {decision['reasoning']}")
-                return decision
-            else:
+            decision, _ = await self._astream_json(
+                "tool_decision", prompt, max_tokens=800, kind="object", validator=self._is_tool_decision
+            )
+            if decision is None:
                 logger.warning("无法解析工具决策 JSON，默认不使用工具")
                 return {"use_tool": False, "reasoning": "JSON 解析失败"}
-                
+            
+            logger.info(f"工具决策: {decision.get('reasoning', '')}")
+            return decision
+            
         except Exception as e:
             logger.error(f"工具需求分析失败: {e}")
             return {"use_tool": False, "reasoning": f"分析失败: {str(e)}"}
     
-    def _execute_task_with_tools(self, task: Task, tool_decision: Dict[str, Any], context: str) -> str:
+    @staticmethod
+    def _is_tool_decision(value: Any) -> bool:
+        return isinstance(value, dict) and "use_tool" in value
+    
+    async def _aexecute_task_with_tools(
+        self,
+        task: Task,
+        tool_decision: Dict[str, Any],
+        context: str,
+        on_chunk: Optional[Callable[[str], Any]] = None
+    ) -> str:
         """使用工具执行任务"""
         tool_name = tool_decision.get("tool_name")
         tool_params = tool_decision.get("tool_params", {})
@@ -122,26 +130,26 @@ class EnhancedBabyAGI(CustomBabyAGI):
         logger.info(f"使用工具 {tool_name} 执行任务")
         
         # 执行工具
-        tool_result = self.tool_registry.execute_tool(tool_name, **tool_params)
+        tool_result = await self.tool_registry.aexecute_tool(tool_name, **tool_params)
         
         # 如果工具执行失败，尝试回退到 LLM
         if not tool_result.get("success", False):
             logger.warning(f"工具执行失败: {tool_result.get('error')}")
             if tool_decision.get("fallback_to_llm", True):
                 logger.info("回退到 LLM 执行")
-                return self._execute_task_with_llm(task, context, tool_error=tool_result.get('error'))
+                return await self._aexecute_task_with_llm(task, context, tool_error=tool_result.get('error'), on_chunk=on_chunk)
             else:
                 return f"工具执行失败: {tool_result.get('error')}"
         
         # 使用 LLM 解释和总结工具结果
-        interpretation_prompt = f"""
+        interpretation_prompt = self._render_prompt("interpret", """
 你刚刚使用工具 {tool_name} 执行了以下任务：
 
-任务: {task.content}
-总体目标: {self.objective}
+任务: {task}
+总体目标: {objective}
 
 工具执行结果:
-{json.dumps(tool_result, ensure_ascii=False, indent=2)}
+{tool_result}
 
 请基于工具执行结果，提供一个清晰、有用的任务完成报告，包括：
 1. 任务执行摘要
@@ -150,10 +158,17 @@ class EnhancedBabyAGI(CustomBabyAGI):
 4. 后续建议（如果有）
 
 任务完成报告:
-"""
+""",
+            tool_name=tool_name,
+            task=task.content,
+            objective=self.objective,
+            tool_result=PromptSection(json.dumps(tool_result, ensure_ascii=False, indent=2))
+        )
         
         try:
-            interpretation = self.llm(interpretation_prompt, max_tokens=1000)
+            interpretation = await self._astream_call(
+                "interpret", interpretation_prompt, max_tokens=1000, task=task, on_chunk=on_chunk
+            )
             
             # 组合最终结果
             final_result = f"""
@@ -178,16 +193,22 @@ class EnhancedBabyAGI(CustomBabyAGI):
 【注意】: 结果解释失败，显示原始数据
 """
     
-    def _execute_task_with_llm(self, task: Task, context: str, tool_error: str = None) -> str:
+    async def _aexecute_task_with_llm(
+        self,
+        task: Task,
+        context: str,
+        tool_error: str = None,
+        on_chunk: Optional[Callable[[str], Any]] = None
+    ) -> str:
         """使用 LLM 直接执行任务"""
         error_context = f"\n\n注意：工具执行失败 - {tool_error}" if tool_error else ""
         
-        prompt = f"""
+        prompt = self._render_prompt("execute", """
 你是一个高效的任务执行助手。请根据以下信息执行任务：
 
-目标: {self.objective}
+目标: {objective}
 
-当前任务: {task.content}
+当前任务: {task}
 
 相关上下文:
 {context}{error_context}
@@ -200,36 +221,36 @@ class EnhancedBabyAGI(CustomBabyAGI):
 5. 后续建议
 
 执行结果:
-"""
+""", objective=self.objective, task=task.content, context=PromptSection(context), error_context=error_context)
         
         try:
-            result = self.llm(prompt, max_tokens=1500)
+            result = await self._astream_call("execute", prompt, max_tokens=1500, task=task, on_chunk=on_chunk)
             return f"【任务执行方式】: LLM 直接处理\n\n{result}"
         except Exception as e:
             logger.error(f"LLM 任务执行失败: {e}")
             return f"LLM 执行失败: {str(e)}"
     
-    def create_new_tasks(self, completed_task: Task) -> List[Task]:
+    async def acreate_new_tasks(self, completed_task: Task) -> List[Task]:
         """基于已完成任务创建新任务（增强版）"""
         # 获取工具使用历史
         tool_usage_summary = self._get_tool_usage_summary()
         
-        prompt = f"""
+        prompt = self._render_prompt("create", """
 基于以下已完成的任务，创建新的任务来推进总体目标的实现。
 
-总体目标: {self.objective}
+总体目标: {objective}
 
-已完成任务: {completed_task.content}
-任务结果: {completed_task.result}
+已完成任务: {completed_task}
+任务结果: {result}
 
 现有任务列表:
-{self._format_task_list()}
+{task_list}
 
 工具使用情况:
 {tool_usage_summary}
 
 可用工具:
-{self._format_available_tools()}
+{available_tools}
 
 请分析当前进展，并创建 1-3 个新任务来继续推进目标实现。
 每个任务应该：
@@ -239,56 +260,64 @@ class EnhancedBabyAGI(CustomBabyAGI):
 4. 避免重复现有任务
 5. 考虑是否需要使用特定工具
 
+如果某个任务必须等待其他任务完成后才能执行，请在 depends_on 中列出依赖：
+可以填写现有任务列表中的任务ID，也可以填写本次返回数组中任务的序号（从 1 开始）。
+没有依赖的任务可以并行执行，depends_on 留空即可。
+
 请以 JSON 格式返回新任务列表：
 [
   {{
     "content": "任务描述1", 
     "priority": 优先级数字,
+    "depends_on": [],
     "suggested_tool": "建议使用的工具名称（可选）",
     "reasoning": "创建此任务的原因"
   }}
 ]
 
 如果不需要创建新任务，返回空数组 []。
-"""
+""",
+            objective=self.objective,
+            completed_task=completed_task.content,
+            result=PromptSection(completed_task.result or "", priority=2),
+            task_list=PromptSection(self._format_task_list(), priority=1),
+            tool_usage_summary=PromptSection(tool_usage_summary, priority=4),
+            available_tools=PromptSection(self._format_available_tools(), priority=3)
+        )
         
         try:
-            response = self.llm(prompt, max_tokens=1000)
-            
-            # 尝试解析 JSON
-            json_match = re.search(r'\[[^\[\]]*(?:\[[^\[\]]*\][^\[\]]*)*\]', response)
-            if json_match:
-                tasks_json = json_match.group()
-                new_tasks_data = json.loads(tasks_json)
-                
-                if not isinstance(new_tasks_data, list):
-                    logger.warning("LLM 返回的不是列表格式")
-                    return []
-                
-                new_tasks = []
-                for task_data in new_tasks_data:
-                    if isinstance(task_data, dict) and "content" in task_data:
-                        task = Task(
-                            id=str(uuid.uuid4()),
-                            content=task_data["content"],
-                            priority=task_data.get("priority", 1)
-                        )
-                        new_tasks.append(task)
-                        
-                        # 记录建议的工具
-                        if "suggested_tool" in task_data:
-                            logger.info(f"新任务 {task.id} 建议使用工具: {task_data['suggested_tool']}")
-                
-                logger.info(f"创建了 {len(new_tasks)} 个新任务")
-                return new_tasks
-            else:
+            new_tasks_data, _ = await self._astream_json(
+                "create", prompt, max_tokens=1000, kind="array", validator=self._is_task_list
+            )
+            if new_tasks_data is None:
                 logger.warning("无法找到 JSON 数组")
                 return []
-                
+            
+            new_tasks = self._build_tasks(new_tasks_data)
+            
+            # 记录建议的工具
+            task_entries = [task_data for task_data in new_tasks_data if "content" in task_data]
+            for task, task_data in zip(new_tasks, task_entries):
+                if "suggested_tool" in task_data:
+                    logger.info(f"新任务 {task.id} 建议使用工具: {task_data['suggested_tool']}")
+            
+            logger.info(f"创建了 {len(new_tasks)} 个新任务")
+            return new_tasks
+            
         except Exception as e:
             logger.error(f"创建新任务失败: {e}")
             return []
     
+    def _planning_extra_context(self) -> str:
+        """合并规划时同样提供工具信息"""
+        return f"""
+工具使用情况:
+{self._get_tool_usage_summary()}
+
+可用工具:
+{self._format_available_tools()}
+"""
+    
     def _get_tool_usage_summary(self) -> str:
         """获取工具使用摘要"""
         # 这里可以实现工具使用统计
@@ -321,6 +350,22 @@ class EnhancedBabyAGI(CustomBabyAGI):
         
         return base_status
 
+
+class EnhancedBabyAGI(AsyncEnhancedBabyAGI, CustomBabyAGI):
+    """增强版 BabyAGI，集成工具系统（同步接口）"""
+    
+    def _analyze_tool_requirement(self, task: Task, context: str) -> Dict[str, Any]:
+        """分析任务是否需要使用工具"""
+        return self._run_sync(self._aanalyze_tool_requirement(task, context))
+    
+    def _execute_task_with_tools(self, task: Task, tool_decision: Dict[str, Any], context: str) -> str:
+        """使用工具执行任务"""
+        return self._run_sync(self._aexecute_task_with_tools(task, tool_decision, context))
+    
+    def _execute_task_with_llm(self, task: Task, context: str, tool_error: str = None) -> str:
+        """使用 LLM 直接执行任务"""
+        return self._run_sync(self._aexecute_task_with_llm(task, context, tool_error))
+
 # 导入必要的模块
 import time
 import uuid
\ No newline at end of file
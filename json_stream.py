@@ -0,0 +1,95 @@
+import json
+from typing import Any, Callable, Optional
+
+_OPENERS = {"array": "[", "object": "{"}
+
+class JSONStreamExtractor:
+    """从流式 LLM 输出中增量提取第一个完整且合法的 JSON 值
+    
+    遇到期望的起始括号（数组或对象）后开始跟踪字符串和括号深度，
+    括号闭合时解析并用 validator 校验；不合法则从下一个起始括号继续查找。
+    已扫描过的文本不会重复扫描，调用方可在 feed 返回 True 后立即停止生成。
+    """
+    
+    def __init__(self, kind: str = "array", validator: Optional[Callable[[Any], bool]] = None):
+        if kind not in _OPENERS:
+            raise ValueError(f"不支持的 JSON 类型: {kind}")
+        self.opener = _OPENERS[kind]
+        self.validator = validator
+        self.text = ""
+        self.value: Any = None
+        self.done = False
+        self._pos = 0
+        self._reset()
+    
+    def _reset(self) -> None:
+        self._start = -1
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+    
+    def feed(self, chunk: str) -> bool:
+        """追加一段输出，已提取到合法值时返回 True"""
+        if self.done:
+            return True
+        
+        self.text += chunk
+        text = self.text
+        i = self._pos
+        while i < len(text):
+            ch = text[i]
+            if self._start < 0:
+                if ch == self.opener:
+                    self._start = i
+                    self._depth = 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "[{":
+                self._depth += 1
+            elif ch in "]}":
+                self._depth -= 1
+                if self._depth == 0:
+                    if self._accept(text[self._start:i + 1]):
+                        self._pos = i + 1
+                        return True
+                    # 不是合法的值，从起始括号之后重新查找
+                    i = self._start
+                    self._reset()
+            i += 1
+        
+        self._pos = i
+        return False
+    
+    def finish(self) -> bool:
+        """输出结束时调用：未闭合的起始括号不会再完成，从其后继续查找"""
+        while not self.done and self._start >= 0:
+            self._pos = self._start + 1
+            self._reset()
+            self.feed("")
+        return self.done
+    
+    def _accept(self, candidate: str) -> bool:
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            return False
+        if self.validator is not None and not self.validator(value):
+            return False
+        self.value = value
+        self.done = True
+        return True
+    
+    @classmethod
+    def extract(cls, text: str, kind: str = "array", validator: Optional[Callable[[Any], bool]] = None) -> Any:
+        """从完整文本中提取第一个合法的 JSON 值，找不到时返回 None"""
+        extractor = cls(kind, validator)
+        extractor.feed(text)
+        extractor.finish()
+        return extractor.value
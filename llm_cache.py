@@ -0,0 +1,242 @@
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import config
+from logger import get_logger
+
+logger = get_logger("llm_cache")
+
+class MemoryCacheTier:
+    """进程内 LRU 缓存层"""
+    
+    name = "memory"
+    blocking = False
+    
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is not None:
+                self._entries.move_to_end(key)
+            return value
+    
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteCacheTier:
+    """持久化 SQLite 缓存层，支持过期时间和按总大小淘汰（最久未访问的先淘汰）"""
+    
+    name = "sqlite"
+    blocking = True
+    
+    def __init__(self, path: str, ttl_seconds: float = 7 * 24 * 3600, max_bytes: int = 100 * 1024 * 1024):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache (last_access)")
+            self._purge_expired()
+            self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+    
+    def _purge_expired(self) -> None:
+        if self.ttl_seconds > 0:
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+    
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT value, size, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            
+            value, size, created_at = row
+            if self.ttl_seconds > 0 and created_at < now - self.ttl_seconds:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._total_bytes -= size
+                return None
+            
+            self._conn.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            return value
+    
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock, self._conn:
+            previous = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now)
+            )
+            self._total_bytes += size - (previous[0] if previous else 0)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+    
+    def _evict(self) -> None:
+        """淘汰最久未访问的条目，直到总大小降到上限的 90%"""
+        self._purge_expired()
+        self._total_bytes = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        target = self.max_bytes * 0.9
+        
+        evicted = 0
+        rows = self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_access").fetchall()
+        for key, size in rows:
+            if self._total_bytes <= target:
+                break
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            self._total_bytes -= size
+            evicted += 1
+        logger.debug(f"LLM 缓存淘汰 {evicted} 条记录，当前大小 {self._total_bytes} 字节")
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+    
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+class LLMCache:
+    """内容寻址的 LLM 响应缓存
+    
+    按 (provider, model, prompt, max_tokens, temperature) 的哈希查找各缓存层，
+    低层命中后回填到高层；相同请求并发时只调用一次 LLM（singleflight），
+    跨事件循环的等待者通过 concurrent.futures.Future 共享结果。
+    """
+    
+    def __init__(self, tiers: List):
+        self.tiers = tiers
+        self.stats: Dict[str, int] = {"hits": 0, "misses": 0, "coalesced": 0}
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def make_key(provider: str, model: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        payload = json.dumps([provider, model, prompt, max_tokens, temperature], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    async def lookup(self, key: str) -> Tuple[Optional[str], Optional[str]]:
+        """依次查找各缓存层，返回 (值, 命中的缓存层名称)"""
+        for index, tier in enumerate(self.tiers):
+            value = await asyncio.to_thread(tier.get, key) if tier.blocking else tier.get(key)
+            if value is not None:
+                await self._store(key, value, self.tiers[:index])
+                return value, tier.name
+        return None, None
+    
+    async def store(self, key: str, value: str) -> None:
+        """写入全部缓存层"""
+        await self._store(key, value, self.tiers)
+    
+    @staticmethod
+    async def _store(key: str, value: str, tiers: List) -> None:
+        for tier in tiers:
+            if tier.blocking:
+                await asyncio.to_thread(tier.set, key, value)
+            else:
+                tier.set(key, value)
+    
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[str]],
+        cacheable: Callable[[str], bool] = lambda value: True
+    ) -> Tuple[str, str]:
+        """查找缓存，未命中时调用 compute
+        
+        返回 (响应, 来源)，来源为命中的缓存层名称、"miss" 或 "coalesced"（复用了并发请求的结果）。
+        """
+        value, source = await self.lookup(key)
+        if value is not None:
+            self.stats["hits"] += 1
+            return value, source
+        
+        while True:
+            with self._lock:
+                future = self._inflight.get(key)
+                leader = future is None
+                if leader:
+                    future = Future()
+                    self._inflight[key] = future
+            
+            if not leader:
+                try:
+                    # shield 避免等待者被取消时连带取消其他请求共享的 Future
+                    value = await asyncio.shield(asyncio.wrap_future(future))
+                except asyncio.CancelledError:
+                    if future.cancelled():
+                        # 发起请求的协程被取消，由当前协程重新发起
+                        continue
+                    raise
+                self.stats["coalesced"] += 1
+                return value, "coalesced"
+            
+            try:
+                value = await compute()
+                if cacheable(value):
+                    await self._store(key, value, self.tiers)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except BaseException as e:
+                future.set_exception(e)
+                raise
+            else:
+                future.set_result(value)
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+            
+            self.stats["misses"] += 1
+            return value, "miss"
+
+_llm_cache: Optional[LLMCache] = None
+_llm_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMCache:
+    """获取进程内共享的 LLM 缓存（按配置创建缓存层）"""
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            tiers = [MemoryCacheTier(config.LLM_CACHE_MEMORY_ENTRIES)]
+            if config.LLM_CACHE_PATH:
+                tiers.append(SQLiteCacheTier(
+                    config.LLM_CACHE_PATH,
+                    ttl_seconds=config.LLM_CACHE_TTL,
+                    max_bytes=config.LLM_CACHE_MAX_MB * 1024 * 1024
+                ))
+            _llm_cache = LLMCache(tiers)
+            logger.info(f"LLM 缓存已启用，缓存层: {', '.join(tier.name for tier in tiers)}")
+        return _llm_cache
@@ -0,0 +1,388 @@
+import asyncio
+import json
+import random
+import threading
+import time
+import weakref
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+from config import config
+from llm_governor import LLMGovernor
+from llm_ledger import current_llm_call
+from logger import get_logger
+
+logger = get_logger("llm_client")
+
+# 可重试的 HTTP 状态码：超时、限流和服务端错误
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+class LLMProviderError(Exception):
+    """LLM 服务调用失败（已重试并尝试切换地址）"""
+
+class LLMEndpoint:
+    """单个 LLM 服务地址
+    
+    每个事件循环持有一个长连接池（httpx 的连接不能跨事件循环复用），
+    并记录进行中的请求数、平均延迟和健康状态：连续失败达到阈值后冷却一段时间再重新启用。
+    """
+    
+    def __init__(
+        self,
+        base_url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: float = 60.0,
+        max_connections: int = 20,
+        failure_threshold: int = 3,
+        cooldown: float = 30.0
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.headers = headers or {}
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.latency = 0.0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+        self.stats = {"requests": 0, "failures": 0}
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+    
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.unhealthy_until
+    
+    def client(self) -> httpx.AsyncClient:
+        """获取当前事件循环上的连接池"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None or client.is_closed:
+                client = httpx.AsyncClient(
+                    base_url=self.base_url,
+                    headers=self.headers,
+                    timeout=self.timeout,
+                    limits=httpx.Limits(
+                        max_connections=self.max_connections,
+                        max_keepalive_connections=self.max_connections
+                    )
+                )
+                self._clients[loop] = client
+            return client
+    
+    def acquire(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.stats["requests"] += 1
+    
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+    
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.consecutive_failures = 0
+            self.unhealthy_until = 0.0
+            self.latency = latency if self.latency == 0 else 0.8 * self.latency + 0.2 * latency
+    
+    def record_failure(self) -> None:
+        with self._lock:
+            self.stats["failures"] += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= self.failure_threshold:
+                self.unhealthy_until = time.monotonic() + self.cooldown
+                logger.warning(f"LLM 服务地址 {self.base_url} 连续失败 {self.consecutive_failures} 次，暂停使用 {self.cooldown}s")
+    
+    def status(self) -> Dict[str, Any]:
+        return {
+            "base_url": self.base_url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "latency": round(self.latency, 3),
+            **self.stats
+        }
+    
+    async def aclose(self) -> None:
+        """关闭当前事件循环上的连接池"""
+        with self._lock:
+            client = self._clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.aclose()
+
+class LLMClientPool:
+    """多地址 LLM 客户端（Ollama 或 OpenAI 兼容接口）
+    
+    每次调用经调度器排队后分配到进行中请求最少的健康地址；连接失败、超时和服务端错误
+    会在指数退避（带随机抖动）后切换到其他地址重试，429 限流按 Retry-After 暂停该地址。
+    流式调用只在产出第一个片段前重试。start_health_checks 启动后台线程定期探测所有地址，
+    探测失败的地址和请求失败一样计入连续失败，探测成功的地址提前恢复使用。
+    """
+    
+    def __init__(
+        self,
+        provider: str,
+        model: str,
+        base_urls: Sequence[str],
+        api_key: Optional[str] = None,
+        max_retries: int = 3,
+        backoff: float = 0.5,
+        max_backoff: float = 8.0,
+        governor: Optional[LLMGovernor] = None,
+        **endpoint_options: Any
+    ):
+        if provider not in ("openai", "ollama"):
+            raise ValueError(f"不支持的 LLM 提供商: {provider}")
+        if not base_urls:
+            raise ValueError("至少需要配置一个 LLM 服务地址")
+        
+        self.provider = provider
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.governor = governor or LLMGovernor()
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        self.endpoints = [LLMEndpoint(url, headers, **endpoint_options) for url in base_urls]
+        self._health_thread: Optional[threading.Thread] = None
+        self._health_stop = threading.Event()
+    
+    async def _acquire(self, tried: List[LLMEndpoint], agent_id: str) -> LLMEndpoint:
+        endpoint, waited = await self.governor.acquire(self.endpoints, agent_id, tried)
+        call = current_llm_call.get()
+        if call is not None:
+            call.queue_wait += waited
+            if tried:
+                call.retries += 1
+        tried.append(endpoint)
+        return endpoint
+    
+    def _delay(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+    
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        """解析 429 响应的 Retry-After（秒数或 HTTP 日期）"""
+        if not isinstance(error, httpx.HTTPStatusError) or error.response.status_code != 429:
+            return None
+        value = error.response.headers.get("Retry-After")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    
+    @staticmethod
+    def _retryable(error: Exception) -> bool:
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRYABLE_STATUS
+        return isinstance(error, (httpx.TransportError, json.JSONDecodeError))
+    
+    def _request(self, prompt: str, max_tokens: int, temperature: float, stream: bool) -> Tuple[str, Dict[str, Any]]:
+        if self.provider == "ollama":
+            return "/api/generate", {
+                "model": self.model,
+                "prompt": prompt,
+                "stream": stream,
+                "options": {"num_predict": max_tokens, "temperature": temperature}
+            }
+        return "/chat/completions", {
+            "model": self.model,
+            "messages": [{"role": "user", "content": prompt}],
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream
+        }
+    
+    def _parse_stream_line(self, line: str) -> Tuple[str, bool]:
+        """解析流式响应的一行，返回 (文本片段, 是否结束)"""
+        if self.provider == "ollama":
+            data = json.loads(line)
+            return data.get("response", ""), bool(data.get("done"))
+        
+        # OpenAI 兼容接口使用 SSE：data: {...}，以 data: [DONE] 结束
+        if not line.startswith("data:"):
+            return "", False
+        payload = line[len("data:"):].strip()
+        if payload == "[DONE]":
+            return "", True
+        choices = json.loads(payload).get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content") or "", False
+    
+    async def _handle_failure(self, endpoint: LLMEndpoint, error: Exception, attempt: int) -> None:
+        """记录失败；不可重试或重试次数用尽时抛出 LLMProviderError"""
+        retryable = self._retryable(error)
+        if retryable:
+            endpoint.record_failure()
+        if not retryable or attempt >= self.max_retries:
+            raise LLMProviderError(f"{endpoint.base_url}: {error}") from error
+        
+        retry_after = self._retry_after(error)
+        if retry_after is not None:
+            # 由调度器暂停该地址，重试请求会分配到其他地址或等到暂停结束
+            self.governor.penalize(endpoint, retry_after)
+            return
+        
+        delay = self._delay(attempt)
+        logger.warning(f"LLM 服务 {endpoint.base_url} 调用失败，{delay:.2f}s 后重试: {error}")
+        await asyncio.sleep(delay)
+    
+    async def generate(self, prompt: str, max_tokens: int = 1000, temperature: float = 0.7, agent_id: str = "default") -> str:
+        """生成完整响应"""
+        path, payload = self._request(prompt, max_tokens, temperature, stream=False)
+        tried: List[LLMEndpoint] = []
+        for attempt in range(self.max_retries + 1):
+            endpoint = await self._acquire(tried, agent_id)
+            started = time.monotonic()
+            error = None
+            try:
+                response = await endpoint.client().post(path, json=payload)
+                response.raise_for_status()
+                data = response.json()
+            except Exception as e:
+                error = e
+            finally:
+                self.governor.release(endpoint)
+            
+            if error is not None:
+                await self._handle_failure(endpoint, error, attempt)
+                continue
+            endpoint.record_success(time.monotonic() - started)
+            if self.provider == "ollama":
+                return data["response"]
+            return data["choices"][0]["message"]["content"]
+    
+    async def stream(
+        self,
+        prompt: str,
+        max_tokens: int = 1000,
+        temperature: float = 0.7,
+        agent_id: str = "default"
+    ) -> AsyncIterator[str]:
+        """流式生成，逐块产出文本"""
+        path, payload = self._request(prompt, max_tokens, temperature, stream=True)
+        tried: List[LLMEndpoint] = []
+        for attempt in range(self.max_retries + 1):
+            endpoint = await self._acquire(tried, agent_id)
+            started = time.monotonic()
+            produced = False
+            error = None
+            try:
+                async with endpoint.client().stream("POST", path, json=payload) as response:
+                    response.raise_for_status()
+                    async for line in response.aiter_lines():
+                        if not line.strip():
+                            continue
+                        chunk, done = self._parse_stream_line(line)
+                        if chunk:
+                            produced = True
+                            yield chunk
+                        if done:
+                            break
+            except Exception as e:
+                error = e
+            finally:
+                self.governor.release(endpoint)
+            
+            if error is None:
+                endpoint.record_success(time.monotonic() - started)
+                return
+            if produced:
+                # 已产出的内容无法撤回，不再重试
+                endpoint.record_failure()
+                raise LLMProviderError(f"{endpoint.base_url}: {error}") from error
+            await self._handle_failure(endpoint, error, attempt)
+    
+    async def check_health(self) -> Dict[str, bool]:
+        """主动探测所有地址，探测成功的地址立即恢复使用"""
+        path = "/api/tags" if self.provider == "ollama" else "/models"
+        
+        async def probe(endpoint: LLMEndpoint) -> bool:
+            started = time.monotonic()
+            try:
+                response = await endpoint.client().get(path)
+                response.raise_for_status()
+            except Exception as e:
+                logger.warning(f"LLM 服务地址 {endpoint.base_url} 健康检查失败: {e}")
+                endpoint.record_failure()
+                return False
+            endpoint.record_success(time.monotonic() - started)
+            return True
+        
+        results = await asyncio.gather(*(probe(endpoint) for endpoint in self.endpoints))
+        return {endpoint.base_url: healthy for endpoint, healthy in zip(self.endpoints, results)}
+    
+    def start_health_checks(self, interval: float) -> None:
+        """启动后台线程，每隔 interval 秒探测一次所有地址（线程使用自己的事件循环和连接池）"""
+        if self._health_thread is not None:
+            return
+        self._health_stop.clear()
+        
+        async def loop() -> None:
+            try:
+                while not self._health_stop.is_set():
+                    await self.check_health()
+                    await asyncio.to_thread(self._health_stop.wait, interval)
+            finally:
+                await self.aclose()
+        
+        self._health_thread = threading.Thread(target=asyncio.run, args=(loop(),), name="llm-health-check", daemon=True)
+        self._health_thread.start()
+        logger.info(f"LLM 服务地址健康检查已启动，间隔 {interval}s")
+    
+    def stop_health_checks(self) -> None:
+        """停止后台健康检查并等待线程退出"""
+        thread, self._health_thread = self._health_thread, None
+        if thread is not None:
+            self._health_stop.set()
+            thread.join()
+    
+    def status(self) -> List[Dict[str, Any]]:
+        return [endpoint.status() for endpoint in self.endpoints]
+    
+    async def aclose(self) -> None:
+        """关闭当前事件循环上的所有连接池"""
+        await asyncio.gather(*(endpoint.aclose() for endpoint in self.endpoints))
+
+_llm_pool: Optional[LLMClientPool] = None
+_llm_pool_lock = threading.Lock()
+
+def get_llm_pool() -> LLMClientPool:
+    """获取进程内共享的 LLM 客户端（按配置创建）"""
+    global _llm_pool
+    with _llm_pool_lock:
+        if _llm_pool is None:
+            if config.LLM_PROVIDER == "openai":
+                model, api_key = config.OPENAI_MODEL, config.OPENAI_API_KEY
+            else:
+                model, api_key = config.OLLAMA_MODEL, None
+            _llm_pool = LLMClientPool(
+                config.LLM_PROVIDER,
+                model,
+                config.get_llm_base_urls(),
+                api_key=api_key,
+                max_retries=config.LLM_MAX_RETRIES,
+                backoff=config.LLM_RETRY_BACKOFF,
+                timeout=config.LLM_TIMEOUT,
+                max_connections=config.LLM_MAX_CONNECTIONS,
+                cooldown=config.LLM_ENDPOINT_COOLDOWN,
+                governor=LLMGovernor(
+                    max_concurrency=config.LLM_MAX_CONCURRENCY,
+                    rate=config.LLM_RATE_LIMIT,
+                    burst=config.LLM_RATE_BURST,
+                    weights=config.get_llm_agent_weights()
+                )
+            )
+            logger.info(f"LLM 客户端已创建，服务地址: {', '.join(config.get_llm_base_urls())}")
+            # 只有一个地址时没有可切换的目标，不需要探测
+            if config.LLM_HEALTH_CHECK_INTERVAL > 0 and len(_llm_pool.endpoints) > 1:
+                _llm_pool.start_health_checks(config.LLM_HEALTH_CHECK_INTERVAL)
+        return _llm_pool
@@ -0,0 +1,212 @@
+import asyncio
+import heapq
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from logger import get_logger
+
+logger = get_logger("llm_governor")
+
+@dataclass
+class _Bucket:
+    """单个服务地址的令牌桶与 Retry-After 封锁时间"""
+    tokens: float
+    updated: float
+    blocked_until: float = 0.0
+
+@dataclass(order=True)
+class _Waiter:
+    finish: float
+    seq: int
+    start: float = field(compare=False)
+    agent_id: str = field(compare=False)
+    endpoints: Sequence[Any] = field(compare=False)
+    tried: Sequence[Any] = field(compare=False)
+    future: Future = field(compare=False)
+
+class LLMGovernor:
+    """进程级 LLM 调度器
+    
+    所有 Agent 的 LLM 请求先在这里排队，再分配到服务地址：
+    每个地址有并发上限和令牌桶限速（429 响应的 Retry-After 会暂停该地址），
+    排队请求按 Agent 权重做加权公平排队（WFQ），避免单个 Agent 占满服务。
+    等待者可能位于不同线程的事件循环中，通过 concurrent.futures.Future 传递分配结果。
+    """
+    
+    def __init__(self, max_concurrency: int = 0, rate: float = 0.0, burst: int = 1, weights: Optional[Dict[str, float]] = None):
+        self.max_concurrency = max_concurrency  # 每个地址，0 表示不限
+        self.rate = rate  # 每个地址每秒请求数，0 表示不限
+        self.burst = max(1, burst)
+        self.weights: Dict[str, float] = dict(weights or {})
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._buckets: Dict[Any, _Bucket] = {}
+        self._agent_stats: Dict[str, Dict[str, float]] = {}
+        self._timer: Optional[threading.Timer] = None
+        self._timer_at = 0.0
+        self._lock = threading.Lock()
+    
+    def set_weight(self, agent_id: str, weight: float) -> None:
+        """设置 Agent 的调度权重，权重越大分到的份额越多"""
+        with self._lock:
+            self.weights[agent_id] = max(weight, 1e-6)
+    
+    def _bucket(self, endpoint: Any, now: float) -> _Bucket:
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            bucket = self._buckets[endpoint] = _Bucket(tokens=self.burst, updated=now)
+        elif self.rate > 0:
+            bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated) * self.rate)
+            bucket.updated = now
+        return bucket
+    
+    def _available(self, endpoint: Any, now: float) -> bool:
+        if self.max_concurrency and endpoint.in_flight >= self.max_concurrency:
+            return False
+        bucket = self._bucket(endpoint, now)
+        if now < bucket.blocked_until:
+            return False
+        return self.rate <= 0 or bucket.tokens >= 1
+    
+    def _choose(self, waiter: _Waiter, now: float) -> Optional[Any]:
+        """优先选择未尝试过的健康地址中负载最低的；全部不健康时允许试探"""
+        candidates = [endpoint for endpoint in waiter.endpoints if endpoint not in waiter.tried] or list(waiter.endpoints)
+        healthy = [endpoint for endpoint in candidates if endpoint.healthy]
+        if not healthy:
+            healthy = sorted(candidates, key=lambda endpoint: endpoint.unhealthy_until)[:1]
+        available = [endpoint for endpoint in healthy if self._available(endpoint, now)]
+        if not available:
+            return None
+        return min(available, key=lambda endpoint: (endpoint.in_flight, endpoint.latency, random.random()))
+    
+    def _dispatch_locked(self) -> None:
+        """按虚拟完成时间顺序为排队请求分配地址，直到队首请求无可用地址"""
+        now = time.monotonic()
+        while self._queue:
+            waiter = self._queue[0]
+            if waiter.future.done():
+                heapq.heappop(self._queue)
+                continue
+            endpoint = self._choose(waiter, now)
+            if endpoint is None:
+                break
+            
+            heapq.heappop(self._queue)
+            self._virtual_time = max(self._virtual_time, waiter.start)
+            if self.rate > 0:
+                self._bucket(endpoint, now).tokens -= 1
+            endpoint.acquire()
+            waiter.future.set_result(endpoint)
+        
+        if self._queue:
+            self._schedule_locked(now)
+    
+    def _schedule_locked(self, now: float) -> None:
+        """令牌补充或 Retry-After 到期后重新分配（并发名额由 release 触发）"""
+        wake_at = None
+        for bucket in self._buckets.values():
+            if now < bucket.blocked_until:
+                at = bucket.blocked_until
+            elif self.rate > 0 and bucket.tokens < 1:
+                at = now + (1 - bucket.tokens) / self.rate
+            else:
+                continue
+            wake_at = at if wake_at is None else min(wake_at, at)
+        if wake_at is None:
+            return
+        if self._timer is not None and self._timer_at <= wake_at and self._timer.is_alive():
+            return
+        
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(max(0.0, wake_at - now) + 0.001, self._on_timer)
+        self._timer.daemon = True
+        self._timer_at = wake_at
+        self._timer.start()
+    
+    def _on_timer(self) -> None:
+        with self._lock:
+            self._timer = None
+            self._dispatch_locked()
+    
+    async def acquire(self, endpoints: Sequence[Any], agent_id: str = "default", tried: Sequence[Any] = (), cost: float = 1.0) -> Tuple[Any, float]:
+        """排队等待可用地址，返回 (地址, 排队秒数)；用完后必须调用 release"""
+        started = time.monotonic()
+        future: Future = Future()
+        with self._lock:
+            weight = self.weights.get(agent_id, 1.0)
+            start = max(self._virtual_time, self._last_finish.get(agent_id, 0.0))
+            finish = start + cost / weight
+            self._last_finish[agent_id] = finish
+            heapq.heappush(self._queue, _Waiter(finish, next(self._seq), start, agent_id, endpoints, tried, future))
+            self._dispatch_locked()
+        
+        try:
+            endpoint = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = future.done() and not future.cancelled() and future.exception() is None
+                future.cancel()
+            if granted:
+                # 分配结果送达前被取消，归还名额
+                self.release(future.result())
+            raise
+        
+        waited = time.monotonic() - started
+        with self._lock:
+            stats = self._agent_stats.setdefault(agent_id, {"calls": 0, "queue_wait": 0.0, "max_queue_wait": 0.0})
+            stats["calls"] += 1
+            stats["queue_wait"] += waited
+            stats["max_queue_wait"] = max(stats["max_queue_wait"], waited)
+        if waited >= 0.01:
+            logger.debug(f"Agent {agent_id} 的 LLM 请求排队 {waited:.3f}s 后分配到 {endpoint.base_url}")
+        return endpoint, waited
+    
+    def release(self, endpoint: Any) -> None:
+        """请求结束，归还地址的并发名额"""
+        endpoint.release()
+        with self._lock:
+            self._dispatch_locked()
+    
+    def penalize(self, endpoint: Any, retry_after: float) -> None:
+        """收到 429 后在 retry_after 秒内不再向该地址分配请求"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._bucket(endpoint, now)
+            bucket.blocked_until = max(bucket.blocked_until, now + retry_after)
+            if self.rate > 0:
+                bucket.tokens = min(bucket.tokens, 0.0)
+            self._schedule_locked(now)
+        logger.warning(f"LLM 服务地址 {endpoint.base_url} 限流，{retry_after:.2f}s 内暂停分配")
+    
+    def forget(self, agent_id: str, drop_weight: bool = False) -> Dict[str, float]:
+        """Agent 结束后清理它的排队状态，返回移除前的累计统计
+        
+        加权公平排队的虚拟完成时间只在 Agent 有请求时有意义，清理后再次调用从当前虚拟时间开始。
+        drop_weight 为 True 时一并移除权重（Agent 被删除时）。
+        """
+        with self._lock:
+            self._last_finish.pop(agent_id, None)
+            if drop_weight:
+                self.weights.pop(agent_id, None)
+            return self._agent_stats.pop(agent_id, {"calls": 0, "queue_wait": 0.0, "max_queue_wait": 0.0})
+    
+    def agent_stats(self, agent_id: str) -> Dict[str, float]:
+        """获取 Agent 的累计调用次数和排队时间"""
+        with self._lock:
+            return dict(self._agent_stats.get(agent_id, {"calls": 0, "queue_wait": 0.0, "max_queue_wait": 0.0}))
+    
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "queued": sum(1 for waiter in self._queue if not waiter.future.done()),
+                "max_concurrency": self.max_concurrency,
+                "rate": self.rate
+            }
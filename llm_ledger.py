@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+@dataclass
+class LLMCallContext:
+    """单次 LLM 调用过程中由下层（缓存、调度器、客户端）填写的信息"""
+    started: float = field(default_factory=time.monotonic)
+    queue_wait: float = 0.0
+    retries: int = 0
+    cache: Optional[str] = None  # 命中的缓存层、"miss"、"coalesced"，未启用缓存时为 None
+
+# 当前正在进行的 LLM 调用，由 Agent 在调用前设置
+current_llm_call: ContextVar[Optional[LLMCallContext]] = ContextVar("current_llm_call", default=None)
+
+@dataclass
+class LLMCallRecord:
+    """一次 LLM 调用的记录"""
+    agent_id: str
+    iteration: Optional[int]
+    phase: str
+    prompt_tokens: int
+    completion_tokens: int
+    latency: float
+    queue_wait: float
+    retries: int
+    cache: Optional[str]
+    timestamp: float
+
+def _empty_phase() -> Dict[str, Any]:
+    return {
+        "calls": 0,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "trimmed": 0,
+        "latency": 0.0,
+        "max_latency": 0.0,
+        "queue_wait": 0.0,
+        "retries": 0,
+        "cache_hits": 0
+    }
+
+class LLMLedger:
+    """按阶段汇总单个 Agent 的 LLM 调用（token 数、延迟、排队、重试、缓存命中）
+    
+    汇总数据覆盖全部调用，逐条记录只保留最近 max_records 条。
+    """
+    
+    def __init__(self, agent_id: str, max_records: int = 200):
+        self.agent_id = agent_id
+        self._phases: Dict[str, Dict[str, Any]] = {}
+        self._records: Deque[LLMCallRecord] = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+    
+    def record(
+        self,
+        phase: str,
+        iteration: Optional[int],
+        prompt_tokens: int,
+        completion_tokens: int,
+        call: LLMCallContext
+    ) -> LLMCallRecord:
+        """记录一次已完成的调用"""
+        latency = time.monotonic() - call.started
+        entry = LLMCallRecord(
+            agent_id=self.agent_id,
+            iteration=iteration,
+            phase=phase,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            latency=latency,
+            queue_wait=call.queue_wait,
+            retries=call.retries,
+            cache=call.cache,
+            timestamp=time.time()
+        )
+        with self._lock:
+            usage = self._phases.setdefault(phase, _empty_phase())
+            usage["calls"] += 1
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["latency"] += latency
+            usage["max_latency"] = max(usage["max_latency"], latency)
+            usage["queue_wait"] += call.queue_wait
+            usage["retries"] += call.retries
+            if call.cache not in (None, "miss"):
+                usage["cache_hits"] += 1
+            self._records.append(entry)
+        return entry
+    
+    def note_trimmed(self, phase: str) -> None:
+        """记录一次提示词超出预算被裁剪"""
+        with self._lock:
+            self._phases.setdefault(phase, _empty_phase())["trimmed"] += 1
+    
+    def phases(self) -> Dict[str, Dict[str, Any]]:
+        """各阶段的汇总数据"""
+        with self._lock:
+            return {phase: dict(usage) for phase, usage in self._phases.items()}
+    
+    def totals(self) -> Dict[str, Any]:
+        """全部阶段合计"""
+        totals = _empty_phase()
+        for usage in self.phases().values():
+            for key, value in usage.items():
+                totals[key] = max(totals[key], value) if key == "max_latency" else totals[key] + value
+        totals["avg_latency"] = totals["latency"] / totals["calls"] if totals["calls"] else 0.0
+        return totals
+    
+    def recent(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """最近的调用记录"""
+        with self._lock:
+            records = list(self._records)[-limit:] if limit else []
+        return [asdict(record) for record in records]
+    
+    def summary(self, recent: int = 20) -> Dict[str, Any]:
+        return {
+            "agent_id": self.agent_id,
+            "totals": self.totals(),
+            "phases": self.phases(),
+            "recent": self.recent(recent)
+        }
@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+from collections import defaultdict
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+from config import config
+from logger import get_logger
+
+logger = get_logger("llm_replay")
+
+# 任务 ID 是每次运行随机生成的 UUID，录制和回放时替换为按出现顺序编号的占位符
+_UUID_RE = re.compile(r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}")
+_PLACEHOLDER_RE = re.compile(r"<id:(\d+)>")
+
+class LLMTraceMiss(KeyError):
+    """回放时轨迹文件中没有对应的请求"""
+
+class LLMTrace:
+    """LLM 请求/响应轨迹的录制与回放
+    
+    record 模式把每次调用追加为轨迹文件中的一行 JSON（请求哈希、响应、耗时、流式分块长度）；
+    replay 模式按请求哈希返回录制的响应，可按录制耗时或固定延迟模拟 LLM 延迟。
+    相同请求出现多次时按录制顺序依次返回，因此回放的运行与录制时完全一致。
+    """
+    
+    def __init__(self, path: str, mode: str = "record", latency: Union[float, str] = 0.0):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"不支持的轨迹模式: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency = latency  # "recorded" 使用录制耗时，数字为每次调用的固定秒数
+        self.stats = {"recorded": 0, "replayed": 0, "misses": 0}
+        self._entries: Dict[str, List[dict]] = defaultdict(list)
+        self._cursors: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+        self._file = None
+        
+        if mode == "record":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(path, "w", encoding="utf-8")
+        else:
+            self._load()
+    
+    def _load(self) -> None:
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[entry["k"]].append(entry)
+        logger.info(f"已加载 LLM 轨迹 {self.path}，共 {sum(len(entries) for entries in self._entries.values())} 次调用")
+    
+    @staticmethod
+    def _normalize(prompt: str) -> Tuple[str, List[str]]:
+        """把提示词中的 UUID 替换为占位符，返回 (规范化文本, 按出现顺序排列的 UUID)"""
+        ids: List[str] = []
+        
+        def placeholder(match: "re.Match") -> str:
+            if match.group(0) not in ids:
+                ids.append(match.group(0))
+            return f"<id:{ids.index(match.group(0))}>"
+        
+        return _UUID_RE.sub(placeholder, prompt), ids
+    
+    @classmethod
+    def make_key(cls, prompt: str, max_tokens: int) -> Tuple[str, List[str]]:
+        normalized, ids = cls._normalize(prompt)
+        payload = json.dumps([normalized, max_tokens], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32], ids
+    
+    def record(self, prompt: str, max_tokens: int, response: str, latency: float, chunks: Optional[List[str]] = None) -> None:
+        """追加一次调用；chunks 为流式响应的分块，用于回放时按相同的边界产出"""
+        key, ids = self.make_key(prompt, max_tokens)
+        for index, task_id in enumerate(ids):
+            response = response.replace(task_id, f"<id:{index}>")
+        entry = {"k": key, "r": response, "t": round(latency, 3)}
+        if chunks is not None:
+            entry["n"] = [len(chunk) for chunk in chunks]
+        
+        line = json.dumps(entry, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.stats["recorded"] += 1
+    
+    def lookup(self, prompt: str, max_tokens: int) -> Tuple[List[str], float]:
+        """查找录制的响应，返回 (分块列表, 模拟延迟秒数)；没有录制时抛出 LLMTraceMiss"""
+        key, ids = self.make_key(prompt, max_tokens)
+        with self._lock:
+            entries = self._entries.get(key)
+            if not entries:
+                self.stats["misses"] += 1
+                raise LLMTraceMiss(f"轨迹中没有该请求: {key}")
+            # 同一请求的录制次数用完后重复最后一次的响应
+            entry = entries[min(self._cursors[key], len(entries) - 1)]
+            self._cursors[key] += 1
+            self.stats["replayed"] += 1
+        
+        response = _PLACEHOLDER_RE.sub(
+            lambda match: ids[int(match.group(1))] if int(match.group(1)) < len(ids) else match.group(0),
+            entry["r"]
+        )
+        chunks = [response]
+        lengths = entry.get("n")
+        if lengths and sum(lengths) == len(response):
+            chunks, offset = [], 0
+            for length in lengths:
+                chunks.append(response[offset:offset + length])
+                offset += length
+        
+        delay = entry["t"] if self.latency == "recorded" else float(self.latency)
+        return chunks, delay
+    
+    async def replay(self, prompt: str, max_tokens: int) -> str:
+        chunks, delay = self.lookup(prompt, max_tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return "".join(chunks)
+    
+    async def replay_stream(self, prompt: str, max_tokens: int) -> AsyncIterator[str]:
+        """按录制时的分块边界产出响应，模拟延迟平均分摊到各分块"""
+        chunks, delay = self.lookup(prompt, max_tokens)
+        for chunk in chunks:
+            if delay > 0:
+                await asyncio.sleep(delay / len(chunks))
+            yield chunk
+    
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+_llm_trace: Optional[LLMTrace] = None
+_llm_trace_lock = threading.Lock()
+
+def get_llm_trace() -> LLMTrace:
+    """获取进程内共享的 LLM 轨迹（按配置录制或回放）"""
+    global _llm_trace
+    with _llm_trace_lock:
+        if _llm_trace is None:
+            _llm_trace = LLMTrace(config.LLM_TRACE_FILE, config.LLM_TRACE_MODE, config.get_llm_replay_latency())
+            logger.info(f"LLM 轨迹模式: {config.LLM_TRACE_MODE}，文件: {config.LLM_TRACE_FILE}")
+        return _llm_trace
@@ -0,0 +1,119 @@
+import contextlib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 fcntl，只能保证进程内互斥
+    fcntl = None
+
+from config import config
+from logger import get_logger
+
+logger = get_logger("memory_namespaces")
+
+# shared 模式下所有 Agent 共用的集合（迁移前的唯一集合）
+SHARED_NAMESPACE = "babyagi_tasks"
+
+def namespace_name(mode: str, objective: str, run_id: str) -> str:
+    """按隔离模式返回记忆命名空间（即集合名）
+    
+    objective 模式下相同目标（忽略大小写和首尾空白）的运行共享记忆，run 模式下每次运行独立，
+    shared 模式沿用单一集合。名称满足 Chroma 集合名的字符限制。
+    """
+    if mode == "shared":
+        return SHARED_NAMESPACE
+    if mode == "run":
+        safe = re.sub(r"[^A-Za-z0-9_-]", "-", run_id).strip("-_")[:56]
+        return f"run-{safe}"
+    digest = hashlib.blake2b(objective.strip().lower().encode("utf-8"), digest_size=8).hexdigest()
+    return f"objective-{digest}"
+
+class NamespaceRegistry:
+    """记录每个命名空间最近一次使用时间，用于找出长期未使用、可以整体删除的命名空间
+    
+    注册表是一个 JSON 文件（写入时先写临时文件再替换），键为 "<后端>:<命名空间>"。
+    每次操作在进程内的锁和旁路锁文件 <path>.lock 的排他锁（fcntl.flock）下重新读取、修改并写回，
+    多个进程共用一个注册表时不会互相覆盖；没有 fcntl 的平台上只保证进程内互斥。
+    """
+    
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self.lock_path = self.path.with_suffix(self.path.suffix + ".lock")
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        with self._locked():
+            self._reload()
+    
+    @contextlib.contextmanager
+    def _locked(self) -> Iterator[None]:
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.lock_path, "a") as lock_file:
+                # 关闭文件时自动释放，进程崩溃也不会留下锁
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+                yield
+    
+    def _reload(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            self._entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"读取命名空间注册表失败，将重新创建: {e}")
+    
+    def _save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = self.path.with_suffix(f"{self.path.suffix}.{os.getpid()}.tmp")
+        temp_path.write_text(json.dumps(self._entries, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(temp_path, self.path)
+    
+    def touch(self, backend: str, name: str, **info: Any) -> None:
+        """登记命名空间并更新最近使用时间"""
+        with self._locked():
+            self._reload()
+            entry = self._entries.setdefault(f"{backend}:{name}", {"backend": backend, "name": name, "created_at": time.time()})
+            entry.update(info)
+            entry["last_used"] = time.time()
+            self._save()
+    
+    def stale(self, backend: str, max_idle_seconds: float, exclude: Optional[List[str]] = None) -> List[str]:
+        """超过 max_idle_seconds 未使用的命名空间"""
+        cutoff = time.time() - max_idle_seconds
+        with self._locked():
+            self._reload()
+            return [
+                entry["name"] for entry in self._entries.values()
+                if entry["backend"] == backend and entry["last_used"] < cutoff and entry["name"] not in (exclude or [])
+            ]
+    
+    def remove(self, backend: str, name: str) -> None:
+        with self._locked():
+            self._reload()
+            if self._entries.pop(f"{backend}:{name}", None) is not None:
+                self._save()
+    
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(entry) for entry in self._entries.values()]
+
+_registry: Optional[NamespaceRegistry] = None
+_registry_lock = threading.Lock()
+
+def get_namespace_registry() -> NamespaceRegistry:
+    """获取进程内共享的命名空间注册表"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = NamespaceRegistry(config.VECTOR_NAMESPACE_REGISTRY)
+        return _registry
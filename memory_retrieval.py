@@ -0,0 +1,70 @@
+import re
+from typing import Any, List, Optional
+
+import numpy as np
+
+from prompt_builder import count_tokens
+
+# 在句末标点或换行之后切分（零宽匹配），标点留在句子里，句间空白留给下一句
+_SENTENCE_END = re.compile(r"(?<=[。！？；!?;\n])|(?<=\.)(?=\s)")
+
+def _split_long(sentence: str, max_tokens: int, model: Optional[str]) -> List[str]:
+    """把超过 max_tokens 的句子按字符数近似切开"""
+    tokens = count_tokens(sentence, model)
+    if tokens <= max_tokens:
+        return [sentence]
+    size = max(1, len(sentence) * max_tokens // tokens)
+    return [sentence[start:start + size] for start in range(0, len(sentence), size)]
+
+def chunk_text(text: str, chunk_tokens: int = 200, overlap_tokens: int = 40, model: Optional[str] = None) -> List[str]:
+    """按句子把文本切成不超过 chunk_tokens 的块，相邻块重叠约 overlap_tokens 个 token
+    
+    不足一块的文本原样返回一块。
+    """
+    if count_tokens(text, model) <= chunk_tokens:
+        return [text]
+    
+    sentences = [
+        piece
+        for sentence in _SENTENCE_END.split(text) if sentence.strip()
+        for piece in _split_long(sentence, chunk_tokens, model)
+    ]
+    sizes = [count_tokens(sentence, model) for sentence in sentences]
+    
+    chunks: List[str] = []
+    start = 0
+    while start < len(sentences):
+        end, total = start, 0
+        while end < len(sentences) and (end == start or total + sizes[end] <= chunk_tokens):
+            total += sizes[end]
+            end += 1
+        chunks.append("".join(sentences[start:end]).strip())
+        if end >= len(sentences):
+            break
+        # 下一块从末尾约 overlap_tokens 个 token 的句子开始（至少前进一句）
+        next_start, overlap = end, 0
+        while next_start - 1 > start and overlap + sizes[next_start - 1] <= overlap_tokens:
+            next_start -= 1
+            overlap += sizes[next_start]
+        start = next_start
+    return chunks
+
+def mmr_order(query: Any, vectors: Any, lambda_mult: float = 0.7) -> List[int]:
+    """最大边际相关性（MMR）排序：兼顾与查询的相关度和与已选结果的差异，返回候选下标顺序"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    query = np.asarray(query, dtype=np.float32)
+    relevance = matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+    
+    order: List[int] = []
+    # 每个候选与已选结果的最大相似度
+    redundancy = np.zeros(len(matrix), dtype=np.float32)
+    remaining = np.ones(len(matrix), dtype=bool)
+    while remaining.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy if order else relevance.copy()
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        order.append(best)
+        remaining[best] = False
+        redundancy = np.maximum(redundancy, matrix @ matrix[best])
+    return order
@@ -0,0 +1,262 @@
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from logger import get_logger
+
+logger = get_logger("numpy_vector_store")
+
+class NumpyVectorStore:
+    """进程内的 NumPy 向量存储（实现 Agent 用到的 Chroma 集合接口 add / query / count / get）
+    
+    向量归一化后写入内存映射的 float32 矩阵 <directory>/<name>.f32（容量按倍增扩展），
+    ID、文档和元数据逐行追加到旁路文件 <directory>/<name>.meta.jsonl，同一 ID 再次写入时覆盖原行。
+    查询用矩阵乘法计算余弦距离，argpartition 取 top-k；ivf_lists > 0 且向量足够多时，
+    先用球面 k-means 把向量分到 ivf_lists 个簇，查询只扫描与查询最接近的 nprobe 个簇。
+    """
+    
+    INITIAL_CAPACITY = 256
+    # 每个簇平均至少这么多向量时才启用 IVF，否则精确搜索更快也更准
+    IVF_MIN_PER_LIST = 32
+    
+    def __init__(
+        self,
+        directory: str,
+        name: str,
+        embedding_function: Optional[Callable[[List[str]], Any]] = None,
+        ivf_lists: int = 0,
+        nprobe: int = 4
+    ):
+        self.name = name
+        self.embedding_function = embedding_function
+        self.ivf_lists = max(0, ivf_lists)
+        self.nprobe = max(1, nprobe)
+        self.vectors_path = Path(directory) / f"{name}.f32"
+        self.meta_path = Path(directory) / f"{name}.meta.jsonl"
+        self._lock = threading.RLock()
+        
+        self._dim: Optional[int] = None
+        self._matrix: Optional[np.memmap] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._rows: Dict[str, int] = {}
+        
+        # IVF 索引：簇中心、每个簇的行号，以及建立索引时的向量数（数量翻倍后重建）
+        self._centroids: Optional[np.ndarray] = None
+        self._lists: List[List[int]] = []
+        self._indexed_count = 0
+        
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        self._load()
+    
+    def _load(self) -> None:
+        if not self.meta_path.exists():
+            return
+        
+        rows: Dict[int, Dict[str, Any]] = {}
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # 写了一半的最后一行
+                    continue
+                if "dim" in entry:
+                    self._dim = entry["dim"]
+                else:
+                    rows[entry["row"]] = entry
+        if self._dim is None:
+            return
+        
+        self._open_matrix(max(self.INITIAL_CAPACITY, self._capacity_on_disk()))
+        # 向量先于元数据写入，元数据中的行一定有对应的向量
+        for row in range(len(rows)):
+            entry = rows.get(row)
+            if entry is None:
+                break
+            self._ids.append(entry["id"])
+            self._documents.append(entry["document"])
+            self._metadatas.append(entry["metadata"])
+            self._rows[entry["id"]] = row
+        logger.info(f"已加载向量存储 {self.name}：{len(self._ids)} 条向量，维度 {self._dim}")
+    
+    def _capacity_on_disk(self) -> int:
+        if not self.vectors_path.exists():
+            return 0
+        return os.path.getsize(self.vectors_path) // (4 * self._dim)
+    
+    def _open_matrix(self, capacity: int) -> None:
+        if self._matrix is not None:
+            self._matrix.flush()
+            self._matrix = None
+        size = capacity * self._dim * 4
+        with open(self.vectors_path, "ab") as f:
+            if f.tell() < size:
+                f.truncate(size)
+        self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, self._dim))
+    
+    def _ensure_capacity(self, needed: int) -> None:
+        if needed > len(self._matrix):
+            capacity = len(self._matrix)
+            while capacity < needed:
+                capacity *= 2
+            self._open_matrix(capacity)
+    
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        if self.embedding_function is None:
+            raise ValueError("向量存储没有嵌入函数，必须直接提供嵌入")
+        return np.asarray(self.embedding_function(texts), dtype=np.float32)
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+    
+    def add(
+        self,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        embeddings: Optional[List[Any]] = None
+    ) -> None:
+        """写入向量（已存在的 ID 覆盖原行）"""
+        vectors = np.asarray(embeddings, dtype=np.float32) if embeddings is not None else self._embed(documents)
+        vectors = self._normalize(vectors)
+        
+        with self._lock:
+            if self._dim is None:
+                self._dim = vectors.shape[1]
+                with open(self.meta_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"dim": self._dim}) + "\n")
+                self._open_matrix(self.INITIAL_CAPACITY)
+            elif vectors.shape[1] != self._dim:
+                raise ValueError(f"嵌入维度 {vectors.shape[1]} 与向量存储的维度 {self._dim} 不一致")
+            
+            self._ensure_capacity(len(self._ids) + len(ids))
+            lines = []
+            for id_, document, metadata, vector in zip(ids, documents, metadatas, vectors):
+                row = self._rows.get(id_)
+                if row is None:
+                    row = len(self._ids)
+                    self._ids.append(id_)
+                    self._documents.append(document)
+                    self._metadatas.append(metadata)
+                    self._rows[id_] = row
+                    self._assign(row, vector)
+                else:
+                    self._documents[row] = document
+                    self._metadatas[row] = metadata
+                    # 覆盖后向量可能换了簇，下次查询时重建索引
+                    self._indexed_count = 0
+                self._matrix[row] = vector
+                lines.append(json.dumps({"row": row, "id": id_, "document": document, "metadata": metadata}, ensure_ascii=False))
+            self._matrix.flush()
+            
+            with open(self.meta_path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+    
+    def _assign(self, row: int, vector: np.ndarray) -> None:
+        """新向量加入最近的簇（索引尚未建立时跳过）"""
+        if self._centroids is not None and self._indexed_count:
+            self._lists[int(np.argmax(self._centroids @ vector))].append(row)
+    
+    def _build_index(self) -> None:
+        """球面 k-means：簇中心为簇内向量均值的单位化"""
+        count = len(self._ids)
+        matrix = np.asarray(self._matrix[:count])
+        rng = np.random.default_rng(0)
+        centroids = matrix[rng.choice(count, self.ivf_lists, replace=False)].copy()
+        for _ in range(10):
+            assignment = np.argmax(matrix @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, matrix)
+            filled = np.bincount(assignment, minlength=self.ivf_lists) > 0
+            centroids[filled] = self._normalize(sums[filled])
+        
+        assignment = np.argmax(matrix @ centroids.T, axis=1)
+        self._centroids = centroids
+        self._lists = [np.flatnonzero(assignment == index).tolist() for index in range(self.ivf_lists)]
+        self._indexed_count = count
+        logger.debug(f"向量存储 {self.name} 已重建 IVF 索引：{count} 条向量，{self.ivf_lists} 个簇")
+    
+    def _use_index(self) -> bool:
+        count = len(self._ids)
+        if not self.ivf_lists or count < self.ivf_lists * self.IVF_MIN_PER_LIST:
+            return False
+        if not self._indexed_count or count >= self._indexed_count * 2:
+            self._build_index()
+        return True
+    
+    def _search(self, query: np.ndarray, k: int) -> tuple:
+        count = len(self._ids)
+        if self._use_index():
+            probe = np.argpartition(-(self._centroids @ query), min(self.nprobe, self.ivf_lists) - 1)[:self.nprobe]
+            candidates = np.fromiter((row for index in probe for row in self._lists[index]), dtype=np.int64)
+        else:
+            candidates = None
+        
+        matrix = self._matrix[:count] if candidates is None else self._matrix[candidates]
+        scores = matrix @ query
+        k = min(k, len(scores))
+        if k == 0:
+            return np.array([], dtype=np.int64), scores[:0]
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        rows = top if candidates is None else candidates[top]
+        return rows, scores[top]
+    
+    def query(
+        self,
+        query_texts: Optional[List[str]] = None,
+        n_results: int = 10,
+        query_embeddings: Optional[List[Any]] = None,
+        include: Optional[List[str]] = None,
+        **kwargs: Any
+    ) -> Dict[str, List[List[Any]]]:
+        """按余弦距离返回最近的 n_results 条结果，结构与 Chroma 查询结果一致（include 含 embeddings 时返回归一化的向量）"""
+        queries = np.asarray(query_embeddings, dtype=np.float32) if query_embeddings is not None else self._embed(query_texts)
+        queries = self._normalize(queries)
+        
+        results: Dict[str, List[List[Any]]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with_embeddings = include is not None and "embeddings" in include
+        if with_embeddings:
+            results["embeddings"] = []
+        with self._lock:
+            for query in queries:
+                if not self._ids:
+                    rows, scores = [], []
+                else:
+                    rows, scores = self._search(query, n_results)
+                results["ids"].append([self._ids[row] for row in rows])
+                results["documents"].append([self._documents[row] for row in rows])
+                results["metadatas"].append([self._metadatas[row] for row in rows])
+                results["distances"].append([float(1.0 - score) for score in scores])
+                if with_embeddings:
+                    results["embeddings"].append([self._matrix[row].tolist() for row in rows])
+        return results
+    
+    def count(self) -> int:
+        return len(self._ids)
+    
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, List[Any]]:
+        """按 ID 或元数据等值条件读取"""
+        with self._lock:
+            rows = range(len(self._ids)) if ids is None else [self._rows[id_] for id_ in ids if id_ in self._rows]
+            if where:
+                rows = [row for row in rows if all(self._metadatas[row].get(key) == value for key, value in where.items())]
+            return {
+                "ids": [self._ids[row] for row in rows],
+                "documents": [self._documents[row] for row in rows],
+                "metadatas": [self._metadatas[row] for row in rows]
+            }
+
+def delete_store(directory: str, name: str) -> None:
+    """删除一个向量存储的矩阵文件和元数据文件"""
+    for suffix in (".f32", ".meta.jsonl"):
+        path = Path(directory) / f"{name}{suffix}"
+        if path.exists():
+            path.unlink()
@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+class EmbeddingPrioritizer:
+    """基于嵌入相似度的本地任务优先级评分器
+    
+    不调用 LLM，综合三个分量为待执行任务打分：
+    与总体目标的相似度、相对已完成任务的新颖度、以及等待时间（避免任务饿死）。
+    """
+    
+    def __init__(
+        self,
+        embedding_function: Callable[[List[str]], Any],
+        objective_weight: float = 0.6,
+        novelty_weight: float = 0.3,
+        age_weight: float = 0.1,
+        cache_size: int = 2048
+    ):
+        self.embedding_function = embedding_function
+        self.objective_weight = objective_weight
+        self.novelty_weight = novelty_weight
+        self.age_weight = age_weight
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, np.ndarray]" = OrderedDict()
+    
+    def _embed(self, texts: Sequence[str]) -> np.ndarray:
+        """批量获取归一化嵌入向量，已计算过的文本直接复用"""
+        missing = [text for text in dict.fromkeys(texts) if text not in self._cache]
+        if missing:
+            vectors = np.asarray(self.embedding_function(missing), dtype=np.float32)
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            vectors = vectors / np.maximum(norms, 1e-12)
+            for text, vector in zip(missing, vectors):
+                self._cache[text] = vector
+        
+        result = []
+        for text in texts:
+            self._cache.move_to_end(text)
+            result.append(self._cache[text])
+        
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return np.stack(result)
+    
+    def score(self, objective: str, pending: Sequence[Any], completed: Sequence[Any], now: Optional[float] = None) -> Dict[str, float]:
+        """计算每个待执行任务的得分，得分越高越应优先执行"""
+        if not pending:
+            return {}
+        
+        now = now or time.time()
+        task_vectors = self._embed([task.content for task in pending])
+        objective_vector = self._embed([objective])[0]
+        
+        # 与目标的余弦相似度
+        relevance = task_vectors @ objective_vector
+        
+        # 新颖度：1 - 与已完成任务的最大相似度
+        if completed:
+            completed_vectors = self._embed([task.content for task in completed])
+            novelty = 1.0 - (task_vectors @ completed_vectors.T).max(axis=1)
+        else:
+            novelty = np.ones(len(pending), dtype=np.float32)
+        
+        # 等待时间：按队列中最长等待时间归一化
+        ages = np.array([max(0.0, now - (task.created_at or now)) for task in pending], dtype=np.float32)
+        age_score = ages / ages.max() if ages.max() > 0 else np.zeros_like(ages)
+        
+        scores = (
+            self.objective_weight * relevance
+            + self.novelty_weight * novelty
+            + self.age_weight * age_score
+        )
+        return {task.id: float(score) for task, score in zip(pending, scores)}
+    
+    def rank(self, objective: str, pending: Sequence[Any], completed: Sequence[Any]) -> Dict[str, int]:
+        """返回任务 ID 到优先级的映射（1 = 最高优先级）"""
+        scores = self.score(objective, pending, completed)
+        ordered = sorted(pending, key=lambda task: -scores[task.id])
+        return {task.id: position for position, task in enumerate(ordered, 1)}
@@ -0,0 +1,109 @@
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import numpy as np
+
+from logger import get_logger
+
+logger = get_logger("progress")
+
+class ProgressMonitor:
+    """运行进展监测（收敛检测）
+    
+    新颖度 = 1 - 结果嵌入与最近 lookback 个结果的最大余弦相似度；同时记录每次迭代后任务队列的增长。
+    新颖度低于阈值且队列没有缩短的迭代记为停滞，连续 patience 次停滞即判定运行已收敛。
+    patience 为 0 时只统计不判定。结果嵌入保存在 lookback 行的环形矩阵中，内存不随运行长度增长。
+    """
+    
+    def __init__(
+        self,
+        embedding_function: Optional[Callable[[List[str]], Any]] = None,
+        novelty_threshold: float = 0.08,
+        patience: int = 3,
+        min_iterations: int = 5,
+        window: int = 10,
+        lookback: int = 50
+    ):
+        self.embedding_function = embedding_function
+        self.novelty_threshold = novelty_threshold
+        self.patience = max(0, patience)
+        self.min_iterations = min_iterations
+        self._window = window
+        self.lookback = max(1, lookback)
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self) -> None:
+        """清空已观测的结果，开始新的运行时调用"""
+        with self._lock:
+            # 最近 lookback 个结果嵌入的环形矩阵，前 _size 行有效，下一次写入第 _next 行
+            self._vectors: Optional[np.ndarray] = None
+            self._size = 0
+            self._next = 0
+            self._last_queue_size: Optional[int] = None
+            self._samples: Deque[Dict[str, Any]] = deque(maxlen=self._window)
+            self.observed = 0
+            self.stale_streak = 0
+    
+    def _embed(self, text: str) -> Optional[np.ndarray]:
+        if self.embedding_function is None or not text:
+            return None
+        try:
+            vector = np.asarray(self.embedding_function([text]), dtype=np.float32)[0]
+        except Exception as e:
+            logger.warning(f"计算结果嵌入失败，本次迭代不参与收敛检测: {e}")
+            return None
+        return vector / max(float(np.linalg.norm(vector)), 1e-12)
+    
+    def _add_vector(self, vector: np.ndarray) -> None:
+        if self._vectors is None or vector.shape[0] != self._vectors.shape[1]:
+            self._vectors = np.empty((self.lookback, vector.shape[0]), dtype=np.float32)
+            self._size = self._next = 0
+        self._vectors[self._next] = vector
+        self._next = (self._next + 1) % self.lookback
+        self._size = min(self._size + 1, self.lookback)
+    
+    def observe(self, result: str, queue_size: int) -> Dict[str, Any]:
+        """记录一次迭代的结果和迭代后的队列长度，返回本次的新颖度、队列增长和是否停滞"""
+        vector = self._embed(result)
+        
+        with self._lock:
+            novelty = None
+            if vector is not None:
+                if self._size and vector.shape[0] == self._vectors.shape[1]:
+                    novelty = 1.0 - float(np.max(self._vectors[:self._size] @ vector))
+                else:
+                    novelty = 1.0
+                self._add_vector(vector)
+            
+            growth = 0 if self._last_queue_size is None else queue_size - self._last_queue_size
+            self._last_queue_size = queue_size
+            self.observed += 1
+            
+            stale = novelty is not None and novelty < self.novelty_threshold and growth >= 0
+            self.stale_streak = self.stale_streak + 1 if stale else 0
+            sample = {"novelty": novelty, "queue_growth": growth, "stale": stale}
+            self._samples.append(sample)
+            
+            if stale:
+                logger.info(f"迭代结果新颖度 {novelty:.3f} 低于阈值，连续停滞 {self.stale_streak} 次")
+            return sample
+    
+    @property
+    def converged(self) -> bool:
+        """连续停滞次数达到 patience（且已观测足够多的迭代）"""
+        return 0 < self.patience <= self.stale_streak and self.observed >= self.min_iterations
+    
+    def summary(self) -> Dict[str, Any]:
+        """最近窗口内的新颖度和队列增长统计"""
+        with self._lock:
+            novelties = [sample["novelty"] for sample in self._samples if sample["novelty"] is not None]
+            return {
+                "observed": self.observed,
+                "stale_streak": self.stale_streak,
+                "last_novelty": novelties[-1] if novelties else None,
+                "avg_novelty": sum(novelties) / len(novelties) if novelties else None,
+                "avg_queue_growth": sum(s["queue_growth"] for s in self._samples) / len(self._samples) if self._samples else 0.0,
+                "converged": self.converged
+            }
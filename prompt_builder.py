@@ -0,0 +1,147 @@
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import tiktoken
+
+from logger import get_logger
+
+logger = get_logger("prompt")
+
+# 中日韩字符在常见编码中约占一个 token，其余文本约 4 个字符一个 token
+_CJK = re.compile(r"[\u3000-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+
+@lru_cache(maxsize=None)
+def get_encoder(model: Optional[str] = None) -> Optional[Any]:
+    """获取 tiktoken 编码器，按模型缓存
+    
+    未知模型使用 cl100k_base；编码文件无法加载（如离线环境）时返回 None，改用估算。
+    """
+    try:
+        if model:
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"无法加载 tiktoken 编码器，改用估算 token 数: {e}")
+        return None
+
+def estimate_tokens(text: str) -> int:
+    """不依赖编码器的 token 数估算"""
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def count_tokens(text: str, model: Optional[str] = None) -> int:
+    """计算文本的 token 数"""
+    if not text:
+        return 0
+    encoder = get_encoder(model)
+    if encoder is None:
+        return estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+@dataclass
+class PromptSection:
+    """提示词中可裁剪的片段
+    
+    priority 越小越重要，预算不足时优先裁剪 priority 大的片段；
+    keep 决定裁剪时保留开头（head）还是结尾（tail）。
+    """
+    text: str
+    priority: int = 1
+    keep: str = "head"
+
+class PromptBuilder:
+    """按 token 预算组装提示词"""
+    
+    TRIM_MARKER = "...（已省略）"
+    
+    def __init__(self, budget: int, model: Optional[str] = None):
+        self.budget = budget
+        self.model = model
+        self.prompt_tokens = 0
+        self.trimmed: List[str] = []
+    
+    def count(self, text: str) -> int:
+        return count_tokens(text, self.model)
+    
+    def render(self, template: str, **values: Any) -> str:
+        """填充模板（str.format 语法），PromptSection 类型的值按预算裁剪"""
+        sections = {name: value for name, value in values.items() if isinstance(value, PromptSection)}
+        fixed = {name: value for name, value in values.items() if name not in sections}
+        
+        # 模板和固定字段的开销
+        fixed_tokens = self.count(template.format(**fixed, **{name: "" for name in sections}))
+        remaining = max(0, self.budget - fixed_tokens)
+        
+        # 按重要程度依次分配剩余预算
+        rendered: Dict[str, str] = {}
+        for name in sorted(sections, key=lambda key: sections[key].priority):
+            section = sections[name]
+            text = self._fit(section.text, remaining, section.keep)
+            if text != section.text:
+                self.trimmed.append(name)
+            rendered[name] = text
+            remaining = max(0, remaining - self.count(text))
+        
+        prompt = template.format(**fixed, **rendered)
+        self.prompt_tokens = self.count(prompt)
+        if self.trimmed:
+            logger.debug(f"提示词超出预算 {self.budget}，已裁剪: {', '.join(self.trimmed)}")
+        return prompt
+    
+    def _fit(self, text: str, max_tokens: int, keep: str) -> str:
+        """裁剪文本至 max_tokens 以内，多行文本按整行裁剪"""
+        if self.count(text) <= max_tokens:
+            return text
+        
+        marker_tokens = self.count(self.TRIM_MARKER) + 1
+        if max_tokens <= marker_tokens:
+            return ""
+        allowance = max_tokens - marker_tokens
+        
+        lines = text.splitlines()
+        if len(lines) > 1:
+            kept = self._fit_lines(lines, allowance, keep)
+            if kept:
+                return self._join(kept, keep)
+        return self._join([self._fit_chars(text, allowance, keep)], keep)
+    
+    def _fit_lines(self, lines: List[str], max_tokens: int, keep: str) -> List[str]:
+        """二分查找能放入预算的最多行数"""
+        low, high = 0, len(lines)
+        while low < high:
+            middle = (low + high + 1) // 2
+            chunk = lines[:middle] if keep == "head" else lines[-middle:]
+            if self.count("\n".join(chunk)) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        if low == 0:
+            return []
+        return lines[:low] if keep == "head" else lines[-low:]
+    
+    def _fit_chars(self, text: str, max_tokens: int, keep: str) -> str:
+        encoder = get_encoder(self.model)
+        if encoder is not None:
+            tokens = encoder.encode(text, disallowed_special=())
+            tokens = tokens[:max_tokens] if keep == "head" else tokens[-max_tokens:]
+            return encoder.decode(tokens)
+        
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            chunk = text[:middle] if keep == "head" else text[-middle:]
+            if estimate_tokens(chunk) <= max_tokens:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low] if keep == "head" else text[len(text) - low:]
+    
+    def _join(self, parts: List[str], keep: str) -> str:
+        body = "\n".join(parts)
+        return f"{body}\n{self.TRIM_MARKER}" if keep == "head" else f"{self.TRIM_MARKER}\n{body}"
+
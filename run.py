@@ -23,7 +23,7 @@ project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
 try:
-    from app import app
+    from app import app, restore_interrupted_agents
     from config import config
     from logger import get_logger
     
@@ -43,6 +43,11 @@ try:
             logger.info(f"API 文档: http://{config.API_HOST}:{config.API_PORT}/api/info")
             logger.info("="*50)
             
+            # 恢复上次中断的 Agent
+            restored = restore_interrupted_agents()
+            if restored:
+                logger.info(f"已恢复 {restored} 个中断的 Agent")
+            
             # 启动 Flask 应用
             app.run(
                 host=config.API_HOST,
@@ -0,0 +1,88 @@
+import json
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Deque, Dict, Iterator, List
+
+from logger import get_logger
+
+logger = get_logger("run_history")
+
+class RunHistory:
+    """有界的迭代记录
+    
+    内存中只保留最近 max_in_memory 条记录，更早的记录追加到 <directory>/<run_id>.jsonl，
+    并记下每行的文件偏移，按页读取时直接定位，无需扫描整个文件。
+    """
+    
+    def __init__(self, run_id: str, directory: str, max_in_memory: int = 100):
+        self.run_id = run_id
+        self.path = Path(directory) / f"{run_id}.jsonl"
+        # 流水线调度在下一条记录追加后才补全上一条的规划结果，至少保留两条
+        self.max_in_memory = max(2, max_in_memory)
+        self._recent: Deque[Dict[str, Any]] = deque()
+        self._offsets: List[int] = []
+        self._size = 0
+        self._lock = threading.Lock()
+    
+    def append(self, record: Dict[str, Any]) -> None:
+        """追加一条记录，超出内存上限时把最早的记录写入磁盘"""
+        with self._lock:
+            self._recent.append(record)
+            if len(self._recent) > self.max_in_memory:
+                self._spill(self._recent.popleft())
+    
+    def _spill(self, record: Dict[str, Any]) -> None:
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        if not self._offsets:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            logger.debug(f"运行 {self.run_id} 的早期迭代记录开始写入 {self.path}")
+        with open(self.path, "ab") as f:
+            f.write(line)
+        self._offsets.append(self._size)
+        self._size += len(line)
+    
+    def recent(self) -> List[Dict[str, Any]]:
+        """内存中的最近记录"""
+        with self._lock:
+            return list(self._recent)
+    
+    def page(self, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """按追加顺序读取 [offset, offset + limit) 范围内的记录"""
+        with self._lock:
+            total = len(self._offsets) + len(self._recent)
+            start, end = max(0, offset), min(total, max(0, offset) + max(0, limit))
+            if start >= end:
+                return []
+            
+            records = []
+            spilled = len(self._offsets)
+            if start < spilled:
+                with open(self.path, "rb") as f:
+                    f.seek(self._offsets[start])
+                    for _ in range(start, min(end, spilled)):
+                        records.append(json.loads(f.readline()))
+            for index in range(max(start, spilled), end):
+                records.append(self._recent[index - spilled])
+            return records
+    
+    def __len__(self) -> int:
+        return len(self._offsets) + len(self._recent)
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.page(0, len(self)))
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"total": len(self._offsets) + len(self._recent), "in_memory": len(self._recent), "spilled": len(self._offsets)}
+    
+    def clear(self) -> None:
+        """清空记录并删除溢出文件"""
+        with self._lock:
+            self._recent.clear()
+            self._offsets = []
+            self._size = 0
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
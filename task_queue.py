@@ -0,0 +1,147 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from custom_babyagi import Task
+
+# 无法解析的优先级排在最后
+_FALLBACK_PRIORITY = float("inf")
+
+class TaskQueue:
+    """基于堆的任务优先级队列
+    
+    优先级数字越小越先出队，相同优先级按入队顺序出队。
+    push/pop/按 ID 删除和调整优先级均为 O(log n)（删除采用惰性标记），
+    按优先级排序的快照会缓存到下一次修改为止。
+    堆条目为 [优先级, 入队顺序, 推入序号, 任务]：调整优先级后重新推入的条目沿用入队顺序，
+    但推入序号每次都是新的，与同键的失效条目比较时不会比较到任务本身。
+    """
+    
+    def __init__(self, tasks: Iterable[Task] = ()):
+        self._heap: List[list] = []
+        self._entries: Dict[str, list] = {}
+        self._counter = itertools.count()
+        self._push_counter = itertools.count()
+        self._snapshot: Optional[Tuple[Task, ...]] = None
+        self.extend(tasks)
+    
+    @staticmethod
+    def _priority_key(priority: Any) -> float:
+        """LLM 返回的优先级可能是字符串，统一转换为可比较的数字"""
+        try:
+            return float(priority)
+        except (TypeError, ValueError):
+            return _FALLBACK_PRIORITY
+    
+    def _push_entry(self, task: Task, seq: int) -> None:
+        entry = [self._priority_key(task.priority), seq, next(self._push_counter), task]
+        heapq.heappush(self._heap, entry)
+        self._entries[task.id] = entry
+        self._snapshot = None
+    
+    def _discard_entry(self, task_id: str) -> Optional[Task]:
+        entry = self._entries.pop(task_id, None)
+        if entry is None:
+            return None
+        
+        # 惰性删除：标记失效，出队时跳过
+        task = entry[3]
+        entry[3] = None
+        self._snapshot = None
+        if len(self._heap) > 2 * len(self._entries) + 32:
+            self._compact()
+        return task
+    
+    def _compact(self) -> None:
+        """清理已失效的堆条目"""
+        self._heap = [entry for entry in self._heap if entry[3] is not None]
+        heapq.heapify(self._heap)
+    
+    def push(self, task: Task) -> None:
+        """入队任务；同 ID 的任务已存在时替换原任务"""
+        previous = self._entries.get(task.id)
+        seq = previous[1] if previous is not None else next(self._counter)
+        self._discard_entry(task.id)
+        self._push_entry(task, seq)
+    
+    def extend(self, tasks: Iterable[Task]) -> None:
+        """批量入队任务"""
+        for task in tasks:
+            self.push(task)
+    
+    def pop(self) -> Task:
+        """出队优先级最高的任务"""
+        while self._heap:
+            entry = heapq.heappop(self._heap)
+            task = entry[3]
+            if task is not None:
+                del self._entries[task.id]
+                self._snapshot = None
+                return task
+        raise IndexError("pop from empty TaskQueue")
+    
+    def peek(self) -> Optional[Task]:
+        """查看优先级最高的任务但不出队"""
+        while self._heap and self._heap[0][3] is None:
+            heapq.heappop(self._heap)
+        return self._heap[0][3] if self._heap else None
+    
+    def get(self, task_id: str) -> Optional[Task]:
+        """按 ID 获取任务"""
+        entry = self._entries.get(task_id)
+        return entry[3] if entry is not None else None
+    
+    def remove(self, task_id: str) -> Optional[Task]:
+        """按 ID 删除任务"""
+        return self._discard_entry(task_id)
+    
+    def update_priority(self, task_id: str, priority: Any) -> bool:
+        """按 ID 调整任务优先级，保留原入队顺序用于同优先级排序"""
+        entry = self._entries.get(task_id)
+        if entry is None:
+            return False
+        
+        task = entry[3]
+        task.priority = priority
+        if self._priority_key(priority) != entry[0]:
+            self._discard_entry(task_id)
+            self._push_entry(task, entry[1])
+        return True
+    
+    def reprioritize(self, priority_map: Dict[str, Any]) -> int:
+        """批量调整优先级，返回实际更新的任务数"""
+        return sum(
+            1 for task_id, priority in priority_map.items()
+            if self.update_priority(task_id, priority)
+        )
+    
+    def task_ids(self) -> List[str]:
+        """返回队列中全部任务 ID（无序）"""
+        return list(self._entries)
+    
+    def snapshot(self) -> Tuple[Task, ...]:
+        """按优先级排序的只读快照，队列未修改时直接复用"""
+        if self._snapshot is None:
+            self._snapshot = tuple(entry[3] for entry in sorted(self._entries.values(), key=lambda e: (e[0], e[1])))
+        return self._snapshot
+    
+    def clear(self) -> None:
+        """清空队列"""
+        self._heap.clear()
+        self._entries.clear()
+        self._snapshot = None
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def __bool__(self) -> bool:
+        return bool(self._entries)
+    
+    def __contains__(self, task_id: object) -> bool:
+        return task_id in self._entries
+    
+    def __iter__(self) -> Iterator[Task]:
+        return iter(self.snapshot())
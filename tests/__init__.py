@@ -3,4 +3,19 @@
 BabyAGI Agent 系统测试包
 
 这个包包含了系统各个组件的单元测试和集成测试。
-"""
\ No newline at end of file
+"""
+
+import atexit
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from config import config
+
+# 测试中创建的 Agent 默认开启运行日志，写入临时目录，不在工作目录下留下运行记录
+_checkpoint_dir = tempfile.mkdtemp(prefix="babyagi-test-checkpoints-")
+config.CHECKPOINT_DIR = _checkpoint_dir
+atexit.register(shutil.rmtree, _checkpoint_dir, True)
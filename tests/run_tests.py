@@ -26,7 +26,8 @@ def run_all_tests():
     # 发现并运行所有测试
     test_dir = Path(__file__).parent
     loader = unittest.TestLoader()
-    suite = loader.discover(test_dir, pattern='test_*.py')
+    # 以项目根目录为顶层导入测试模块，使 tests 包的初始化（临时运行日志目录）生效
+    suite = loader.discover(test_dir, pattern='test_*.py', top_level_dir=str(project_root))
     
     # 创建测试运行器
     stream = StringIO()
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Agent 运行时测试
+
+测试在共享事件循环中提交、并发运行和取消协程。
+"""
+
+import unittest
+import asyncio
+import concurrent.futures
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from agent_runtime import AgentRuntime
+
+
+class TestAgentRuntime(unittest.TestCase):
+    """Agent 运行时测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.runtime = AgentRuntime()
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.runtime.shutdown()
+    
+    def test_submit_returns_result(self):
+        """测试提交协程并获取结果"""
+        async def work():
+            await asyncio.sleep(0.01)
+            return "done"
+        
+        future = self.runtime.submit(work())
+        self.assertEqual(future.result(timeout=5), "done")
+    
+    def test_coroutines_share_one_loop(self):
+        """测试多个协程在同一个事件循环中并发运行"""
+        async def current_loop():
+            await asyncio.sleep(0.05)
+            return id(asyncio.get_running_loop())
+        
+        futures = [self.runtime.submit(current_loop()) for _ in range(50)]
+        loop_ids = {future.result(timeout=5) for future in futures}
+        
+        self.assertEqual(len(loop_ids), 1)
+    
+    def test_cancel_running_coroutine(self):
+        """测试取消运行中的协程"""
+        started = concurrent.futures.Future()
+        
+        async def long_running():
+            started.set_result(True)
+            await asyncio.sleep(60)
+        
+        future = self.runtime.submit(long_running())
+        started.result(timeout=5)
+        future.cancel()
+        
+        with self.assertRaises(concurrent.futures.CancelledError):
+            future.result(timeout=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
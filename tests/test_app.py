@@ -506,6 +506,32 @@ class TestFlaskApp(unittest.TestCase):
         
         # 应该仍然能处理，但可能返回错误
         self.assertIn(response.status_code, [400, 415])
+    
+    def test_delete_agent_closes_agent(self):
+        """测试删除 Agent 时关闭它的私有事件循环和写缓冲"""
+        agent = MagicMock()
+        agent.llm_pool = None
+        running_agents["agent-1"] = {"id": "agent-1", "agent": agent, "status": "completed"}
+        
+        response = self.client.delete('/api/agents/agent-1')
+        
+        self.assertEqual(response.status_code, 200)
+        agent.close.assert_called_once()
+        self.assertNotIn("agent-1", running_agents)
+    
+    @patch('app.EnhancedBabyAGI')
+    def test_quick_run_closes_agent_on_error(self, mock_babyagi):
+        """测试一次性执行出错时同样关闭 Agent"""
+        mock_babyagi.return_value.run.side_effect = RuntimeError("失败")
+        
+        response = self.client.post(
+            '/api/execute',
+            data=json.dumps({"objective": "测试目标"}),
+            content_type='application/json'
+        )
+        
+        self.assertEqual(response.status_code, 500)
+        mock_babyagi.return_value.close.assert_called_once()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""
+基准测试脚本测试
+
+测试内存向量存储、脚本化假 LLM 以及基准测试的输出格式。
+"""
+
+import unittest
+import asyncio
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from benchmark import HashEmbedding, InMemoryVectorStore, ScriptedLLM, StageTimer, STAGES, main
+
+
+class TestInMemoryVectorStore(unittest.TestCase):
+    """内存向量存储测试"""
+    
+    def test_query_returns_nearest_documents(self):
+        """测试按相似度返回最近的文档，结构与 Chroma 查询结果一致"""
+        store = InMemoryVectorStore(HashEmbedding())
+        documents = [f"文档{i} " + "abc" * i for i in range(40)]
+        store.add(documents, [{"task": f"任务{i}"} for i in range(40)], [f"id-{i}" for i in range(40)])
+        
+        results = store.query(query_texts=[documents[7]], n_results=3)
+        
+        self.assertEqual(store.count(), 40)
+        self.assertEqual(results["ids"][0][0], "id-7")
+        self.assertEqual(len(results["documents"][0]), 3)
+        self.assertEqual(results["metadatas"][0][0], {"task": "任务7"})
+        self.assertEqual(store.get(ids=["id-3"])["documents"], [documents[3]])
+
+
+class TestScriptedLLM(unittest.TestCase):
+    """脚本化假 LLM 测试"""
+    
+    def test_responses_follow_prompt_type(self):
+        """测试按提示词类型返回可解析的 JSON"""
+        llm = ScriptedLLM(StageTimer(), new_tasks=2)
+        
+        created = json.loads(asyncio.run(llm.generate("基于以下已完成的任务，创建新的任务来推进总体目标的实现。")))
+        ordered = json.loads(llm.respond("请为以下任务列表重新分配优先级\n1. [1] 甲 (ID: a)\n2. [2] 乙 (ID: b)"))
+        
+        self.assertEqual(len(created), 2)
+        self.assertNotEqual(created[0]["content"], created[1]["content"])
+        self.assertEqual(ordered, [{"id": "a", "priority": 2}, {"id": "b", "priority": 1}])
+
+
+class TestBenchmarkReport(unittest.TestCase):
+    """基准测试输出测试"""
+    
+    def test_report_is_machine_readable(self):
+        """测试两种引擎、多个 Agent 的结果写入 JSON 文件"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output = os.path.join(temp_dir, "bench.json")
+            main(["--iterations", "3", "--agents", "1", "2", "--output", output])
+            with open(output, encoding="utf-8") as f:
+                report = json.load(f)
+        
+        self.assertEqual(len(report["results"]), 4)
+        for result in report["results"]:
+            self.assertEqual(result["completed_iterations"], 3 * result["agents"])
+            self.assertEqual(result["statuses"], ["max_iterations_reached"])
+            for stage in STAGES:
+                self.assertGreater(result["stage_calls"][stage], 0)
+                self.assertGreaterEqual(result["per_iteration_us"][stage], 0)
+        self.assertEqual({result["engine"] for result in report["results"]}, {"custom", "enhanced"})
+    
+    def test_iterations_beyond_memory_window_are_counted(self):
+        """测试超出内存保留窗口的迭代也计入完成数，溢出的记录写入临时目录"""
+        with tempfile.TemporaryDirectory() as temp_dir, \
+             patch.object(config, "RUN_HISTORY_IN_MEMORY", 2), \
+             patch.object(config, "RUN_HISTORY_DIR", temp_dir):
+            output = os.path.join(temp_dir, "bench.json")
+            main(["--engine", "custom", "--iterations", "6", "--agents", "1", "--output", output])
+            with open(output, encoding="utf-8") as f:
+                result = json.load(f)["results"][0]
+            
+            self.assertEqual(result["completed_iterations"], 6)
+            self.assertEqual(os.listdir(temp_dir), ["bench.json"])
+    
+    def test_repeated_prioritization_rounds_complete(self):
+        """测试多轮 LLM 重排优先级（同一任务的优先级反复变化）不会中断运行"""
+        for scheduler, planning, new_tasks in (("serial", "separate", "2"), ("dag", "fused", "3")):
+            with self.subTest(scheduler=scheduler, planning=planning), tempfile.TemporaryDirectory() as temp_dir:
+                output = os.path.join(temp_dir, "bench.json")
+                main([
+                    "--engine", "custom", "--iterations", "20", "--agents", "1",
+                    "--scheduler", scheduler, "--planning", planning, "--new-tasks", new_tasks,
+                    "--output", output
+                ])
+                with open(output, encoding="utf-8") as f:
+                    result = json.load(f)["results"][0]
+                
+                self.assertEqual(result["statuses"], ["max_iterations_reached"])
+                self.assertEqual(result["completed_iterations"], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+运行日志与恢复测试
+
+测试追加式日志、快照压缩、崩溃恢复以及服务启动时恢复中断的 Agent。
+"""
+
+import unittest
+import tempfile
+import json
+import threading
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from checkpoint import RunJournal
+from custom_babyagi import CustomBabyAGI, Task
+from config import config
+
+
+def task_dict(task_id, content, priority=1):
+    return Task(id=task_id, content=content, priority=priority).to_dict()
+
+
+class TestRunJournal(unittest.TestCase):
+    """运行日志测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.directory = self.temp_dir.name
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+    
+    def _record_run(self, journal):
+        journal.record("run_started", objective="目标", initial_task="初始任务", max_iterations=5)
+        journal.record("tasks_added", tasks=[task_dict("t1", "初始任务")])
+        completed = dict(task_dict("t1", "初始任务"), status="completed", result="结果")
+        journal.record("task_completed", task=completed, iteration_result={"iteration": 1, "result": "结果"})
+        journal.record(
+            "planned",
+            iteration=1,
+            new_tasks=[task_dict("t2", "任务二", 2), task_dict("t3", "任务三", 1)],
+            priorities={"t2": 1, "t3": 2}
+        )
+    
+    def test_state_rebuilt_from_journal(self):
+        """测试从日志重放得到与内存一致的状态"""
+        journal = RunJournal("run-1", self.directory)
+        self._record_run(journal)
+        
+        state = RunJournal("run-1", self.directory).load_state()
+        
+        self.assertEqual(state, journal.state)
+        self.assertEqual(state["status"], "running")
+        self.assertEqual(state["current_iteration"], 1)
+        self.assertEqual([task["id"] for task in state["completed"]], ["t1"])
+        self.assertEqual({task_id: task["priority"] for task_id, task in state["pending"].items()}, {"t2": 1, "t3": 2})
+        self.assertEqual(len(state["iterations"][0]["new_tasks"]), 2)
+    
+    def test_snapshot_compacts_journal(self):
+        """测试写入快照后清空日志，且快照加日志可以还原状态"""
+        journal = RunJournal("run-1", self.directory, snapshot_every=3)
+        self._record_run(journal)
+        
+        journal_lines = (journal.path / RunJournal.JOURNAL_FILE).read_text(encoding="utf-8").splitlines()
+        self.assertEqual(len(journal_lines), 1)
+        self.assertTrue((journal.path / RunJournal.SNAPSHOT_FILE).exists())
+        
+        state = RunJournal("run-1", self.directory).load_state()
+        self.assertEqual(state, journal.state)
+    
+    def test_events_already_in_snapshot_are_skipped(self):
+        """测试快照写入后、清空日志前崩溃时不会重复应用事件"""
+        journal = RunJournal("run-1", self.directory)
+        self._record_run(journal)
+        journal_path = journal.path / RunJournal.JOURNAL_FILE
+        saved = journal_path.read_text(encoding="utf-8")
+        journal.snapshot()
+        journal_path.write_text(saved, encoding="utf-8")
+        
+        state = RunJournal("run-1", self.directory).load_state()
+        
+        self.assertEqual(len(state["completed"]), 1)
+        self.assertEqual(len(state["iterations"]), 1)
+    
+    def test_state_is_bounded(self):
+        """测试状态只保留最近的已完成任务和迭代记录，迭代记录不重复保存结果"""
+        journal = RunJournal("run-1", self.directory, max_completed=3, max_iterations=2)
+        for i in range(1, 6):
+            completed = dict(task_dict(f"t{i}", f"任务{i}"), status="completed", result=f"结果{i}")
+            journal.record("task_completed", task=completed, iteration_result={"iteration": i, "result": f"结果{i}"})
+        
+        state = journal.state
+        
+        self.assertEqual([task["id"] for task in state["completed"]], ["t3", "t4", "t5"])
+        self.assertEqual(state["completed_count"], 5)
+        self.assertEqual(state["iterations"], [{"iteration": 4}, {"iteration": 5}])
+        self.assertEqual(state["current_iteration"], 5)
+    
+    def test_torn_last_line_ignored(self):
+        """测试崩溃时写了一半的最后一行被忽略"""
+        journal = RunJournal("run-1", self.directory)
+        self._record_run(journal)
+        with open(journal.path / RunJournal.JOURNAL_FILE, "a", encoding="utf-8") as f:
+            f.write('{"seq": 5, "type": "run_fin')
+        
+        state = RunJournal("run-1", self.directory).load_state()
+        
+        self.assertEqual(state["seq"], 4)
+        self.assertEqual(state["status"], "running")
+    
+    def test_finished_run_is_removed(self):
+        """测试运行结束后删除运行目录，之后再记录时从空状态开始"""
+        journal = RunJournal("run-1", self.directory, snapshot_every=2)
+        journal.record("run_started", objective="目标", initial_task=None, max_iterations=3)
+        journal.record("tasks_added", tasks=[task_dict("t1", "初始任务")])
+        self.assertTrue((Path(self.directory) / "run-1" / RunJournal.SNAPSHOT_FILE).exists())
+        
+        journal.record("run_finished", status="completed")
+        
+        self.assertFalse((Path(self.directory) / "run-1").exists())
+        self.assertEqual(RunJournal.list_runs(self.directory), [])
+        self.assertIsNone(RunJournal("run-1", self.directory).load_state())
+        journal.record("run_started", objective="目标", initial_task=None, max_iterations=3)
+        self.assertEqual(journal.load_state()["seq"], 1)
+    
+    def test_list_runs(self):
+        """测试列出已有记录的运行"""
+        self.assertEqual(RunJournal.list_runs(self.directory), [])
+        RunJournal("b", self.directory).record("run_started", objective="目标", initial_task=None, max_iterations=3)
+        RunJournal("a", self.directory).record("run_started", objective="目标", initial_task=None, max_iterations=3)
+        
+        self.assertEqual(RunJournal.list_runs(self.directory), ["a", "b"])
+
+
+class TestResume(unittest.TestCase):
+    """Agent 崩溃恢复测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.executed = []
+        self.planned = False
+        patcher = patch.multiple(config, CHECKPOINT_ENABLED=True, CHECKPOINT_DIR=self.temp_dir.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+    
+    async def _fake_llm(self, prompt, max_tokens=1000):
+        if "执行结果:" in prompt:
+            task_line = [line for line in prompt.splitlines() if line.startswith("当前任务:")][0]
+            self.executed.append(task_line.split(":", 1)[1].strip())
+            return "完成"
+        if "创建新的任务" in prompt and not self.planned:
+            self.planned = True
+            return json.dumps([{"content": "任务二"}, {"content": "任务三"}, {"content": "任务四"}], ensure_ascii=False)
+        return "[]"
+    
+    def _patches(self):
+        return (
+            patch.object(CustomBabyAGI, '_init_vector_db', return_value=MagicMock()),
+            patch.object(CustomBabyAGI, '_init_llm', return_value=self._fake_llm)
+        )
+    
+    def test_resume_continues_without_repeating_llm_calls(self):
+        """测试恢复后从中断处继续，已完成任务不再调用 LLM"""
+        vector_db_patch, llm_patch = self._patches()
+        with vector_db_patch, llm_patch:
+            agent = CustomBabyAGI(objective="测试目标", initial_task="任务一", run_id="run-1")
+            agent.scheduler_mode = "serial"
+            # 模拟进程在写入结束事件前崩溃
+            record = agent.journal.record
+            
+            def record_until_crash(event_type, **data):
+                if event_type != "run_finished":
+                    record(event_type, **data)
+            
+            agent.journal.record = record_until_crash
+            agent.run(max_iterations=2)
+            agent.close()
+        
+        self.assertEqual(RunJournal("run-1", self.temp_dir.name).load_state()["status"], "running")
+        self.assertEqual(self.executed, ["任务一", "任务二"])
+        
+        with vector_db_patch, llm_patch:
+            resumed = CustomBabyAGI.resume("run-1")
+            resumed.scheduler_mode = "serial"
+            self.assertEqual(resumed.current_iteration, 2)
+            self.assertEqual([task.content for task in resumed.completed_tasks], ["任务一", "任务二"])
+            self.assertEqual(len(resumed.task_list), 2)
+            
+            results = resumed.run(max_iterations=4)
+            resumed.close()
+        
+        self.assertEqual(self.executed, ["任务一", "任务二", "任务三", "任务四"])
+        self.assertEqual([item["iteration"] for item in results["iterations"]], [1, 2, 3, 4])
+        self.assertEqual(results["run_id"], "run-1")
+        self.assertEqual(RunJournal.list_runs(self.temp_dir.name), [])
+    
+    def test_journal_written_off_event_loop(self):
+        """测试运行日志（包括快照前写入向量数据库）在线程池中写入，不阻塞事件循环"""
+        vector_db_patch, llm_patch = self._patches()
+        with vector_db_patch, llm_patch:
+            agent = CustomBabyAGI(objective="测试目标", initial_task="任务一", run_id="run-1")
+        threads = []
+        agent.journal = MagicMock()
+        agent.journal.record.side_effect = lambda *args, **kwargs: threads.append(threading.current_thread())
+        
+        agent.run(max_iterations=1)
+        agent.close()
+        
+        self.assertTrue(threads)
+        self.assertNotIn(threading.main_thread(), threads)
+    
+    def test_resume_unknown_run_raises(self):
+        """测试恢复不存在的运行时抛出异常"""
+        with self.assertRaises(ValueError):
+            CustomBabyAGI.resume("missing")
+
+
+class TestRestoreInterruptedAgents(unittest.TestCase):
+    """服务启动时恢复中断 Agent 测试"""
+    
+    def test_only_running_agents_restored(self):
+        """测试只恢复中断时仍在运行的 Agent"""
+        import app as app_module
+        
+        with tempfile.TemporaryDirectory() as directory, \
+             patch.multiple(config, CHECKPOINT_ENABLED=True, CHECKPOINT_DIR=directory, API_DEBUG=False), \
+             patch.object(app_module.EnhancedBabyAGI, "resume") as mock_resume, \
+             patch.object(app_module, "submit_agent") as mock_submit:
+            running = RunJournal("agent-running", directory)
+            running.record("run_started", objective="目标", initial_task=None, max_iterations=7)
+            finished = RunJournal("agent-finished", directory)
+            finished.record("run_started", objective="目标", initial_task=None, max_iterations=7)
+            finished.record("run_finished", status="completed")
+            app_module.running_agents.clear()
+            
+            restored = app_module.restore_interrupted_agents()
+            
+            self.assertEqual(restored, 1)
+            mock_resume.assert_called_once_with("agent-running")
+            mock_submit.assert_called_once_with("agent-running", 7)
+            self.assertTrue(app_module.running_agents["agent-running"]["restored"])
+            app_module.running_agents.clear()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+上下文预取测试
+
+测试队首任务的后台预取、写入记忆后的失效（保留查询嵌入），以及 Agent 执行任务时命中预取结果。
+"""
+
+import unittest
+import asyncio
+import threading
+import uuid
+from unittest.mock import patch, MagicMock, AsyncMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from context_prefetch import ContextPrefetcher
+from custom_babyagi import AsyncCustomBabyAGI, Task
+
+
+class FakeRetriever:
+    """记录调用次数的检索和嵌入函数"""
+    
+    def __init__(self):
+        self.searches = []
+        self.embedded = []
+        self.lock = threading.Lock()
+    
+    def search(self, query, embedding):
+        with self.lock:
+            self.searches.append((query, embedding))
+        return f"{query}的上下文"
+    
+    def embed(self, texts):
+        with self.lock:
+            self.embedded.extend(texts)
+        return [[float(len(text)), 1.0] for text in texts]
+
+
+class TestContextPrefetcher(unittest.TestCase):
+    """预取缓存测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.retriever = FakeRetriever()
+        self.prefetcher = ContextPrefetcher(self.retriever.search, self.retriever.embed, top_k=2)
+        self.tasks = [Task(id=f"t{i}", content=f"任务{i}") for i in range(3)]
+    
+    def test_prefetched_context_is_reused(self):
+        """测试只预取队首 top_k 个任务，执行时直接使用预取结果"""
+        async def run():
+            self.prefetcher.schedule(self.tasks)
+            self.prefetcher.schedule(self.tasks)
+            return await self.prefetcher.get(self.tasks[0]), await self.prefetcher.get(self.tasks[2])
+        
+        first, third = asyncio.run(run())
+        
+        self.assertEqual(first, "任务0的上下文")
+        self.assertEqual(third, "任务2的上下文")
+        self.assertEqual(self.prefetcher.stats["prefetched"], 2)
+        self.assertEqual(self.prefetcher.stats["hits"], 1)
+        self.assertEqual(self.prefetcher.stats["misses"], 1)
+        self.assertEqual(sorted(query for query, _ in self.retriever.searches), ["任务0", "任务1", "任务2"])
+        self.assertEqual(self.retriever.searches[0][1], [3.0, 1.0])
+    
+    def test_invalidate_keeps_query_embeddings(self):
+        """测试写入记忆后预取结果失效，重新预取时复用查询嵌入"""
+        async def run():
+            self.prefetcher.schedule(self.tasks)
+            await asyncio.sleep(0.05)
+            self.prefetcher.invalidate()
+            self.prefetcher.schedule(self.tasks)
+            return await self.prefetcher.get(self.tasks[1])
+        
+        asyncio.run(run())
+        
+        self.assertEqual(self.prefetcher.stats["invalidated"], 2)
+        self.assertEqual(self.prefetcher.stats["prefetched"], 4)
+        self.assertEqual(self.prefetcher.stats["hits"], 1)
+        self.assertEqual(len(self.retriever.searches), 4)
+        self.assertEqual(sorted(self.retriever.embedded), ["任务0", "任务1"])
+    
+    def test_changed_content_is_not_reused(self):
+        """测试任务内容变化后不使用旧的预取结果"""
+        async def run():
+            self.prefetcher.schedule(self.tasks)
+            self.tasks[0].content = "改写后的任务"
+            return await self.prefetcher.get(self.tasks[0])
+        
+        self.assertEqual(asyncio.run(run()), "改写后的任务的上下文")
+        self.assertEqual(self.prefetcher.stats["misses"], 1)
+
+
+class TestAgentPrefetch(unittest.TestCase):
+    """Agent 执行任务时使用预取结果测试"""
+    
+    def test_next_task_context_is_prefetched(self):
+        """测试规划阶段为新的队首任务预取上下文，下一次迭代直接命中"""
+        vector_db = MagicMock()
+        vector_db.count.return_value = 0
+        with patch.object(config, "CONTEXT_PREFETCH", True), \
+             patch.object(config, "CONVERGENCE_PATIENCE", 0), \
+             patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=vector_db), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=MagicMock()):
+            agent = AsyncCustomBabyAGI(objective="测试目标")
+        
+        async def fake_plan(task, iteration_result):
+            with agent._task_lock:
+                agent.task_list.push(Task(id=str(uuid.uuid4()), content=f"任务{iteration_result['iteration'] + 1}"))
+            agent._schedule_prefetch()
+        
+        with patch.object(agent, "_astream_call", AsyncMock(return_value="执行结果")), \
+             patch.object(agent, "_aplan_step", side_effect=fake_plan):
+            results = asyncio.run(agent.arun(max_iterations=4))
+        
+        self.assertEqual(results["status"], "max_iterations_reached")
+        stats = agent.get_status()["context_prefetch"]
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hits"], 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,6 +8,8 @@ BabyAGI 核心类测试
 import unittest
 import tempfile
 import os
+import asyncio
+import json
 from unittest.mock import patch, MagicMock, Mock
 from datetime import datetime
 
@@ -17,7 +19,8 @@ from pathlib import Path
 project_root = Path(__file__).parent.parent
 sys.path.insert(0, str(project_root))
 
-from custom_babyagi import CustomBabyAGI, Task
+from custom_babyagi import AsyncCustomBabyAGI, CustomBabyAGI, Task
+from llm_client import LLMClientPool
 
 
 class TestTask(unittest.TestCase):
@@ -474,5 +477,309 @@ class TestCustomBabyAGI(unittest.TestCase):
         self.assertEqual(results[1]["result"], "结果2")
 
 
+class FakeLLMAgentMixin:
+    """使用模拟 LLM 和模拟向量数据库构造 Agent 的测试辅助类"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.finished = []
+        self.planned = False
+        self.planning_in_flight = 0
+        self.overlapped_executions = 0
+        
+    async def _fake_llm(self, prompt, max_tokens=1000):
+        """模拟 LLM：执行任务时短暂等待，首个任务完成后派生三个任务"""
+        if "执行结果:" in prompt:
+            task_line = [line for line in prompt.splitlines() if line.startswith("当前任务:")][0]
+            if self.planning_in_flight:
+                self.overlapped_executions += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            await asyncio.sleep(0.05)
+            self.in_flight -= 1
+            self.finished.append(task_line.split(":", 1)[1].strip())
+            return "完成"
+        if "创建新的任务" in prompt:
+            self.planning_in_flight += 1
+            await asyncio.sleep(0.02)
+            self.planning_in_flight -= 1
+            if self.planned:
+                return "[]"
+            self.planned = True
+            return json.dumps([
+                {"content": "子任务A", "priority": 1},
+                {"content": "子任务B", "priority": 2},
+                {"content": "汇总任务", "priority": 1, "depends_on": [1, 2]}
+            ], ensure_ascii=False)
+        return "[]"
+    
+    def _create_agent(self, mode="dag", workers=4, agent_class=CustomBabyAGI):
+        with patch.object(agent_class, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(agent_class, '_init_llm', return_value=self._fake_llm):
+            agent = agent_class(objective="测试目标", initial_task="初始任务")
+        agent.vector_db.count.return_value = 0
+        agent.scheduler_mode = mode
+        agent.max_workers = workers
+        return agent
+
+
+class TestDAGScheduler(FakeLLMAgentMixin, unittest.TestCase):
+    """DAG 并发调度测试"""
+    
+    def test_build_tasks_resolves_dependencies(self):
+        """测试依赖解析：支持已有任务 ID 和同批次序号"""
+        agent = self._create_agent()
+        existing = Task(id="existing-1", content="已有任务")
+        agent.task_list.push(existing)
+        
+        tasks = agent._build_tasks([
+            {"content": "任务1", "depends_on": ["existing-1"]},
+            {"content": "任务2", "depends_on": [1, "unknown"]}
+        ])
+        
+        self.assertEqual(tasks[0].dependencies, ["existing-1"])
+        self.assertEqual(tasks[1].dependencies, [tasks[0].id])
+        
+    def test_dag_runs_independent_tasks_concurrently(self):
+        """测试独立任务并发执行，依赖任务在依赖完成后执行"""
+        agent = self._create_agent()
+        results = agent.run(max_iterations=10)
+        
+        self.assertEqual(results["status"], "completed")
+        self.assertEqual(len(results["iterations"]), 4)
+        self.assertGreaterEqual(self.max_in_flight, 2)
+        self.assertEqual(self.finished[-1], "汇总任务")
+        
+    def test_dag_respects_max_workers_and_iterations(self):
+        """测试并发度与最大迭代次数限制"""
+        agent = self._create_agent(workers=1)
+        results = agent.run(max_iterations=2)
+        
+        self.assertEqual(self.max_in_flight, 1)
+        self.assertEqual(len(results["iterations"]), 2)
+        self.assertEqual(results["status"], "max_iterations_reached")
+        
+    def test_dag_releases_unsatisfiable_dependencies(self):
+        """测试循环依赖不会导致调度死锁"""
+        agent = self._create_agent()
+        first = Task(id="a", content="任务A", dependencies=["b"])
+        second = Task(id="b", content="任务B", dependencies=["a"])
+        agent.task_list.extend([first, second])
+        self.planned = True
+        
+        results = agent.run(max_iterations=5)
+        
+        self.assertEqual(len(results["iterations"]), 3)
+        self.assertEqual(results["status"], "completed")
+
+
+class TestPipelinedScheduler(FakeLLMAgentMixin, unittest.TestCase):
+    """流水线调度测试"""
+    
+    def test_execution_overlaps_with_planning(self):
+        """测试下一任务的执行与上一任务的规划重叠"""
+        agent = self._create_agent(mode="pipelined")
+        results = agent.run(max_iterations=10)
+        
+        self.assertEqual(results["status"], "completed")
+        self.assertEqual(len(results["iterations"]), 4)
+        self.assertGreater(self.overlapped_executions, 0)
+        self.assertEqual(len(results["iterations"][0]["new_tasks"]), 3)
+        
+    def test_waits_for_planning_when_queue_empty(self):
+        """测试队列为空时等待后台规划产出的新任务"""
+        agent = self._create_agent(mode="pipelined")
+        results = agent.run(max_iterations=2)
+        
+        # 初始任务执行后队列为空，第二次迭代必须等待规划结果
+        self.assertEqual(len(results["iterations"]), 2)
+        self.assertEqual(results["status"], "max_iterations_reached")
+        self.assertEqual(self.overlapped_executions, 0)
+
+
+class TestFusedPlanning(FakeLLMAgentMixin, unittest.TestCase):
+    """合并规划测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        super().setUp()
+        self.planning_prompts = []
+        self.agent = self._create_agent(mode="serial")
+        self.agent.planning_mode = "fused"
+        self.agent.task_list.extend([
+            Task(id="old-1", content="已有任务1", priority=1),
+            Task(id="old-2", content="已有任务2", priority=2)
+        ])
+    
+    def _set_plan_response(self, response):
+        async def plan_llm(prompt, max_tokens=1000):
+            self.planning_prompts.append(prompt)
+            return response
+        self.agent.allm = plan_llm
+    
+    def test_single_call_creates_and_orders_tasks(self):
+        """测试一次调用同时创建新任务并给出完整优先级顺序"""
+        self._set_plan_response("规划如下：" + json.dumps({
+            "new_tasks": [{"content": "新任务", "depends_on": ["old-1"]}],
+            "priority_order": ["old-2", 1, "old-1"]
+        }, ensure_ascii=False))
+        completed = Task(id="done", content="已完成任务", result="结果")
+        iteration_result = {}
+        
+        asyncio.run(self.agent._aplan_step(completed, iteration_result))
+        
+        self.assertEqual(len(self.planning_prompts), 1)
+        order = [task.content for task in self.agent.task_list.snapshot()]
+        self.assertEqual(order, ["已有任务2", "新任务", "已有任务1"])
+        self.assertEqual(iteration_result["new_tasks"][0]["dependencies"], ["old-1"])
+        self.assertEqual(self.agent.planning_stats["fused"], 1)
+        self.assertEqual(self.agent.prioritization_stats["llm"], 1)
+    
+    def test_unlisted_tasks_keep_relative_order(self):
+        """测试未出现在排序结果中的任务排在后面"""
+        self._set_plan_response(json.dumps({"new_tasks": [], "priority_order": ["old-2"]}))
+        
+        asyncio.run(self.agent._aplan_step(Task(id="done", content="已完成任务"), {}))
+        
+        self.assertEqual([task.id for task in self.agent.task_list.snapshot()], ["old-2", "old-1"])
+    
+    def test_falls_back_to_separate_calls_on_parse_failure(self):
+        """测试解析失败时回退为创建、排序两次调用"""
+        fake_llm = self.agent.allm
+        
+        async def broken_plan_llm(prompt, max_tokens=1000):
+            if "priority_order" in prompt:
+                return "无法给出规划"
+            return await fake_llm(prompt, max_tokens)
+        self.agent.allm = broken_plan_llm
+        iteration_result = {}
+        
+        asyncio.run(self.agent._aplan_step(Task(id="done", content="已完成任务"), iteration_result))
+        
+        self.assertEqual(len(iteration_result["new_tasks"]), 3)
+        self.assertEqual(self.agent.planning_stats, {"fused": 0, "separate": 1, "fused_fallback": 1})
+
+
+class TestStreaming(FakeLLMAgentMixin, unittest.TestCase):
+    """流式输出测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        super().setUp()
+        self.agent = self._create_agent(mode="serial")
+        self.snapshots = []
+        
+        async def stream(prompt, max_tokens=1000):
+            for chunk in ["第一段", "第二段", "第三段"]:
+                self.snapshots.append(self.agent.get_status()["in_progress"])
+                yield chunk
+        
+        async def streaming_llm(prompt, max_tokens=1000):
+            return await self._fake_llm(prompt, max_tokens)
+        streaming_llm.stream = stream
+        self.agent.allm = streaming_llm
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.agent.close()
+    
+    def test_execute_task_streams_chunks(self):
+        """测试执行任务时逐块回调并暴露部分结果"""
+        chunks = []
+        task = Task(id="t-1", content="测试任务")
+        
+        result = self.agent.execute_task(task, on_chunk=chunks.append)
+        
+        self.assertEqual(result, "第一段第二段第三段")
+        self.assertEqual(chunks, ["第一段", "第二段", "第三段"])
+        self.assertEqual(self.snapshots[2], [{"id": "t-1", "content": "测试任务", "partial_result": "第一段第二段"}])
+        self.assertEqual(self.agent.get_status()["in_progress"], [])
+        self.assertEqual(self.agent.token_usage["execute"]["calls"], 1)
+    
+    def test_sync_stream_llm(self):
+        """测试同步流式接口"""
+        self.assertEqual(list(self.agent.stream_llm("提示")), ["第一段", "第二段", "第三段"])
+    
+    def test_streaming_disabled_uses_single_call(self):
+        """测试关闭流式输出时整体调用 LLM"""
+        self.agent.llm_streaming = False
+        chunks = []
+        
+        result = self.agent.execute_task(Task(id="t-1", content="测试任务"), on_chunk=chunks.append)
+        
+        self.assertEqual(result, "完成")
+        self.assertEqual(chunks, ["完成"])
+
+
+class TestAsyncCustomBabyAGI(FakeLLMAgentMixin, unittest.TestCase):
+    """异步引擎测试"""
+    
+    def test_many_agents_share_one_event_loop(self):
+        """测试多个 Agent 在同一个事件循环中并发运行"""
+        agents = [self._create_agent(agent_class=AsyncCustomBabyAGI) for _ in range(20)]
+        
+        async def run_all():
+            return await asyncio.gather(*(agent.arun(max_iterations=1) for agent in agents))
+        
+        all_results = asyncio.run(run_all())
+        
+        self.assertEqual(len(all_results), 20)
+        self.assertTrue(all(len(results["iterations"]) == 1 for results in all_results))
+        self.assertGreater(self.max_in_flight, 1)
+        
+    def test_sync_wrapper_methods(self):
+        """测试同步接口包装异步引擎"""
+        agent = self._create_agent(mode="serial")
+        
+        self.assertEqual(agent.llm("当前任务: 测试\n执行结果:"), "完成")
+        task = Task(id="t-1", content="测试任务")
+        self.assertEqual(agent.execute_task(task), "完成")
+        self.assertEqual(task.status, "completed")
+        self.assertEqual(len(agent.create_new_tasks(task)), 3)
+        agent.close()
+        
+    def test_run_releases_llm_queue_state(self):
+        """测试运行结束后调度器不再保留 Agent 的排队状态，统计仍出现在 Agent 状态中"""
+        agent = self._create_agent(mode="serial")
+        agent.llm_pool = LLMClientPool("ollama", "test-model", ["http://llm-a"])
+        governor = agent.llm_pool.governor
+        governor._last_finish[agent.run_id] = 1.0
+        governor._agent_stats[agent.run_id] = {"calls": 3, "queue_wait": 0.5, "max_queue_wait": 0.2}
+        
+        agent.run(max_iterations=1)
+        agent.close()
+        
+        self.assertNotIn(agent.run_id, governor._last_finish)
+        self.assertNotIn(agent.run_id, governor._agent_stats)
+        self.assertEqual(agent.get_status()["llm_queue"], {"calls": 3, "queue_wait": 0.5, "max_queue_wait": 0.2})
+    
+    def test_private_loop_created_lazily(self):
+        """测试私有事件循环在第一次同步调用时创建，关闭后可以重新创建"""
+        agent = self._create_agent(mode="serial")
+        self.assertIsNone(agent._loop)
+        
+        asyncio.run(agent.arun(max_iterations=1))
+        self.assertIsNone(agent._loop)
+        
+        self.assertEqual(agent.llm("当前任务: 测试\n执行结果:"), "完成")
+        loop = agent._loop
+        agent.close()
+        self.assertTrue(loop.is_closed())
+        self.assertIsNone(agent._loop)
+        agent.close()
+        
+        self.assertEqual(agent.llm("当前任务: 测试\n执行结果:"), "完成")
+        agent.close()
+    
+    def test_sync_llm_function_is_wrapped(self):
+        """测试同步 LLM 函数会被包装为协程"""
+        async_llm = AsyncCustomBabyAGI._ensure_async_llm(lambda prompt, max_tokens=1000: prompt.upper())
+        
+        self.assertTrue(asyncio.iscoroutinefunction(async_llm))
+        self.assertEqual(asyncio.run(async_llm("abc")), "ABC")
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
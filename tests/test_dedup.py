@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+任务去重测试
+
+测试归一化哈希去重、嵌入相似度去重以及 Agent 入队前的去重。
+"""
+
+import unittest
+import json
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from custom_babyagi import CustomBabyAGI, Task
+from dedup import TaskDeduplicator
+
+VOCABULARY = ["数据", "爬虫", "报告", "天气", "旅游"]
+
+
+def keyword_embedding(texts):
+    """按关键词出现情况生成的模拟嵌入"""
+    return [[1.0 if word in text else 0.0 for word in VOCABULARY] + [0.1] for text in texts]
+
+
+class TestTaskDeduplicator(unittest.TestCase):
+    """去重索引测试"""
+    
+    def test_normalize_ignores_case_whitespace_and_punctuation(self):
+        """测试归一化忽略大小写、空白、标点和全半角差异"""
+        self.assertEqual(
+            TaskDeduplicator.normalize("  Collect DATA， 生成报告！"),
+            TaskDeduplicator.normalize("collect data,生成报告")
+        )
+        self.assertEqual(TaskDeduplicator.normalize("ＡＢＣ"), "abc")
+    
+    def test_exact_duplicates_rejected(self):
+        """测试精确重复（含批次内重复）被拒绝"""
+        dedup = TaskDeduplicator()
+        dedup.add([Task(id="a", content="编写爬虫")])
+        
+        accepted, duplicates = dedup.filter([
+            Task(id="b", content="编写 爬虫。"),
+            Task(id="c", content="分析数据"),
+            Task(id="d", content="分析数据!")
+        ])
+        
+        self.assertEqual([task.id for task in accepted], ["c"])
+        self.assertEqual(duplicates, {"b": "a", "d": "c"})
+        self.assertEqual(dedup.stats, {"exact": 2, "semantic": 0})
+    
+    def test_semantic_duplicates_rejected(self):
+        """测试语义相似度超过阈值的任务被拒绝"""
+        dedup = TaskDeduplicator(keyword_embedding, similarity_threshold=0.95)
+        dedup.add([Task(id="a", content="编写数据爬虫")])
+        
+        accepted, duplicates = dedup.filter([
+            Task(id="b", content="实现一个数据爬虫程序"),
+            Task(id="c", content="查询旅游天气")
+        ])
+        
+        self.assertEqual([task.id for task in accepted], ["c"])
+        self.assertEqual(duplicates, {"b": "a"})
+        self.assertEqual(dedup.rejected, 1)
+    
+    def test_index_grows_beyond_initial_capacity(self):
+        """测试嵌入矩阵扩容后仍能命中早期任务"""
+        dedup = TaskDeduplicator(lambda texts: [[float(len(text)), 1.0, 0.0] for text in texts])
+        dedup.add([Task(id=f"t{i}", content="x" * i) for i in range(1, 40)])
+        
+        _, duplicates = dedup.filter([Task(id="dup", content="y" * 39)])
+        
+        self.assertEqual(duplicates, {"dup": "t39"})
+    
+    def test_index_is_bounded(self):
+        """测试索引只保留最近 max_entries 个任务，更早的任务被淘汰"""
+        dedup = TaskDeduplicator(lambda texts: [[float(len(text)), 1.0, 0.0] for text in texts], max_entries=20)
+        dedup.add([Task(id=f"t{i}", content="x" * i) for i in range(1, 40)])
+        
+        self.assertEqual(len(dedup._vectors), 20)
+        self.assertEqual(len(dedup._hashes), 20)
+        accepted, duplicates = dedup.filter([Task(id="old", content="x"), Task(id="recent", content="x" * 39)])
+        self.assertEqual([task.id for task in accepted], ["old"])
+        self.assertEqual(duplicates, {"recent": "t39"})
+    
+    def test_embedding_failure_falls_back_to_exact_check(self):
+        """测试嵌入计算失败时仅做精确去重"""
+        def failing_embedding(texts):
+            raise RuntimeError("模型不可用")
+        dedup = TaskDeduplicator(failing_embedding)
+        dedup.add([Task(id="a", content="编写爬虫")])
+        
+        accepted, duplicates = dedup.filter([Task(id="b", content="编写爬虫"), Task(id="c", content="写爬虫")])
+        
+        self.assertEqual([task.id for task in accepted], ["c"])
+        self.assertEqual(duplicates, {"b": "a"})
+
+
+class TestAgentDeduplication(unittest.TestCase):
+    """Agent 入队前去重测试"""
+    
+    async def _fake_llm(self, prompt, max_tokens=1000):
+        if "执行结果:" in prompt:
+            return "完成"
+        if "创建新的任务" in prompt:
+            return json.dumps([
+                {"content": "初始任务"},
+                {"content": "编写数据爬虫"},
+                {"content": "实现数据爬虫程序"},
+                {"content": "生成报告", "depends_on": [3]}
+            ], ensure_ascii=False)
+        return "[]"
+    
+    def test_duplicates_rejected_and_counted(self):
+        """测试重复任务不入队，并计入运行结果"""
+        with patch.object(CustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(CustomBabyAGI, '_init_llm', return_value=self._fake_llm):
+            agent = CustomBabyAGI(objective="测试目标", initial_task="初始任务")
+        agent.vector_db.count.return_value = 0
+        agent.deduplicator = TaskDeduplicator(keyword_embedding, similarity_threshold=0.95)
+        
+        results = agent.run(max_iterations=1)
+        
+        new_tasks = results["iterations"][0]["new_tasks"]
+        self.assertEqual([task["content"] for task in new_tasks], ["编写数据爬虫", "生成报告"])
+        self.assertEqual(new_tasks[1]["dependencies"], [new_tasks[0]["id"]])
+        self.assertEqual(results["duplicates_rejected"], 2)
+        self.assertEqual(agent.get_status()["deduplication"], {"exact": 1, "semantic": 1})
+        agent.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+嵌入缓存测试
+
+测试内存和磁盘两级缓存的命中、重启后复用、按总大小淘汰，以及 Agent 写入和检索向量数据库时使用缓存的嵌入。
+"""
+
+import unittest
+import os
+import tempfile
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from llm_cache import MemoryCacheTier
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache, EmbeddingStore
+from custom_babyagi import AsyncCustomBabyAGI, Task
+
+
+class CountingEmbedding:
+    """记录实际计算过哪些文本的嵌入函数"""
+    
+    def __init__(self):
+        self.computed = []
+    
+    def __call__(self, input):
+        self.computed.extend(input)
+        return [[float(len(text)), 1.0, 0.5] for text in input]
+
+
+class TestEmbeddingCache(unittest.TestCase):
+    """嵌入缓存测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "embeddings.sqlite3")
+        self.base = CountingEmbedding()
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+    
+    def _function(self, model="model-a", store=True):
+        cache = EmbeddingCache(MemoryCacheTier(100), EmbeddingStore(self.path) if store else None)
+        return CachedEmbeddingFunction(self.base, model, cache)
+    
+    def test_only_uncached_texts_are_computed(self):
+        """测试同一批次内去重，已缓存的文本不再计算"""
+        function = self._function(store=False)
+        
+        first = function(["甲", "乙乙", "甲"])
+        second = function(["乙乙", "丙丙丙"])
+        
+        self.assertEqual(first, [[1.0, 1.0, 0.5], [2.0, 1.0, 0.5], [1.0, 1.0, 0.5]])
+        self.assertEqual(second[0], first[1])
+        self.assertEqual(self.base.computed, ["甲", "乙乙", "丙丙丙"])
+        summary = function.cache.summary()
+        self.assertEqual(summary["memory_hits"], 1)
+        self.assertEqual(summary["misses"], 3)
+    
+    def test_vectors_survive_restart(self):
+        """测试新进程（新的内存缓存）从磁盘读取已计算的嵌入"""
+        self._function()(["持久化的文本"])
+        restarted = self._function()
+        
+        vectors = restarted(["持久化的文本"])
+        
+        self.assertEqual(self.base.computed, ["持久化的文本"])
+        self.assertEqual(vectors, [[6.0, 1.0, 0.5]])
+        self.assertEqual(restarted.cache.summary()["disk_hits"], 1)
+        self.assertEqual(restarted.cache.summary()["hit_rate"], 1.0)
+    
+    def test_model_is_part_of_key(self):
+        """测试不同模型的同一文本分别缓存"""
+        self._function("model-a")(["文本"])
+        self._function("model-b")(["文本"])
+        
+        self.assertEqual(self.base.computed, ["文本", "文本"])
+    
+    def test_store_evicts_oldest_when_full(self):
+        """测试磁盘存储超出总大小后淘汰最早写入的向量"""
+        store = EmbeddingStore(self.path, max_bytes=10 * 12)
+        for i in range(15):
+            store.set_many({f"key-{i}": np.ones(3, dtype=np.float32) * i})
+        
+        self.assertLessEqual(len(store), 10)
+        self.assertEqual(store.get_many(["key-0"]), {})
+        np.testing.assert_array_equal(store.get_many(["key-14"])["key-14"], [14, 14, 14])
+
+
+class TestAgentEmbeddingCache(unittest.TestCase):
+    """Agent 使用嵌入缓存测试"""
+    
+    def test_vector_db_receives_cached_embeddings(self):
+        """测试写入结果和检索上下文时把缓存的嵌入传给向量数据库"""
+        with patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=MagicMock()):
+            agent = AsyncCustomBabyAGI(objective="测试目标")
+        base = CountingEmbedding()
+        agent.embedding_cache = EmbeddingCache(MemoryCacheTier(100))
+        agent.embedding_function = CachedEmbeddingFunction(base, "model-a", agent.embedding_cache)
+        agent.vector_db.count.return_value = 1
+        agent.vector_db.query.return_value = {"documents": [["历史结果"]], "metadatas": [[{"task": "历史任务"}]]}
+        
+        task = Task(id="t1", content="任务", result="相同的文本")
+        agent._store_task_result(task)
+        context = agent._get_relevant_context("相同的文本")
+        
+        self.assertIn("历史任务", context)
+        self.assertEqual(agent.vector_db.add.call_args.kwargs["embeddings"], [[5.0, 1.0, 0.5]])
+        self.assertEqual(agent.vector_db.query.call_args.kwargs["query_embeddings"], [[5.0, 1.0, 0.5]])
+        self.assertEqual(base.computed, ["相同的文本"])
+        self.assertEqual(agent.get_status()["embedding_cache"]["memory_hits"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+流式 JSON 提取测试
+
+测试增量 JSON 提取器，以及规划类调用在解析出完整 JSON 后提前停止生成。
+"""
+
+import unittest
+import asyncio
+import json
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from custom_babyagi import CustomBabyAGI, Task
+from json_stream import JSONStreamExtractor
+
+
+class TestJSONStreamExtractor(unittest.TestCase):
+    """增量提取器测试"""
+    
+    def test_value_split_across_chunks(self):
+        """测试跨片段的 JSON 在闭合时立即返回"""
+        extractor = JSONStreamExtractor("array")
+        
+        self.assertFalse(extractor.feed("好的，任务如下：[{\"content\": \"任"))
+        self.assertFalse(extractor.feed("务A\"}, {\"content\": \"任务B\""))
+        self.assertTrue(extractor.feed("}]\n以上任务可以"))
+        self.assertEqual(extractor.value, [{"content": "任务A"}, {"content": "任务B"}])
+    
+    def test_brackets_inside_strings_are_ignored(self):
+        """测试字符串中的括号和转义引号不影响深度计算"""
+        text = '{"reasoning": "需要 [搜索] 和 {读取}，\\"引号\\"", "use_tool": false} 其余说明'
+        
+        value = JSONStreamExtractor.extract(text, "object")
+        
+        self.assertEqual(value, {"reasoning": "需要 [搜索] 和 {读取}，\"引号\"", "use_tool": False})
+    
+    def test_invalid_candidates_are_skipped(self):
+        """测试不合法或不符合校验的片段被跳过，继续查找后续的值"""
+        text = '参考 {示例} 以及 {"other": 1}，结果：{"use_tool": true}'
+        
+        value = JSONStreamExtractor.extract(text, "object", lambda data: "use_tool" in data)
+        
+        self.assertEqual(value, {"use_tool": True})
+    
+    def test_nested_candidate_found_after_invalid_outer(self):
+        """测试外层不合法时仍能找到内层合法的值"""
+        self.assertEqual(JSONStreamExtractor.extract("[步骤 [1, 2] 完成", "array"), [1, 2])
+    
+    def test_incomplete_value_returns_none(self):
+        """测试生成被截断时返回 None"""
+        self.assertIsNone(JSONStreamExtractor.extract('[{"content": "任务', "array"))
+    
+    def test_unknown_kind_rejected(self):
+        """测试不支持的类型"""
+        with self.assertRaises(ValueError):
+            JSONStreamExtractor("string")
+
+
+class TestEarlyStop(unittest.TestCase):
+    """规划调用提前停止测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.pulled = 0
+        self.closed = False
+        
+        async def fake_llm(prompt, max_tokens=1000):
+            return "不应调用"
+        
+        async def fake_stream(prompt, max_tokens=1000):
+            chunks = ['新任务：[{"content": "任务A", ', '"priority": 1}]', "\n补充说明", "不应生成的内容"]
+            try:
+                for chunk in chunks:
+                    self.pulled += 1
+                    yield chunk
+            finally:
+                self.closed = True
+        fake_llm.stream = fake_stream
+        
+        with patch.object(CustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(CustomBabyAGI, '_init_llm', return_value=fake_llm):
+            self.agent = CustomBabyAGI(objective="测试目标")
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.agent.close()
+    
+    def test_create_stops_after_complete_array(self):
+        """测试创建任务时解析出完整数组后停止读取并关闭生成"""
+        new_tasks = self.agent.create_new_tasks(Task(id="done", content="已完成任务", result="结果"))
+        
+        self.assertEqual([task.content for task in new_tasks], ["任务A"])
+        self.assertEqual(self.pulled, 2)
+        self.assertTrue(self.closed)
+        self.assertEqual(self.agent.token_usage["create"]["calls"], 1)
+    
+    def test_non_streaming_llm_parsed_from_full_response(self):
+        """测试关闭流式输出时从完整响应中提取 JSON"""
+        async def fake_llm(prompt, max_tokens=1000):
+            return "排序结果：" + json.dumps([{"id": "t-2", "priority": 1}, {"id": "t-1", "priority": 2}]) + " 完毕"
+        self.agent.allm = fake_llm
+        self.agent.llm_streaming = False
+        self.agent.task_list.extend([Task(id="t-1", content="任务1", priority=1), Task(id="t-2", content="任务2", priority=2)])
+        
+        asyncio.run(self.agent._aprioritize_with_llm())
+        
+        self.assertEqual([task.id for task in self.agent.task_list.snapshot()], ["t-2", "t-1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 响应缓存测试
+
+测试内存与 SQLite 缓存层、并发请求合并以及 Agent 的缓存统计。
+"""
+
+import unittest
+import asyncio
+import os
+import tempfile
+import threading
+import time
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from custom_babyagi import AsyncCustomBabyAGI, LLM_ERROR_PREFIX
+from llm_cache import LLMCache, MemoryCacheTier, SQLiteCacheTier
+from config import config
+
+
+class TestCacheTiers(unittest.TestCase):
+    """缓存层测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.temp_dir.name, "llm_cache.sqlite3")
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+    
+    def test_memory_tier_evicts_least_recently_used(self):
+        """测试内存层按 LRU 淘汰"""
+        tier = MemoryCacheTier(max_entries=2)
+        tier.set("a", "1")
+        tier.set("b", "2")
+        tier.get("a")
+        tier.set("c", "3")
+        
+        self.assertEqual(tier.get("a"), "1")
+        self.assertIsNone(tier.get("b"))
+        self.assertEqual(len(tier), 2)
+    
+    def test_sqlite_tier_persists_across_instances(self):
+        """测试 SQLite 层重新打开后仍可命中"""
+        tier = SQLiteCacheTier(self.db_path)
+        tier.set("key", "响应")
+        tier.close()
+        
+        reopened = SQLiteCacheTier(self.db_path)
+        self.assertEqual(reopened.get("key"), "响应")
+        reopened.close()
+    
+    def test_sqlite_tier_expires_entries(self):
+        """测试过期条目不会被返回"""
+        tier = SQLiteCacheTier(self.db_path, ttl_seconds=60)
+        with patch("llm_cache.time.time", return_value=time.time() - 120):
+            tier.set("old", "旧响应")
+        tier.set("new", "新响应")
+        
+        self.assertIsNone(tier.get("old"))
+        self.assertEqual(tier.get("new"), "新响应")
+        tier.close()
+    
+    def test_sqlite_tier_evicts_by_size(self):
+        """测试超过大小上限时淘汰最久未访问的条目"""
+        tier = SQLiteCacheTier(self.db_path, max_bytes=250)
+        for index in range(5):
+            tier.set(f"k{index}", "x" * 50)
+            tier.get("k0")
+        tier.set("k5", "x" * 50)
+        
+        self.assertEqual(tier.get("k0"), "x" * 50)
+        self.assertIsNone(tier.get("k1"))
+        self.assertLessEqual(len(tier), 5)
+        tier.close()
+
+
+class TestLLMCache(unittest.TestCase):
+    """缓存查找与请求合并测试"""
+    
+    def test_key_depends_on_all_request_fields(self):
+        """测试缓存键包含提供商、模型、提示词、最大 token 数和温度"""
+        base = LLMCache.make_key("openai", "gpt", "prompt", 100, 0.7)
+        
+        self.assertEqual(base, LLMCache.make_key("openai", "gpt", "prompt", 100, 0.7))
+        self.assertNotEqual(base, LLMCache.make_key("ollama", "gpt", "prompt", 100, 0.7))
+        self.assertNotEqual(base, LLMCache.make_key("openai", "gpt", "prompt", 101, 0.7))
+        self.assertNotEqual(base, LLMCache.make_key("openai", "gpt", "prompt", 100, 0.0))
+    
+    def test_lower_tier_hit_fills_upper_tier(self):
+        """测试低层命中后回填内存层"""
+        memory, backing = MemoryCacheTier(), MemoryCacheTier()
+        backing.name = "backing"
+        backing.set("key", "值")
+        cache = LLMCache([memory, backing])
+        
+        value, source = asyncio.run(cache.get_or_compute("key", None))
+        
+        self.assertEqual((value, source), ("值", "backing"))
+        self.assertEqual(memory.get("key"), "值")
+    
+    def test_concurrent_identical_requests_are_coalesced(self):
+        """测试相同请求并发时只调用一次 LLM"""
+        cache = LLMCache([MemoryCacheTier()])
+        calls = []
+        
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return "响应"
+        
+        async def run_all():
+            return await asyncio.gather(*(cache.get_or_compute("key", compute) for _ in range(5)))
+        
+        results = asyncio.run(run_all())
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(source for _, source in results), ["coalesced"] * 4 + ["miss"])
+        self.assertEqual(cache.stats, {"hits": 0, "misses": 1, "coalesced": 4})
+    
+    def test_requests_coalesced_across_event_loops(self):
+        """测试不同线程的事件循环之间也能合并请求"""
+        cache = LLMCache([MemoryCacheTier()])
+        calls = []
+        results = []
+        
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return "响应"
+        
+        def worker():
+            results.append(asyncio.run(cache.get_or_compute("key", compute)))
+        
+        threads = [threading.Thread(target=worker) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([value for value, _ in results], ["响应"] * 3)
+    
+    def test_uncacheable_responses_not_stored(self):
+        """测试不可缓存的响应（如调用失败）不会写入缓存"""
+        cache = LLMCache([MemoryCacheTier()])
+        
+        async def compute():
+            return "失败"
+        
+        asyncio.run(cache.get_or_compute("key", compute, cacheable=lambda value: value != "失败"))
+        _, source = asyncio.run(cache.get_or_compute("key", compute, cacheable=lambda value: value != "失败"))
+        
+        self.assertEqual(source, "miss")
+
+
+class TestAgentLLMCache(unittest.TestCase):
+    """Agent 缓存集成测试"""
+    
+    def test_repeated_prompts_hit_cache(self):
+        """测试重复请求命中缓存，失败响应不缓存，统计出现在状态中"""
+        calls = []
+        
+        async def fake_llm(prompt, max_tokens=1000):
+            calls.append(prompt)
+            return f"{LLM_ERROR_PREFIX}: 超时" if prompt == "失败" else f"回答: {prompt}"
+        
+        with patch.multiple(config, LLM_CACHE_ENABLED=True), \
+             patch("custom_babyagi.get_llm_cache", return_value=LLMCache([MemoryCacheTier()])), \
+             patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=fake_llm):
+            agent = AsyncCustomBabyAGI(objective="测试目标")
+        
+        async def run_calls():
+            for prompt in ["问题", "问题", "失败", "失败"]:
+                await agent.allm(prompt, max_tokens=100)
+            return await agent.allm("问题", max_tokens=200)
+        
+        asyncio.run(run_calls())
+        
+        self.assertEqual(calls, ["问题", "失败", "失败", "问题"])
+        self.assertEqual(agent.get_status()["llm_cache"], {"hits": 1, "misses": 4, "coalesced": 0})
+
+    
+    def test_streamed_responses_are_cached(self):
+        """测试流式响应完整生成后写入缓存，命中时整体返回"""
+        streamed = []
+        
+        async def fake_llm(prompt, max_tokens=1000):
+            return "不应调用"
+        
+        async def fake_stream(prompt, max_tokens=1000):
+            streamed.append(prompt)
+            for chunk in ["回", "答"]:
+                yield chunk
+        fake_llm.stream = fake_stream
+        
+        with patch.multiple(config, LLM_CACHE_ENABLED=True), \
+             patch("custom_babyagi.get_llm_cache", return_value=LLMCache([MemoryCacheTier()])), \
+             patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=fake_llm):
+            agent = AsyncCustomBabyAGI(objective="测试目标")
+        
+        async def collect():
+            return [[chunk async for chunk in agent.astream_llm("问题")] for _ in range(2)]
+        
+        first, second = asyncio.run(collect())
+        
+        self.assertEqual(first, ["回", "答"])
+        self.assertEqual(second, ["回答"])
+        self.assertEqual(streamed, ["问题"])
+        self.assertEqual(agent.llm_cache_stats, {"hits": 1, "misses": 1, "coalesced": 0})
+    
+    def test_truncated_stream_is_not_cached(self):
+        """测试调用方提前停止的流式响应不写入缓存"""
+        calls = []
+        
+        async def fake_llm(prompt, max_tokens=1000):
+            calls.append(prompt)
+            return "FULL ANSWER: 完整回答"
+        
+        async def fake_stream(prompt, max_tokens=1000):
+            for chunk in ["FULL ANSWER: ", "完整回答"]:
+                yield chunk
+        fake_llm.stream = fake_stream
+        
+        with patch.multiple(config, LLM_CACHE_ENABLED=True), \
+             patch("custom_babyagi.get_llm_cache", return_value=LLMCache([MemoryCacheTier()])), \
+             patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=fake_llm):
+            agent = AsyncCustomBabyAGI(objective="测试目标")
+        
+        async def run_calls():
+            stream = agent.astream_llm("问题")
+            async for chunk in stream:
+                break
+            await stream.aclose()
+            return await agent.allm("问题")
+        
+        self.assertEqual(asyncio.run(run_calls()), "FULL ANSWER: 完整回答")
+        self.assertEqual(calls, ["问题"])
+
+
+if __name__ == '__main__':
+    unittest.main()
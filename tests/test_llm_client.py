@@ -0,0 +1,283 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 客户端连接池测试
+
+使用本地模拟的 Ollama / OpenAI 兼容服务，测试长连接复用、负载均衡、重试和故障转移。
+"""
+
+import unittest
+import asyncio
+import json
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from llm_client import LLMClientPool, LLMProviderError
+from llm_ledger import LLMCallContext, current_llm_call
+
+
+class StandInServer:
+    """在后台线程运行的模拟 LLM 服务"""
+    
+    def __init__(self, name="server", fail_times=0, fail_status=503, delay=0.0, retry_after=None):
+        self.name = name
+        self.fail_times = fail_times
+        self.fail_status = fail_status
+        self.retry_after = retry_after
+        self.delay = delay
+        self.requests = []
+        self.connections = set()
+        stand_in = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            
+            def log_message(self, format, *args):
+                pass
+            
+            def _send(self, status, body, content_type="application/json", headers=None):
+                data = body.encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            
+            def do_GET(self):
+                stand_in.connections.add(self.client_address)
+                self._send(200, json.dumps({"models": []}))
+            
+            def do_POST(self):
+                stand_in.connections.add(self.client_address)
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stand_in.requests.append((self.path, payload, self.headers.get("Authorization")))
+                if stand_in.delay:
+                    time.sleep(stand_in.delay)
+                if stand_in.fail_times > 0:
+                    stand_in.fail_times -= 1
+                    headers = {"Retry-After": stand_in.retry_after} if stand_in.retry_after else None
+                    self._send(stand_in.fail_status, json.dumps({"error": "busy"}), headers=headers)
+                    return
+                
+                text = f"{stand_in.name}: {payload.get('prompt') or payload['messages'][0]['content']}"
+                if self.path == "/api/generate":
+                    if payload["stream"]:
+                        lines = [json.dumps({"response": word, "done": False}) for word in text.split(" ")]
+                        lines.append(json.dumps({"response": "", "done": True}))
+                        self._send(200, "\n".join(lines) + "\n", "application/x-ndjson")
+                    else:
+                        self._send(200, json.dumps({"response": text, "done": True}))
+                elif payload["stream"]:
+                    events = [
+                        "data: " + json.dumps({"choices": [{"delta": {"content": word}}]})
+                        for word in text.split(" ")
+                    ]
+                    events.append("data: [DONE]")
+                    self._send(200, "\n\n".join(events) + "\n\n", "text/event-stream")
+                else:
+                    self._send(200, json.dumps({"choices": [{"message": {"content": text}}]}))
+        
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+    
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def unused_url():
+    """一个没有服务监听的地址"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return f"http://127.0.0.1:{sock.getsockname()[1]}"
+
+
+class TestLLMClientPool(unittest.TestCase):
+    """多地址客户端测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.servers = []
+    
+    def tearDown(self):
+        """测试后清理"""
+        for server in self.servers:
+            server.close()
+    
+    def _server(self, **kwargs):
+        server = StandInServer(**kwargs)
+        self.servers.append(server)
+        return server
+    
+    def _pool(self, urls, provider="ollama", **kwargs):
+        kwargs.setdefault("backoff", 0.01)
+        return LLMClientPool(provider, "test-model", urls, **kwargs)
+    
+    def _run(self, pool, coro):
+        async def run():
+            try:
+                return await coro
+            finally:
+                await pool.aclose()
+        return asyncio.run(run())
+    
+    def test_connections_are_reused(self):
+        """测试同一地址的多次调用复用同一个长连接"""
+        server = self._server(name="a")
+        pool = self._pool([server.url])
+        
+        async def calls():
+            return [await pool.generate(f"问题{i}", 10) for i in range(5)]
+        
+        results = self._run(pool, calls())
+        
+        self.assertEqual(results[0], "a: 问题0")
+        self.assertEqual(len(server.requests), 5)
+        self.assertEqual(len(server.connections), 1)
+        self.assertEqual(server.requests[0][1]["options"]["num_predict"], 10)
+    
+    def test_least_loaded_endpoint_is_chosen(self):
+        """测试并发调用分散到进行中请求最少的地址"""
+        servers = [self._server(name="a", delay=0.1), self._server(name="b", delay=0.1)]
+        pool = self._pool([server.url for server in servers])
+        
+        async def calls():
+            return await asyncio.gather(*(pool.generate(f"问题{i}") for i in range(4)))
+        
+        self._run(pool, calls())
+        
+        self.assertEqual([len(server.requests) for server in servers], [2, 2])
+    
+    def test_failover_to_healthy_endpoint(self):
+        """测试连接失败时切换地址，连续失败的地址被暂停使用"""
+        server = self._server(name="good")
+        pool = self._pool([unused_url(), server.url], cooldown=60, failure_threshold=2)
+        bad = pool.endpoints[0]
+        
+        async def calls():
+            return [await pool.generate(f"问题{i}") for i in range(6)]
+        
+        results = self._run(pool, calls())
+        
+        self.assertTrue(all(result.startswith("good:") for result in results))
+        self.assertFalse(bad.healthy)
+        self.assertEqual(bad.stats["failures"], 2)
+        self.assertEqual(len(server.requests), 6)
+    
+    def test_retries_server_errors_then_succeeds(self):
+        """测试服务端错误时退避重试"""
+        server = self._server(name="a", fail_times=2)
+        pool = self._pool([server.url])
+        
+        result = self._run(pool, pool.generate("问题"))
+        
+        self.assertEqual(result, "a: 问题")
+        self.assertEqual(len(server.requests), 3)
+    
+    def test_gives_up_after_max_retries(self):
+        """测试重试次数用尽后抛出 LLMProviderError"""
+        server = self._server(fail_times=10)
+        pool = self._pool([server.url], max_retries=2)
+        
+        with self.assertRaises(LLMProviderError):
+            self._run(pool, pool.generate("问题"))
+        self.assertEqual(len(server.requests), 3)
+    
+    def test_client_errors_are_not_retried(self):
+        """测试请求本身有误（4xx）时不重试"""
+        server = self._server(fail_times=10, fail_status=400)
+        pool = self._pool([server.url])
+        
+        with self.assertRaises(LLMProviderError):
+            self._run(pool, pool.generate("问题"))
+        self.assertEqual(len(server.requests), 1)
+        self.assertTrue(pool.endpoints[0].healthy)
+    
+    def test_rate_limited_endpoint_honors_retry_after(self):
+        """测试 429 响应按 Retry-After 暂停地址，排队时间和重试次数计入当前调用"""
+        server = self._server(name="a", fail_times=1, fail_status=429, retry_after="0.3")
+        pool = self._pool([server.url])
+        
+        async def call():
+            record = LLMCallContext()
+            current_llm_call.set(record)
+            started = time.monotonic()
+            result = await pool.generate("问题", agent_id="agent-1")
+            return result, time.monotonic() - started, record
+        
+        result, elapsed, record = self._run(pool, call())
+        
+        self.assertEqual(result, "a: 问题")
+        self.assertGreaterEqual(elapsed, 0.3)
+        self.assertGreaterEqual(record.queue_wait, 0.25)
+        self.assertEqual(record.retries, 1)
+        self.assertEqual(pool.governor.agent_stats("agent-1")["calls"], 2)
+        self.assertTrue(pool.endpoints[0].healthy)
+    
+    def test_ollama_stream(self):
+        """测试 Ollama 逐行 JSON 流式响应"""
+        server = self._server(name="a")
+        pool = self._pool([server.url])
+        
+        async def collect():
+            return [chunk async for chunk in pool.stream("你好 世界")]
+        
+        self.assertEqual(self._run(pool, collect()), ["a:", "你好", "世界"])
+    
+    def test_openai_compatible_stream_with_failover(self):
+        """测试 OpenAI 兼容接口的 SSE 流式响应，首个片段前失败时切换地址"""
+        server = self._server(name="b")
+        pool = self._pool([unused_url(), server.url], provider="openai", api_key="sk-test")
+        
+        async def collect():
+            return [chunk async for chunk in pool.stream("你好")]
+        
+        self.assertEqual(self._run(pool, collect()), ["b:", "你好"])
+        path, payload, authorization = server.requests[0]
+        self.assertEqual(path, "/chat/completions")
+        self.assertTrue(payload["stream"])
+        self.assertEqual(authorization, "Bearer sk-test")
+    
+    def test_health_check_restores_endpoint(self):
+        """测试主动健康检查成功后地址立即恢复使用"""
+        server = self._server()
+        pool = self._pool([server.url], cooldown=60)
+        endpoint = pool.endpoints[0]
+        endpoint.unhealthy_until = time.monotonic() + 60
+        
+        self.assertEqual(self._run(pool, pool.check_health()), {server.url: True})
+        self.assertTrue(endpoint.healthy)
+    
+    def test_periodic_health_checks_feed_routing(self):
+        """测试后台健康检查把不可达的地址移出调度，可达的地址提前恢复"""
+        server = self._server(name="a")
+        pool = self._pool([unused_url(), server.url], failure_threshold=1, cooldown=60)
+        down, up = pool.endpoints
+        up.unhealthy_until = time.monotonic() + 60
+        
+        pool.start_health_checks(0.01)
+        self.addCleanup(pool.stop_health_checks)
+        deadline = time.monotonic() + 5
+        while (down.healthy or not up.healthy) and time.monotonic() < deadline:
+            time.sleep(0.01)
+        pool.stop_health_checks()
+        
+        self.assertFalse(down.healthy)
+        self.assertTrue(up.healthy)
+        self.assertIsNone(pool._health_thread)
+        self.assertEqual(self._run(pool, pool.generate("你好")), "a: 你好")
+        self.assertEqual(down.stats["requests"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
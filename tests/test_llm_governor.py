@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 调度器测试
+
+测试每个地址的并发上限、令牌桶限速、Retry-After 暂停以及跨 Agent 的加权公平排队。
+"""
+
+import unittest
+import asyncio
+import time
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from llm_client import LLMEndpoint
+from llm_governor import LLMGovernor
+
+
+class TestLLMGovernor(unittest.TestCase):
+    """调度器测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.endpoint = LLMEndpoint("http://llm-a")
+    
+    def _grant_order(self, governor, requests, hold=0.02):
+        """依次提交 (agent_id, 标签) 请求，返回获得地址的顺序"""
+        order = []
+        
+        async def call(agent_id, label):
+            endpoint, _ = await governor.acquire([self.endpoint], agent_id)
+            order.append(label)
+            await asyncio.sleep(hold)
+            governor.release(endpoint)
+        
+        async def run():
+            tasks = []
+            for agent_id, label in requests:
+                tasks.append(asyncio.create_task(call(agent_id, label)))
+                await asyncio.sleep(0)
+            await asyncio.gather(*tasks)
+        
+        asyncio.run(run())
+        return order
+    
+    def test_concurrency_cap_and_queue_wait(self):
+        """测试并发上限，排队时间计入 Agent 统计"""
+        governor = LLMGovernor(max_concurrency=1)
+        
+        async def run():
+            first, first_wait = await governor.acquire([self.endpoint], "a")
+            waiter = asyncio.create_task(governor.acquire([self.endpoint], "a"))
+            await asyncio.sleep(0.1)
+            self.assertFalse(waiter.done())
+            self.assertEqual(self.endpoint.in_flight, 1)
+            governor.release(first)
+            second, second_wait = await waiter
+            governor.release(second)
+            return first_wait, second_wait
+        
+        first_wait, second_wait = asyncio.run(run())
+        
+        self.assertLess(first_wait, 0.05)
+        self.assertGreaterEqual(second_wait, 0.1)
+        stats = governor.agent_stats("a")
+        self.assertEqual(stats["calls"], 2)
+        self.assertGreaterEqual(stats["max_queue_wait"], 0.1)
+        self.assertEqual(self.endpoint.in_flight, 0)
+    
+    def test_fair_queuing_across_agents(self):
+        """测试一个 Agent 的大量请求不会饿死其他 Agent"""
+        governor = LLMGovernor(max_concurrency=1)
+        requests = [("a", f"a{i}") for i in range(1, 5)] + [("b", "b1"), ("b", "b2")]
+        
+        order = self._grant_order(governor, requests)
+        
+        self.assertEqual(order, ["a1", "b1", "a2", "b2", "a3", "a4"])
+    
+    def test_weights_give_larger_share(self):
+        """测试权重大的 Agent 分到更多份额"""
+        governor = LLMGovernor(max_concurrency=1, weights={"b": 2})
+        requests = [("a", f"a{i}") for i in range(1, 5)] + [("b", f"b{i}") for i in range(1, 5)]
+        
+        order = self._grant_order(governor, requests)
+        
+        self.assertEqual(order[:6], ["a1", "b1", "b2", "b3", "a2", "b4"])
+    
+    def test_token_bucket_limits_rate(self):
+        """测试令牌桶限速"""
+        governor = LLMGovernor(rate=20, burst=1)
+        
+        async def run():
+            started = time.monotonic()
+            for _ in range(4):
+                endpoint, _ = await governor.acquire([self.endpoint], "a")
+                governor.release(endpoint)
+            return time.monotonic() - started
+        
+        self.assertGreaterEqual(asyncio.run(run()), 0.14)
+    
+    def test_retry_after_pauses_endpoint(self):
+        """测试 Retry-After 期间请求分配到其他地址，只有一个地址时等待暂停结束"""
+        governor = LLMGovernor()
+        other = LLMEndpoint("http://llm-b")
+        governor.penalize(self.endpoint, 0.2)
+        
+        async def run():
+            endpoint, waited = await governor.acquire([self.endpoint, other], "a")
+            governor.release(endpoint)
+            self.assertIs(endpoint, other)
+            self.assertLess(waited, 0.1)
+            
+            endpoint, waited = await governor.acquire([self.endpoint], "a")
+            governor.release(endpoint)
+            return waited
+        
+        self.assertGreaterEqual(asyncio.run(run()), 0.15)
+    
+    def test_forget_prunes_agent_state(self):
+        """测试 forget 清理 Agent 的排队状态并返回累计统计，权重只在要求时移除"""
+        governor = LLMGovernor(weights={"a": 2})
+        self._grant_order(governor, [("a", "a1"), ("a", "a2")])
+        
+        stats = governor.forget("a")
+        
+        self.assertEqual(stats["calls"], 2)
+        self.assertNotIn("a", governor._last_finish)
+        self.assertEqual(governor.agent_stats("a")["calls"], 0)
+        self.assertEqual(governor.weights["a"], 2)
+        governor.forget("a", drop_weight=True)
+        self.assertNotIn("a", governor.weights)
+    
+    def test_cancelled_waiter_does_not_leak_capacity(self):
+        """测试排队中被取消的请求不占用并发名额"""
+        governor = LLMGovernor(max_concurrency=1)
+        
+        async def run():
+            first, _ = await governor.acquire([self.endpoint], "a")
+            waiter = asyncio.create_task(governor.acquire([self.endpoint], "b"))
+            await asyncio.sleep(0.01)
+            waiter.cancel()
+            governor.release(first)
+            with self.assertRaises(asyncio.CancelledError):
+                await waiter
+            endpoint, waited = await asyncio.wait_for(governor.acquire([self.endpoint], "c"), 1)
+            governor.release(endpoint)
+        
+        asyncio.run(run())
+        
+        self.assertEqual(self.endpoint.in_flight, 0)
+        self.assertEqual(governor.status()["queued"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 调用账本测试
+
+测试按阶段汇总、逐条记录上限，以及 Agent 的调用按迭代和阶段打标记。
+"""
+
+import unittest
+import asyncio
+import time
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from llm_ledger import LLMLedger, LLMCallContext, current_llm_call
+from custom_babyagi import AsyncCustomBabyAGI, CustomBabyAGI, Task
+
+
+class TestLLMLedger(unittest.TestCase):
+    """账本汇总测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.ledger = LLMLedger("agent-1", max_records=3)
+    
+    def test_aggregates_per_phase(self):
+        """测试按阶段累计 token、延迟、排队、重试和缓存命中"""
+        self.ledger.record("execute", 1, 100, 20, LLMCallContext(started=time.monotonic() - 0.5, queue_wait=0.1, retries=1, cache="miss"))
+        self.ledger.record("execute", 2, 50, 10, LLMCallContext(cache="memory"))
+        self.ledger.record("create", 2, 30, 5, LLMCallContext())
+        self.ledger.note_trimmed("create")
+        
+        phases = self.ledger.phases()
+        
+        self.assertEqual(phases["execute"]["calls"], 2)
+        self.assertEqual(phases["execute"]["prompt_tokens"], 150)
+        self.assertEqual(phases["execute"]["completion_tokens"], 30)
+        self.assertEqual(phases["execute"]["retries"], 1)
+        self.assertEqual(phases["execute"]["cache_hits"], 1)
+        self.assertAlmostEqual(phases["execute"]["queue_wait"], 0.1)
+        self.assertGreaterEqual(phases["execute"]["max_latency"], 0.5)
+        self.assertEqual(phases["create"]["trimmed"], 1)
+        
+        totals = self.ledger.totals()
+        self.assertEqual(totals["calls"], 3)
+        self.assertEqual(totals["prompt_tokens"], 180)
+        self.assertGreaterEqual(totals["max_latency"], 0.5)
+        self.assertAlmostEqual(totals["avg_latency"], totals["latency"] / 3)
+    
+    def test_recent_records_are_bounded(self):
+        """测试逐条记录只保留最近的调用，汇总覆盖全部调用"""
+        for iteration in range(1, 6):
+            self.ledger.record("execute", iteration, 10, 1, LLMCallContext())
+        
+        recent = self.ledger.recent()
+        
+        self.assertEqual([record["iteration"] for record in recent], [3, 4, 5])
+        self.assertEqual(recent[0]["agent_id"], "agent-1")
+        self.assertEqual(self.ledger.totals()["calls"], 5)
+
+
+class TestAgentLedger(unittest.TestCase):
+    """Agent 调用记录测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        async def fake_llm(prompt, max_tokens=1000):
+            call = current_llm_call.get()
+            call.retries += 1
+            call.cache = "miss"
+            return "[]"
+        
+        with patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=fake_llm):
+            self.agent = AsyncCustomBabyAGI(objective="测试目标")
+        self.agent.llm_streaming = False
+    
+    def test_calls_are_tagged_with_iteration_and_phase(self):
+        """测试执行和规划阶段的调用带上迭代序号，并出现在状态中"""
+        task = Task(id="t-1", content="测试任务")
+        
+        asyncio.run(self.agent._aprocess_task(task, 3))
+        
+        records = self.agent.ledger.recent()
+        self.assertEqual(records[0]["phase"], "execute")
+        self.assertTrue(all(record["iteration"] == 3 for record in records))
+        self.assertTrue(all(record["retries"] == 1 and record["cache"] == "miss" for record in records))
+        self.assertGreater(len(records), 1)
+        
+        status = self.agent.get_status()
+        self.assertEqual(status["token_usage"]["execute"]["calls"], 1)
+        self.assertEqual(status["llm_calls"]["totals"]["calls"], len(records))
+        self.assertEqual(status["llm_calls"]["recent"][-1], records[-1])
+    
+    def test_sync_llm_is_recorded(self):
+        """测试同步 llm 调用同样记入账本"""
+        with patch.object(CustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(CustomBabyAGI, '_init_llm', return_value=self.agent.allm):
+            agent = CustomBabyAGI(objective="测试目标")
+        
+        self.assertEqual(agent.llm("提示"), "[]")
+        agent.llm("提示", phase="tool")
+        agent.close()
+        
+        records = agent.ledger.recent()
+        self.assertEqual([record["phase"] for record in records], ["direct", "tool"])
+        self.assertEqual(records[0]["cache"], "miss")
+        self.assertEqual(agent.get_status()["token_usage"]["direct"]["calls"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
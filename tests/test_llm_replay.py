@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+"""
+LLM 录制/回放测试
+
+测试轨迹文件的录制与回放、任务 ID 重映射、流式分块边界、模拟延迟，以及 Agent 的离线回放运行。
+"""
+
+import unittest
+import asyncio
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from llm_replay import LLMTrace, LLMTraceMiss
+from custom_babyagi import AsyncCustomBabyAGI, Task
+
+
+class TestLLMTrace(unittest.TestCase):
+    """轨迹文件测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "trace.jsonl")
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+    
+    def _record(self, calls):
+        trace = LLMTrace(self.path, "record")
+        for call in calls:
+            trace.record(*call)
+        trace.close()
+        return trace
+    
+    def test_round_trip_in_recorded_order(self):
+        """测试相同请求按录制顺序回放，用完后重复最后一次响应"""
+        self._record([("问题", 100, "第一次", 0.2), ("问题", 100, "第二次", 0.2), ("其他", 100, "其他回答", 0.1)])
+        trace = LLMTrace(self.path, "replay")
+        
+        results = [asyncio.run(trace.replay("问题", 100)) for _ in range(3)]
+        
+        self.assertEqual(results, ["第一次", "第二次", "第二次"])
+        self.assertEqual(asyncio.run(trace.replay("其他", 100)), "其他回答")
+        self.assertEqual(trace.stats["replayed"], 4)
+    
+    def test_trace_file_is_compact_jsonl(self):
+        """测试每次调用一行紧凑 JSON"""
+        self._record([("问题", 100, "回答", 0.12345)])
+        
+        with open(self.path, encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        
+        self.assertEqual(len(lines), 1)
+        self.assertNotIn(": ", lines[0])
+        self.assertEqual(json.loads(lines[0])["t"], 0.123)
+    
+    def test_missing_request_raises(self):
+        """测试轨迹中没有的请求（包括 max_tokens 不同）"""
+        self._record([("问题", 100, "回答", 0.0)])
+        trace = LLMTrace(self.path, "replay")
+        
+        with self.assertRaises(LLMTraceMiss):
+            trace.lookup("问题", 200)
+        self.assertEqual(trace.stats["misses"], 1)
+    
+    def test_task_ids_are_remapped(self):
+        """测试提示词和响应中的任务 ID 按出现顺序映射到回放时的新 ID"""
+        old_ids = [str(uuid.uuid4()) for _ in range(2)]
+        new_ids = [str(uuid.uuid4()) for _ in range(2)]
+        prompt = "任务列表:\n[{id}] 任务A\n[{other}] 任务B"
+        response = '[{"id": "%s", "priority": 1}, {"id": "%s", "priority": 2}]'
+        self._record([(prompt.format(id=old_ids[0], other=old_ids[1]), 100, response % (old_ids[1], old_ids[0]), 0.0)])
+        trace = LLMTrace(self.path, "replay")
+        
+        replayed = asyncio.run(trace.replay(prompt.format(id=new_ids[0], other=new_ids[1]), 100))
+        
+        self.assertEqual(replayed, response % (new_ids[1], new_ids[0]))
+    
+    def test_stream_keeps_chunk_boundaries_and_latency(self):
+        """测试流式回放保持录制时的分块，并按录制耗时模拟延迟"""
+        self._record([("问题", 100, "第一段第二段", 0.2, ["第一段", "第二段"])])
+        trace = LLMTrace(self.path, "replay", latency="recorded")
+        
+        async def collect():
+            return [chunk async for chunk in trace.replay_stream("问题", 100)]
+        
+        started = time.monotonic()
+        chunks = asyncio.run(collect())
+        
+        self.assertEqual(chunks, ["第一段", "第二段"])
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+
+
+class TestAgentReplay(unittest.TestCase):
+    """Agent 录制后离线回放测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "trace.jsonl")
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+    
+    def _agent(self, mode, trace, fake_llm=None):
+        with patch.object(config, "LLM_TRACE_MODE", mode), \
+             patch("custom_babyagi.get_llm_trace", return_value=trace), \
+             patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=fake_llm) as init_llm:
+            agent = AsyncCustomBabyAGI(objective="测试目标")
+        self.assertEqual(init_llm.called, mode != "replay")
+        return agent
+    
+    def test_replayed_run_matches_recording(self):
+        """测试回放运行不调用 LLM，执行结果和任务优先级与录制时一致"""
+        calls = []
+        
+        async def fake_llm(prompt, max_tokens=1000):
+            calls.append(prompt)
+            if "重新分配优先级" in prompt:
+                # 倒转当前顺序，回放时只有正确映射任务 ID 才能得到相同的顺序
+                ids = re.findall(r"\(ID: ([0-9a-f-]{36})\)", prompt)
+                return json.dumps([{"id": task_id, "priority": len(ids) - i} for i, task_id in enumerate(ids)])
+            if "创建新的任务" in prompt:
+                return '[{"content": "任务A", "priority": 1}, {"content": "任务B", "priority": 2}, {"content": "任务C", "priority": 3}]'
+            return f"结果{len(calls)}"
+        
+        async def run(agent):
+            task = Task(id=str(uuid.uuid4()), content="初始任务")
+            await agent._aprocess_task(task, 1)
+            return task.result, [task.content for task in agent.task_list.snapshot()]
+        
+        recorder = LLMTrace(self.path, "record")
+        recorded = asyncio.run(run(self._agent("record", recorder, fake_llm)))
+        recorder.close()
+        recorded_calls = len(calls)
+        
+        player = LLMTrace(self.path, "replay")
+        replayed = asyncio.run(run(self._agent("replay", player)))
+        
+        self.assertEqual(recorded, ("结果1", ["任务C", "任务B", "任务A"]))
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(len(calls), recorded_calls)
+        self.assertEqual(player.stats["replayed"], recorder.stats["recorded"])
+        self.assertEqual(player.stats["misses"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+记忆命名空间测试
+
+测试按目标和按运行隔离记忆、检索不返回嵌入，以及长期未使用的命名空间整体删除。
+"""
+
+import unittest
+import multiprocessing
+import os
+import tempfile
+import time
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+import memory_namespaces
+from config import config
+from benchmark import HashEmbedding, InMemoryVectorStore
+from memory_namespaces import NamespaceRegistry, namespace_name
+from custom_babyagi import AsyncCustomBabyAGI, Task
+
+
+class TestNamespaceName(unittest.TestCase):
+    """命名空间名称测试"""
+    
+    def test_objective_mode_normalizes_objective(self):
+        """测试相同目标（忽略大小写和首尾空白）得到同一命名空间"""
+        self.assertEqual(namespace_name("objective", " Write A Report ", "r1"), namespace_name("objective", "write a report", "r2"))
+        self.assertNotEqual(namespace_name("objective", "写报告", "r1"), namespace_name("objective", "写代码", "r1"))
+    
+    def test_run_and_shared_modes(self):
+        """测试 run 模式按运行 ID 命名，shared 模式沿用单一集合"""
+        self.assertEqual(namespace_name("run", "目标", "abc/123"), "run-abc-123")
+        self.assertEqual(namespace_name("shared", "目标", "r1"), "babyagi_tasks")
+
+
+def _touch_many(path, prefix, count):
+    """在子进程中登记一批命名空间"""
+    registry = NamespaceRegistry(path)
+    for i in range(count):
+        registry.touch("numpy", f"{prefix}-{i}")
+
+
+class TestNamespaceRegistry(unittest.TestCase):
+    """命名空间注册表测试"""
+    
+    def test_stale_entries_persist_and_remove(self):
+        """测试注册表持久化，找出超过闲置时间的命名空间"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "namespaces.json")
+            registry = NamespaceRegistry(path)
+            registry.touch("numpy", "old")
+            registry._entries["numpy:old"]["last_used"] -= 3600
+            registry._save()
+            registry.touch("numpy", "new")
+            registry.touch("chroma", "old")
+            
+            reopened = NamespaceRegistry(path)
+            self.assertEqual(reopened.stale("numpy", 60), ["old"])
+            self.assertEqual(reopened.stale("numpy", 60, exclude=["old"]), [])
+            
+            reopened.remove("numpy", "old")
+            self.assertEqual(len(NamespaceRegistry(path).list()), 2)
+    
+    @unittest.skipIf(memory_namespaces.fcntl is None, "需要 fcntl 文件锁")
+    def test_concurrent_processes_do_not_lose_entries(self):
+        """测试多个进程同时登记时不会互相覆盖"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "namespaces.json")
+            processes = [
+                multiprocessing.Process(target=_touch_many, args=(path, f"p{i}", 20))
+                for i in range(4)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            
+            self.assertEqual(len(NamespaceRegistry(path).list()), 80)
+
+
+class TestAgentNamespaces(unittest.TestCase):
+    """Agent 记忆隔离测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.registry = NamespaceRegistry(os.path.join(self.temp_dir.name, "namespaces.json"))
+        embedding = HashEmbedding()
+        
+        def init_embedding_function(agent):
+            agent.embedding_function = embedding
+        
+        for patcher in (
+            patch.object(config, "VECTOR_DB", "numpy"),
+            patch.object(config, "NUMPY_VECTOR_DIR", self.temp_dir.name),
+            patch.object(config, "VECTOR_WRITE_BATCH_SIZE", 1),
+            patch.object(memory_namespaces, "_registry", self.registry),
+            patch.object(AsyncCustomBabyAGI, "_init_embedding_function", autospec=True, side_effect=init_embedding_function),
+            patch.object(AsyncCustomBabyAGI, "_init_llm", return_value=MagicMock())
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_objectives_are_isolated(self):
+        """测试不同目标的 Agent 互相检索不到对方的结果，相同目标的 Agent 共享记忆"""
+        writer = AsyncCustomBabyAGI(objective="研究太阳能")
+        writer._store_task_result(Task(id="t1", content="调研电池", result="太阳能电池效率"))
+        
+        other = AsyncCustomBabyAGI(objective="研究风能")
+        same = AsyncCustomBabyAGI(objective="研究太阳能")
+        
+        self.assertEqual(other._get_relevant_context("太阳能电池效率"), "暂无相关历史信息。")
+        self.assertIn("调研电池", same._get_relevant_context("太阳能电池效率"))
+        self.assertEqual(same.get_status()["memory_namespace"], writer.memory_namespace)
+    
+    def test_injected_store_is_not_registered(self):
+        """测试注入的向量存储（不是 _init_vector_db 创建的）不会登记到注册表"""
+        with patch.object(AsyncCustomBabyAGI, "_init_vector_db", return_value=InMemoryVectorStore(HashEmbedding())):
+            agent = AsyncCustomBabyAGI(objective="基准测试目标")
+        agent._store_task_result(Task(id="t1", content="任务", result="结果"))
+        agent._get_relevant_context("结果")
+        agent._touch_namespace()
+        
+        self.assertEqual(self.registry.list(), [])
+    
+    def test_stale_namespaces_are_retired(self):
+        """测试创建 Agent 时删除长期未使用的命名空间"""
+        old = AsyncCustomBabyAGI(objective="旧目标")
+        old._store_task_result(Task(id="t1", content="任务", result="结果"))
+        self.registry._entries[f"numpy:{old.memory_namespace}"]["last_used"] = time.time() - 90 * 86400
+        self.registry._save()
+        
+        # 默认不自动删除
+        AsyncCustomBabyAGI(objective="另一个目标")
+        self.assertTrue(Path(self.temp_dir.name, f"{old.memory_namespace}.f32").exists())
+        
+        with patch.object(config, "VECTOR_NAMESPACE_TTL_DAYS", 30):
+            current = AsyncCustomBabyAGI(objective="新目标")
+        
+        self.assertFalse(Path(self.temp_dir.name, f"{old.memory_namespace}.f32").exists())
+        self.assertEqual(
+            sorted(entry["name"] for entry in self.registry.list()),
+            sorted([current.memory_namespace, namespace_name("objective", "另一个目标", "")])
+        )
+    
+    def test_store_and_query_refresh_last_used(self):
+        """测试写入和检索记忆时刷新命名空间的使用时间，使用中的命名空间不会被删除"""
+        agent = AsyncCustomBabyAGI(objective="长期目标")
+        key = f"numpy:{agent.memory_namespace}"
+        
+        for use in (
+            lambda: agent._store_task_result(Task(id="t1", content="任务", result="结果")),
+            lambda: agent._get_relevant_context("结果")
+        ):
+            self.registry._entries[key]["last_used"] = time.time() - 90 * 86400
+            self.registry._save()
+            agent._namespace_touched_at = 0.0
+            use()
+            self.assertGreater(self.registry._entries[key]["last_used"], time.time() - 60)
+        
+        with patch.object(config, "VECTOR_NAMESPACE_TTL_DAYS", 30):
+            AsyncCustomBabyAGI(objective="新目标")
+        self.assertTrue(Path(self.temp_dir.name, f"{agent.memory_namespace}.f32").exists())
+    
+    def test_retire_run_namespace(self):
+        """测试 run 模式删除当前运行的记忆，shared 命名空间不允许删除"""
+        with patch.object(config, "VECTOR_NAMESPACE", "run"):
+            agent = AsyncCustomBabyAGI(objective="目标", run_id="run-1")
+        agent._store_task_result(Task(id="t1", content="任务", result="结果"))
+        
+        self.assertTrue(agent.retire_memory())
+        self.assertFalse(Path(self.temp_dir.name, "run-run-1.meta.jsonl").exists())
+        
+        with patch.object(config, "VECTOR_NAMESPACE", "shared"):
+            shared = AsyncCustomBabyAGI(objective="目标")
+        self.assertFalse(shared.retire_memory())
+    
+    def test_query_bounded_candidates(self):
+        """测试检索上下文时候选数量有上限，只返回需要的字段"""
+        with patch.object(AsyncCustomBabyAGI, "_init_vector_db", return_value=MagicMock()):
+            agent = AsyncCustomBabyAGI(objective="目标")
+        agent.vector_db.count.return_value = 1000
+        agent.vector_db.query.return_value = {"documents": [["结果"]], "metadatas": [[{"task": "任务"}]]}
+        
+        agent._get_relevant_context("查询")
+        
+        kwargs = agent.vector_db.query.call_args.kwargs
+        self.assertEqual(kwargs["n_results"], config.CONTEXT_CANDIDATES)
+        self.assertEqual(set(kwargs["include"]), {"documents", "metadatas", "distances", "embeddings"})
+
+
+if __name__ == '__main__':
+    unittest.main()
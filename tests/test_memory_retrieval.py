@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+记忆分块与检索测试
+
+测试结果按 token 切成重叠片段、MMR 排序兼顾相关度与多样性，以及 Agent 检索上下文时的距离阈值和 token 预算。
+"""
+
+import unittest
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from benchmark import InMemoryVectorStore
+from llm_cache import MemoryCacheTier
+from embedding_cache import CachedEmbeddingFunction, EmbeddingCache
+from memory_retrieval import chunk_text, mmr_order
+from prompt_builder import count_tokens
+from custom_babyagi import AsyncCustomBabyAGI, Task
+
+
+class KeywordEmbedding:
+    """按关键词出现次数构造的嵌入，便于控制文本之间的相似度"""
+    
+    dim = 4
+    VOCABULARY = ["solar", "wind", "cost", "storage"]
+    
+    def __call__(self, input):
+        return [
+            np.array([text.count(word) for word in self.VOCABULARY], dtype=np.float32) + 1e-3
+            for text in input
+        ]
+
+
+class TestChunkText(unittest.TestCase):
+    """结果分块测试"""
+    
+    def test_short_text_is_one_chunk(self):
+        """测试不足一块的文本原样返回"""
+        self.assertEqual(chunk_text("短结果", chunk_tokens=50), ["短结果"])
+    
+    def test_long_text_overlaps(self):
+        """测试长文本切成不超过预算的块，相邻块共享末尾的句子"""
+        text = "".join(f"第{i}条发现涉及电池。" for i in range(30))
+        
+        chunks = chunk_text(text, chunk_tokens=40, overlap_tokens=20)
+        
+        self.assertGreater(len(chunks), 3)
+        for chunk in chunks:
+            self.assertLessEqual(count_tokens(chunk), 40)
+        last_sentence = chunks[0].split("。")[-2] + "。"
+        self.assertIn(last_sentence, chunks[1])
+        self.assertTrue(chunks[-1].endswith("第29条发现涉及电池。"))
+    
+    def test_english_sentences_keep_spaces(self):
+        """测试英文句子切分后仍以空格分隔"""
+        text = " ".join(f"This is sentence number {i} about the topic." for i in range(20))
+        
+        chunks = chunk_text(text, chunk_tokens=30, overlap_tokens=8)
+        
+        self.assertGreater(len(chunks), 1)
+        for chunk in chunks:
+            self.assertNotIn(".This", chunk)
+        self.assertIn("topic. This is sentence number 1", chunks[0])
+
+
+class TestMMROrder(unittest.TestCase):
+    """MMR 排序测试"""
+    
+    def test_prefers_diverse_results(self):
+        """测试较小的 lambda 把与首个结果重复的候选排到后面"""
+        vectors = [[1.0, 0.0], [0.99, 0.1], [0.7, 0.7]]
+        
+        self.assertEqual(mmr_order([1.0, 0.0], vectors, lambda_mult=1.0), [0, 1, 2])
+        self.assertEqual(mmr_order([1.0, 0.0], vectors, lambda_mult=0.3), [0, 2, 1])
+
+
+class TestAgentRetrieval(unittest.TestCase):
+    """Agent 分块写入与检索测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        with patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=MagicMock()):
+            self.agent = AsyncCustomBabyAGI(objective="测试目标")
+        embedding = KeywordEmbedding()
+        self.agent.embedding_cache = EmbeddingCache(MemoryCacheTier(100))
+        self.agent.embedding_function = CachedEmbeddingFunction(embedding, "keywords", self.agent.embedding_cache)
+        self.agent.vector_db = InMemoryVectorStore(embedding)
+    
+    def _store(self, task_id, content, result):
+        self.agent._store_task_result(Task(id=task_id, content=content, result=result))
+    
+    def test_results_are_stored_as_chunks(self):
+        """测试长结果切成多个片段写入，第一个片段沿用任务 ID"""
+        with patch.object(config, "MEMORY_CHUNK_TOKENS", 20), patch.object(config, "MEMORY_CHUNK_OVERLAP", 5):
+            self._store("t1", "调研", " ".join(f"solar finding number {i}." for i in range(20)))
+        
+        stored = self.agent.vector_db.get()
+        self.assertGreater(len(stored["ids"]), 1)
+        self.assertEqual(stored["ids"][0], "t1")
+        self.assertEqual(stored["ids"][1], "t1#1")
+        self.assertEqual({metadata["chunks"] for metadata in stored["metadatas"]}, {len(stored["ids"])})
+    
+    def test_irrelevant_results_are_cut_off(self):
+        """测试距离超过阈值的片段不进入上下文"""
+        self._store("t1", "太阳能", "solar panels")
+        self._store("t2", "风能", "wind farms")
+        
+        context = self.agent._get_relevant_context("solar")
+        
+        self.assertIn("太阳能", context)
+        self.assertNotIn("风能", context)
+    
+    def test_budget_and_diversity(self):
+        """测试按 MMR 顺序填充 token 预算，重复的片段让位给不同方面的片段"""
+        self._store("t1", "太阳能一", "solar solar solar output")
+        self._store("t2", "太阳能二", "solar solar solar panels")
+        self._store("t3", "太阳能成本", "solar cost storage")
+        line_tokens = count_tokens("- 太阳能一: solar solar solar output\n")
+        
+        with patch.object(config, "CONTEXT_MMR_LAMBDA", 0.3), patch.object(config, "CONTEXT_MAX_DISTANCE", 0.9):
+            context = self.agent._get_relevant_context("solar", token_budget=2 * line_tokens + 2)
+        
+        lines = context.split("\n")
+        self.assertEqual(len(lines), 2)
+        self.assertIn("太阳能成本", lines[1])
+        self.assertLessEqual(count_tokens(context), 2 * line_tokens + 2)
+    
+    def test_mmr_without_embedding_cache(self):
+        """测试未启用嵌入缓存时仍做 MMR，候选向量来自向量数据库而不是重新计算"""
+        self._store("t1", "太阳能一", "solar solar solar output")
+        self._store("t2", "太阳能二", "solar solar solar panels")
+        self._store("t3", "太阳能成本", "solar cost storage")
+        embedded = []
+        base = KeywordEmbedding()
+        self.agent.embedding_cache = None
+        self.agent.embedding_function = lambda texts: embedded.extend(texts) or base(texts)
+        
+        with patch.object(config, "CONTEXT_MMR_LAMBDA", 0.3), patch.object(config, "CONTEXT_MAX_DISTANCE", 0.9):
+            context = self.agent._get_relevant_context("solar")
+        
+        self.assertIn("太阳能成本", context.split("\n")[1])
+        self.assertEqual(embedded, ["solar"])
+
+
+if __name__ == '__main__':
+    unittest.main()
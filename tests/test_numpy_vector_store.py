@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+NumPy 向量存储测试
+
+测试精确 top-k 检索、同一 ID 覆盖写入、重新打开后从内存映射文件恢复、容量扩展，以及 IVF 分区检索的召回。
+"""
+
+import unittest
+import tempfile
+
+import numpy as np
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from benchmark import HashEmbedding
+from numpy_vector_store import NumpyVectorStore
+
+
+class TestNumpyVectorStore(unittest.TestCase):
+    """NumPy 向量存储测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.embedding = HashEmbedding()
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+    
+    def _store(self, **kwargs):
+        return NumpyVectorStore(self.temp_dir.name, "tasks", self.embedding, **kwargs)
+    
+    def test_exact_top_k(self):
+        """测试按余弦距离从小到大返回最近的结果"""
+        store = self._store()
+        store.add(
+            documents=["苹果 香蕉 水果", "汽车 轮胎 引擎", "苹果 水果 甜"],
+            metadatas=[{"task": "甲"}, {"task": "乙"}, {"task": "丙"}],
+            ids=["a", "b", "c"]
+        )
+        
+        results = store.query(query_texts=["苹果 香蕉 水果"], n_results=2)
+        
+        self.assertEqual(store.count(), 3)
+        self.assertEqual(results["ids"][0][0], "a")
+        self.assertAlmostEqual(results["distances"][0][0], 0.0, places=5)
+        self.assertEqual(len(results["ids"][0]), 2)
+        self.assertLessEqual(results["distances"][0][0], results["distances"][0][1])
+    
+    def test_query_returns_embeddings_when_included(self):
+        """测试 include 含 embeddings 时返回归一化的向量"""
+        store = self._store()
+        store.add(documents=["甲"], metadatas=[{"task": "甲"}], ids=["a"], embeddings=[[3.0, 4.0]])
+        
+        results = store.query(query_embeddings=[[1.0, 0.0]], n_results=1, include=["documents", "embeddings"])
+        
+        np.testing.assert_allclose(results["embeddings"][0][0], [0.6, 0.8], rtol=1e-6)
+        self.assertNotIn("embeddings", store.query(query_embeddings=[[1.0, 0.0]], n_results=1))
+    
+    def test_empty_store(self):
+        """测试空存储返回空结果"""
+        results = self._store().query(query_texts=["任意"], n_results=3)
+        
+        self.assertEqual(results["ids"], [[]])
+    
+    def test_same_id_overwrites(self):
+        """测试同一 ID 再次写入时覆盖原行"""
+        store = self._store()
+        store.add(documents=["旧结果"], metadatas=[{"task": "甲"}], ids=["a"])
+        store.add(documents=["新结果"], metadatas=[{"task": "甲"}], ids=["a"])
+        
+        self.assertEqual(store.count(), 1)
+        self.assertEqual(store.get(ids=["a"])["documents"], ["新结果"])
+    
+    def test_reopen_restores_vectors(self):
+        """测试重新打开存储后从内存映射文件和元数据恢复，且能继续扩容写入"""
+        store = self._store()
+        documents = [f"结果 {i} 内容 {i * 7}" for i in range(300)]
+        store.add(documents=documents, metadatas=[{"task": str(i)} for i in range(300)], ids=[str(i) for i in range(300)])
+        store.add(documents=["覆盖后的结果"], metadatas=[{"task": "5"}], ids=["5"])
+        
+        reopened = self._store()
+        reopened.add(documents=["重启后写入"], metadatas=[{"task": "新"}], ids=["new"])
+        
+        self.assertEqual(reopened.count(), 301)
+        self.assertEqual(reopened.get(ids=["5"])["documents"], ["覆盖后的结果"])
+        self.assertEqual(reopened.query(query_texts=[documents[42]], n_results=1)["ids"], [["42"]])
+        self.assertEqual(reopened.get(where={"task": "新"})["ids"], ["new"])
+    
+    def test_ivf_recall(self):
+        """测试 IVF 分区检索只扫描部分簇，仍能找回与查询完全相同的向量"""
+        rng = np.random.default_rng(1)
+        vectors = rng.normal(size=(1000, 16)).astype(np.float32)
+        store = self._store(ivf_lists=8, nprobe=2)
+        store.add(
+            documents=[f"文档{i}" for i in range(1000)],
+            metadatas=[{"task": str(i)} for i in range(1000)],
+            ids=[str(i) for i in range(1000)],
+            embeddings=vectors.tolist()
+        )
+        
+        hits = 0
+        for i in range(0, 1000, 50):
+            results = store.query(query_embeddings=[vectors[i].tolist()], n_results=1)
+            hits += results["ids"][0] == [str(i)]
+        
+        self.assertIsNotNone(store._centroids)
+        self.assertEqual(hits, 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
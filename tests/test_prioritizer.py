@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+本地优先级评分器测试
+
+测试基于嵌入相似度的任务排序，以及 Agent 中 LLM 排序的触发条件。
+"""
+
+import unittest
+import asyncio
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from custom_babyagi import AsyncCustomBabyAGI, Task
+from prioritizer import EmbeddingPrioritizer
+
+VOCABULARY = ["数据", "爬虫", "报告", "天气", "旅游", "清洗"]
+
+
+def keyword_embedding(texts):
+    """按关键词出现情况生成的模拟嵌入"""
+    return [[1.0 if word in text else 0.0 for word in VOCABULARY] + [0.1] for text in texts]
+
+
+class TestEmbeddingPrioritizer(unittest.TestCase):
+    """本地优先级评分器测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.calls = []
+        
+        def counting_embedding(texts):
+            self.calls.append(list(texts))
+            return keyword_embedding(texts)
+        
+        self.prioritizer = EmbeddingPrioritizer(counting_embedding)
+    
+    def test_relevant_tasks_ranked_first(self):
+        """测试与目标更相关的任务排在前面"""
+        pending = [
+            Task(id="travel", content="查询旅游天气"),
+            Task(id="crawl", content="编写数据爬虫"),
+            Task(id="report", content="整理数据报告")
+        ]
+        
+        ranking = self.prioritizer.rank("采集数据并生成数据报告", pending, [])
+        
+        self.assertEqual(ranking["report"], 1)
+        self.assertEqual(ranking["travel"], 3)
+    
+    def test_completed_tasks_reduce_novelty(self):
+        """测试与已完成任务重复的任务得分降低"""
+        pending = [
+            Task(id="dup", content="编写数据爬虫"),
+            Task(id="new", content="数据清洗")
+        ]
+        completed = [Task(id="done", content="编写数据爬虫", status="completed")]
+        
+        without_memory = self.prioritizer.score("处理数据", pending, [])
+        with_memory = self.prioritizer.score("处理数据", pending, completed)
+        
+        self.assertLess(with_memory["dup"], without_memory["dup"])
+        self.assertEqual(self.prioritizer.rank("处理数据", pending, completed)["new"], 1)
+    
+    def test_older_tasks_get_age_bonus(self):
+        """测试等待更久的同类任务优先"""
+        pending = [
+            Task(id="young", content="数据报告", created_at=1000.0),
+            Task(id="old", content="数据报告", created_at=900.0)
+        ]
+        
+        scores = self.prioritizer.score("数据报告", pending, [], now=1000.0)
+        
+        self.assertGreater(scores["old"], scores["young"])
+    
+    def test_embeddings_are_cached(self):
+        """测试相同文本只计算一次嵌入"""
+        pending = [Task(id="a", content="数据报告")]
+        
+        self.prioritizer.rank("数据", pending, [])
+        self.prioritizer.rank("数据", pending, [])
+        
+        embedded = [text for call in self.calls for text in call]
+        self.assertEqual(sorted(embedded), sorted(["数据报告", "数据"]))
+
+
+class TestLocalPrioritizationMode(unittest.TestCase):
+    """Agent 本地优先级排序模式测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.llm_prompts = []
+        
+        async def fake_llm(prompt, max_tokens=1000):
+            self.llm_prompts.append(prompt)
+            return "[]"
+        
+        with patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=fake_llm):
+            self.agent = AsyncCustomBabyAGI(objective="生成数据报告")
+        self.agent.embedding_function = keyword_embedding
+        self.agent.prioritizer_mode = "local"
+        self.agent.llm_prioritize_every = 3
+        self.agent.llm_prioritize_churn = 0.9
+        self.agent.task_list.extend([
+            Task(id="a", content="查询旅游天气", priority=1),
+            Task(id="b", content="整理数据报告", priority=2)
+        ])
+    
+    def test_llm_runs_every_n_iterations(self):
+        """测试 LLM 排序仅每 N 次迭代运行一次，其余使用本地排序"""
+        for iteration in range(1, 7):
+            self.agent.current_iteration = iteration
+            asyncio.run(self.agent.aprioritize_tasks())
+        
+        self.assertEqual(self.agent.prioritization_stats, {"llm": 2, "local": 4})
+        self.assertEqual(len(self.llm_prompts), 2)
+    
+    def test_large_queue_change_triggers_llm(self):
+        """测试队列变化较大时调用 LLM 排序"""
+        self.agent.current_iteration = 3
+        asyncio.run(self.agent.aprioritize_tasks())
+        self.agent.current_iteration = 4
+        asyncio.run(self.agent.aprioritize_tasks())
+        self.assertEqual(self.agent.prioritization_stats["llm"], 1)
+        
+        self.agent.task_list.extend(Task(id=f"n{i}", content=f"新任务{i}") for i in range(20))
+        self.agent.current_iteration = 5
+        asyncio.run(self.agent.aprioritize_tasks())
+        
+        self.assertEqual(self.agent.prioritization_stats["llm"], 2)
+    
+    def test_local_ranking_applied_to_queue(self):
+        """测试本地排序结果写回任务队列"""
+        self.agent.current_iteration = 1
+        self.agent._last_llm_prioritized_ids = {"a", "b"}
+        asyncio.run(self.agent.aprioritize_tasks())
+        
+        self.assertEqual(self.agent.prioritization_stats["local"], 1)
+        self.assertEqual(self.agent.task_list.peek().id, "b")
+    
+    def test_falls_back_to_llm_without_embedding_function(self):
+        """测试没有嵌入函数时使用 LLM 排序"""
+        self.agent.embedding_function = None
+        self.agent.current_iteration = 1
+        asyncio.run(self.agent.aprioritize_tasks())
+        
+        self.assertEqual(self.agent.prioritization_stats, {"llm": 1, "local": 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+收敛检测测试
+
+测试结果新颖度与队列增长的计算、停滞判定，以及 Agent 在结果不再有新内容时提前停止。
+"""
+
+import unittest
+import asyncio
+import uuid
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from progress import ProgressMonitor
+from custom_babyagi import AsyncCustomBabyAGI, Task
+
+
+def topic_embedding(texts):
+    """按文本开头的主题字母生成嵌入，主题相同的文本方向几乎一致"""
+    vectors = []
+    for text in texts:
+        vector = np.full(8, 0.01, dtype=np.float32)
+        vector[(ord(text[0]) - ord("A")) % 8] = 1.0
+        vectors.append(vector)
+    return vectors
+
+
+class TestProgressMonitor(unittest.TestCase):
+    """进展监测测试"""
+    
+    def test_novelty_and_queue_growth(self):
+        """测试新颖度取自与已有结果的最大相似度，队列增长取自相邻两次的队列长度"""
+        monitor = ProgressMonitor(topic_embedding, novelty_threshold=0.1, patience=2, min_iterations=1)
+        
+        first = monitor.observe("A 的结果", 1)
+        repeated = monitor.observe("A 的另一种说法", 3)
+        fresh = monitor.observe("B 的结果", 2)
+        
+        self.assertEqual(first["novelty"], 1.0)
+        self.assertLess(repeated["novelty"], 0.01)
+        self.assertEqual(repeated["queue_growth"], 2)
+        self.assertTrue(repeated["stale"])
+        self.assertGreater(fresh["novelty"], 0.9)
+        self.assertEqual(fresh["queue_growth"], -1)
+        self.assertEqual(monitor.stale_streak, 0)
+    
+    def test_converges_after_patience(self):
+        """测试连续 patience 次停滞后判定收敛，队列缩短的迭代不算停滞"""
+        monitor = ProgressMonitor(topic_embedding, novelty_threshold=0.1, patience=2, min_iterations=1)
+        monitor.observe("A 的结果", 5)
+        
+        monitor.observe("A 重复", 4)
+        self.assertFalse(monitor.converged)
+        monitor.observe("A 重复", 4)
+        monitor.observe("A 重复", 6)
+        
+        self.assertTrue(monitor.converged)
+        self.assertTrue(monitor.summary()["converged"])
+    
+    def test_patience_zero_only_reports(self):
+        """测试 patience 为 0 时只统计不判定收敛，没有嵌入函数时不计算新颖度"""
+        monitor = ProgressMonitor(topic_embedding, patience=0, min_iterations=0)
+        for _ in range(5):
+            monitor.observe("A 重复", 1)
+        
+        self.assertEqual(monitor.stale_streak, 4)
+        self.assertFalse(monitor.converged)
+        
+        blind = ProgressMonitor(None, patience=1, min_iterations=0)
+        self.assertIsNone(blind.observe("A", 1)["novelty"])
+        self.assertFalse(blind.converged)
+    
+    def test_only_recent_results_are_kept(self):
+        """测试只保留最近 lookback 个结果嵌入，超出窗口的结果重新出现时视为新内容"""
+        monitor = ProgressMonitor(topic_embedding, novelty_threshold=0.1, patience=0, lookback=3)
+        for topic in "ABCDEFG":
+            monitor.observe(f"{topic} 的结果", 1)
+        
+        self.assertEqual(monitor._vectors.shape[0], 3)
+        self.assertLess(monitor.observe("G 重复", 1)["novelty"], 0.01)
+        self.assertGreater(monitor.observe("A 再次出现", 1)["novelty"], 0.9)
+
+
+class TestAgentConvergence(unittest.TestCase):
+    """Agent 提前停止测试"""
+    
+    def _agent(self, scheduler_mode):
+        with patch.object(config, "SCHEDULER_MODE", scheduler_mode), \
+             patch.object(config, "CONVERGENCE_PATIENCE", 3), \
+             patch.object(config, "CONVERGENCE_NOVELTY_THRESHOLD", 0.1), \
+             patch.object(config, "CONVERGENCE_MIN_ITERATIONS", 4), \
+             patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=MagicMock()):
+            agent = AsyncCustomBabyAGI(objective="测试目标")
+        agent.progress.embedding_function = topic_embedding
+        return agent
+    
+    def _run(self, agent, max_iterations=20):
+        async def fake_execute(task):
+            task.status = "completed"
+            # 前两次有新内容，之后都是同一主题的换种说法
+            task.result = "AB"[agent.completed_count] if agent.completed_count < 2 else "B 的换种说法"
+            return task.result
+        
+        async def fake_plan(task, iteration_result):
+            with agent._task_lock:
+                agent.task_list.push(Task(id=str(uuid.uuid4()), content=f"改写的任务{iteration_result['iteration']}"))
+        
+        with patch.object(agent, "aexecute_task", side_effect=fake_execute), \
+             patch.object(agent, "_aplan_step", side_effect=fake_plan):
+            return asyncio.run(agent.arun(max_iterations=max_iterations))
+    
+    def test_serial_run_stops_when_converged(self):
+        """测试串行调度在结果连续缺乏新内容时以 converged 状态提前停止"""
+        results = self._run(self._agent("serial"))
+        
+        self.assertEqual(results["status"], "converged")
+        self.assertEqual(results["iteration_count"], 5)
+        self.assertEqual(results["progress"]["stale_streak"], 3)
+        self.assertLess(results["iterations"][-1]["novelty"], 0.1)
+    
+    def test_pipelined_run_stops_when_converged(self):
+        """测试流水线调度同样提前停止"""
+        results = self._run(self._agent("pipelined"))
+        
+        self.assertEqual(results["status"], "converged")
+        self.assertEqual(results["iteration_count"], 5)
+    
+    def test_disabled_detection_runs_to_limit(self):
+        """测试关闭收敛检测时运行到最大迭代次数"""
+        agent = self._agent("serial")
+        agent.progress.patience = 0
+        
+        results = self._run(agent, max_iterations=8)
+        
+        self.assertEqual(results["status"], "max_iterations_reached")
+        self.assertEqual(results["iteration_count"], 8)
+
+
+if __name__ == '__main__':
+    unittest.main()
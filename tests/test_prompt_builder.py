@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+提示词构建器测试
+
+测试 token 计数、按预算裁剪片段以及 Agent 的各阶段 token 统计。
+"""
+
+import unittest
+import asyncio
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from custom_babyagi import AsyncCustomBabyAGI, Task
+from prompt_builder import PromptBuilder, PromptSection, count_tokens, estimate_tokens, get_encoder
+
+
+class TestTokenCounting(unittest.TestCase):
+    """token 计数测试"""
+    
+    def test_estimate_counts_cjk_per_character(self):
+        """测试估算时中文按字计数，其余按 4 个字符计数"""
+        self.assertEqual(estimate_tokens("你好世界"), 4)
+        self.assertEqual(estimate_tokens("abcdefgh"), 2)
+        self.assertEqual(estimate_tokens(""), 0)
+    
+    def test_encoder_is_cached(self):
+        """测试编码器按模型缓存"""
+        self.assertIs(get_encoder("gpt-3.5-turbo"), get_encoder("gpt-3.5-turbo"))
+    
+    def test_falls_back_to_estimate_without_encoder(self):
+        """测试编码器不可用时使用估算值"""
+        with patch("prompt_builder.get_encoder", return_value=None):
+            self.assertEqual(count_tokens("你好 world"), estimate_tokens("你好 world"))
+
+
+@patch("prompt_builder.get_encoder", return_value=None)
+class TestPromptBuilder(unittest.TestCase):
+    """按预算组装提示词测试"""
+    
+    TEMPLATE = "目标: {objective}\n任务列表:\n{task_list}\n摘要:\n{summary}\n"
+    
+    def test_prompt_within_budget_is_unchanged(self, _):
+        """测试未超出预算时不裁剪"""
+        builder = PromptBuilder(budget=1000)
+        prompt = builder.render(self.TEMPLATE, objective="目标", task_list=PromptSection("a\nb"), summary=PromptSection("c"))
+        
+        self.assertEqual(prompt, "目标: 目标\n任务列表:\na\nb\n摘要:\nc\n")
+        self.assertEqual(builder.trimmed, [])
+    
+    def test_low_priority_sections_trimmed_first(self, _):
+        """测试预算不足时先裁剪低优先级片段，并按整行保留"""
+        task_list = "\n".join(f"- 任务{i}" for i in range(50))
+        summary = "\n".join(f"- 已完成{i}" for i in range(50))
+        builder = PromptBuilder(budget=300)
+        
+        prompt = builder.render(
+            self.TEMPLATE,
+            objective="目标",
+            task_list=PromptSection(task_list, priority=1),
+            summary=PromptSection(summary, priority=2, keep="tail")
+        )
+        
+        self.assertLessEqual(builder.prompt_tokens, 300)
+        self.assertIn("- 任务49", prompt)
+        self.assertIn("summary", builder.trimmed)
+        self.assertNotIn("task_list", builder.trimmed)
+        self.assertIn("- 已完成49", prompt)
+        self.assertNotIn("- 已完成0\n", prompt)
+        self.assertIn(PromptBuilder.TRIM_MARKER, prompt)
+    
+    def test_single_long_line_trimmed_by_characters(self, _):
+        """测试单行超长文本按字符裁剪"""
+        builder = PromptBuilder(budget=50)
+        
+        prompt = builder.render("结果: {result}", result=PromptSection("很长的结果" * 100))
+        
+        self.assertLessEqual(builder.prompt_tokens, 50)
+        self.assertTrue(prompt.startswith("结果: 很长的结果"))
+        self.assertEqual(builder.trimmed, ["result"])
+    
+    def test_fixed_fields_are_never_trimmed(self, _):
+        """测试固定字段不会被裁剪，片段在预算耗尽时被清空"""
+        builder = PromptBuilder(budget=10)
+        
+        prompt = builder.render("{objective}|{context}", objective="目标" * 20, context=PromptSection("上下文" * 20))
+        
+        self.assertEqual(prompt, "目标" * 20 + "|")
+
+
+class TestAgentTokenUsage(unittest.TestCase):
+    """Agent 各阶段 token 统计测试"""
+    
+    def test_prompts_fit_phase_budget_and_usage_recorded(self):
+        """测试任务列表很长时提示词仍在预算内，并记录每次调用的 token 数"""
+        prompts = []
+        
+        async def fake_llm(prompt, max_tokens=1000):
+            prompts.append(prompt)
+            return "[]"
+        
+        with patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=fake_llm):
+            agent = AsyncCustomBabyAGI(objective="测试目标")
+        agent.prompt_budgets["prioritize"] = 400
+        agent.task_list.extend(Task(id=f"t{i}", content=f"待执行任务{i}", priority=i) for i in range(200))
+        
+        asyncio.run(agent.aprioritize_tasks())
+        
+        self.assertLessEqual(count_tokens(prompts[0], agent.token_model), 420)
+        usage = agent.get_status()["token_usage"]["prioritize"]
+        self.assertEqual(usage["calls"], 1)
+        self.assertEqual(usage["trimmed"], 1)
+        self.assertEqual(usage["prompt_tokens"], count_tokens(prompts[0], agent.token_model))
+        self.assertEqual(usage["completion_tokens"], count_tokens("[]", agent.token_model))
+
+
+if __name__ == '__main__':
+    unittest.main()
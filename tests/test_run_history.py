@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""
+运行记录测试
+
+测试迭代记录的内存上限、写入磁盘后的分页读取，以及 Agent 对已完成任务和迭代记录的内存限制。
+"""
+
+import unittest
+import asyncio
+import tempfile
+import uuid
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from run_history import RunHistory
+from custom_babyagi import AsyncCustomBabyAGI, Task
+
+
+class TestRunHistory(unittest.TestCase):
+    """运行记录测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.history = RunHistory("run-1", self.temp_dir.name, max_in_memory=3)
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+    
+    def test_old_records_spill_to_disk(self):
+        """测试超出上限的早期记录写入磁盘，内存中只保留最近的记录"""
+        for i in range(10):
+            self.history.append({"iteration": i + 1, "result": f"结果{i + 1}"})
+        
+        self.assertEqual(len(self.history), 10)
+        self.assertEqual([record["iteration"] for record in self.history.recent()], [8, 9, 10])
+        self.assertEqual(self.history.stats(), {"total": 10, "in_memory": 3, "spilled": 7})
+        self.assertTrue(self.history.path.exists())
+    
+    def test_page_crosses_disk_and_memory(self):
+        """测试分页读取跨越磁盘和内存的边界"""
+        for i in range(10):
+            self.history.append({"iteration": i + 1, "result": f"结果{i + 1}"})
+        
+        page = self.history.page(5, 4)
+        
+        self.assertEqual([record["iteration"] for record in page], [6, 7, 8, 9])
+        self.assertEqual(page[0]["result"], "结果6")
+        self.assertEqual(self.history.page(9, 50), [{"iteration": 10, "result": "结果10"}])
+        self.assertEqual(self.history.page(10, 5), [])
+        self.assertEqual([record["iteration"] for record in self.history], list(range(1, 11)))
+    
+    def test_clear_removes_spill_file(self):
+        """测试清空记录时删除溢出文件"""
+        for i in range(5):
+            self.history.append({"iteration": i + 1})
+        
+        self.history.clear()
+        
+        self.assertEqual(len(self.history), 0)
+        self.assertFalse(self.history.path.exists())
+
+
+class TestAgentMemoryBounds(unittest.TestCase):
+    """Agent 内存上限测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+    
+    def tearDown(self):
+        """测试后清理"""
+        self.temp_dir.cleanup()
+    
+    def _agent(self):
+        with patch.object(config, "RUN_HISTORY_DIR", self.temp_dir.name), \
+             patch.object(config, "RUN_HISTORY_IN_MEMORY", 2), \
+             patch.object(config, "COMPLETED_TASKS_IN_MEMORY", 3), \
+             patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=MagicMock()), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=MagicMock()):
+            return AsyncCustomBabyAGI(objective="测试目标")
+    
+    def test_long_run_keeps_bounded_state(self):
+        """测试长时间运行时只保留最近的已完成任务和迭代记录，完整记录可分页读取"""
+        agent = self._agent()
+        
+        async def fake_execute(task):
+            task.status = "completed"
+            task.result = f"{task.content}的结果"
+            return task.result
+        
+        async def fake_plan(task, iteration_result):
+            with agent._task_lock:
+                agent.task_list.push(Task(id=str(uuid.uuid4()), content=f"任务{iteration_result['iteration'] + 1}"))
+        
+        agent.task_list.push(Task(id=str(uuid.uuid4()), content="任务1"))
+        with patch.object(agent, "aexecute_task", side_effect=fake_execute), \
+             patch.object(agent, "_aplan_step", side_effect=fake_plan):
+            results = asyncio.run(agent.arun(max_iterations=8))
+        
+        self.assertEqual(results["completed_count"], 8)
+        self.assertEqual(len(results["completed_tasks"]), 3)
+        self.assertEqual(results["iteration_count"], 8)
+        self.assertEqual([item["iteration"] for item in results["iterations"]], [7, 8])
+        self.assertEqual(agent.get_status()["completed_tasks"], 8)
+        
+        page = agent.get_iterations(0, 8)
+        self.assertEqual(page["total"], 8)
+        self.assertEqual([item["iteration"] for item in page["iterations"]], list(range(1, 9)))
+    
+    def test_task_slots(self):
+        """测试任务对象不再携带实例字典"""
+        task = Task(id="t1", content="内容", priority=2)
+        
+        self.assertFalse(hasattr(task, "__dict__"))
+        self.assertEqual(task.summary(), {"id": "t1", "content": "内容", "priority": 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+任务优先级队列测试
+
+测试堆优先级队列的出队顺序、按 ID 调整优先级和快照功能。
+"""
+
+import unittest
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from custom_babyagi import Task
+from task_queue import TaskQueue
+
+
+class TestTaskQueue(unittest.TestCase):
+    """任务优先级队列测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.queue = TaskQueue([
+            Task(id="a", content="任务A", priority=2),
+            Task(id="b", content="任务B", priority=1),
+            Task(id="c", content="任务C", priority=2),
+            Task(id="d", content="任务D", priority=3)
+        ])
+    
+    def test_pop_order_is_stable(self):
+        """测试按优先级出队，相同优先级按入队顺序"""
+        order = [self.queue.pop().id for _ in range(len(self.queue))]
+        
+        self.assertEqual(order, ["b", "a", "c", "d"])
+        self.assertFalse(self.queue)
+    
+    def test_pop_empty_raises(self):
+        """测试空队列出队"""
+        with self.assertRaises(IndexError):
+            TaskQueue().pop()
+    
+    def test_update_priority(self):
+        """测试按 ID 调整优先级"""
+        self.assertTrue(self.queue.update_priority("d", 0))
+        self.assertFalse(self.queue.update_priority("missing", 0))
+        
+        self.assertEqual(self.queue.peek().id, "d")
+        self.assertEqual(self.queue.get("d").priority, 0)
+        self.assertEqual(len(self.queue), 4)
+    
+    def test_priority_restored_to_earlier_value(self):
+        """测试优先级改回原值后，失效条目与新条目同键时不会比较任务本身"""
+        self.assertTrue(self.queue.update_priority("a", 5))
+        self.assertTrue(self.queue.update_priority("a", 2))
+        self.queue.push(Task(id="e", content="任务E", priority=2))
+        
+        self.assertEqual([self.queue.pop().id for _ in range(len(self.queue))], ["b", "a", "c", "e", "d"])
+    
+    def test_reprioritize_keeps_insertion_order_for_ties(self):
+        """测试批量调整后同优先级仍按入队顺序"""
+        updated = self.queue.reprioritize({"c": 1, "d": 1, "missing": 1})
+        
+        self.assertEqual(updated, 2)
+        self.assertEqual([task.id for task in self.queue], ["b", "c", "d", "a"])
+    
+    def test_remove(self):
+        """测试按 ID 删除"""
+        removed = self.queue.remove("b")
+        
+        self.assertEqual(removed.id, "b")
+        self.assertIsNone(self.queue.remove("b"))
+        self.assertNotIn("b", self.queue)
+        self.assertEqual(self.queue.pop().id, "a")
+    
+    def test_non_numeric_priority_sorted_last(self):
+        """测试无法解析的优先级排在最后"""
+        self.queue.push(Task(id="e", content="任务E", priority="高"))
+        self.queue.push(Task(id="f", content="任务F", priority="0"))
+        
+        ids = [task.id for task in self.queue.snapshot()]
+        self.assertEqual(ids[0], "f")
+        self.assertEqual(ids[-1], "e")
+    
+    def test_snapshot_is_cached_until_mutation(self):
+        """测试快照在队列修改前复用"""
+        first = self.queue.snapshot()
+        
+        self.assertIs(first, self.queue.snapshot())
+        self.queue.push(Task(id="e", content="任务E", priority=5))
+        self.assertIsNot(first, self.queue.snapshot())
+        self.assertEqual(len(self.queue.snapshot()), 5)
+    
+    def test_many_removals_compact_heap(self):
+        """测试大量删除后堆会被压缩"""
+        queue = TaskQueue(Task(id=str(i), content=f"任务{i}", priority=i) for i in range(500))
+        for i in range(0, 500, 2):
+            queue.remove(str(i))
+        for i in range(1, 500, 2):
+            queue.update_priority(str(i), 1000 - i)
+        
+        self.assertLess(len(queue._heap), 2 * len(queue) + 33)
+        self.assertEqual(queue.pop().id, "499")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,6 +6,7 @@
 """
 
 import unittest
+import asyncio
 import os
 import tempfile
 import json
@@ -435,5 +436,48 @@ class TestToolRegistry(unittest.TestCase):
         self.assertIn("工具执行失败", result["error"])
 
 
+
+class TestAsyncToolExecution(unittest.TestCase):
+    """工具异步执行测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.registry = ToolRegistry()
+        
+    def test_aexecute_command(self):
+        """测试异步执行命令"""
+        result = asyncio.run(self.registry.aexecute_tool("execute_command", cmd="echo hello"))
+        
+        self.assertTrue(result["success"])
+        self.assertIn("hello", result["output"])
+        
+    def test_aexecute_command_blocked(self):
+        """测试异步执行危险命令被阻止"""
+        result = asyncio.run(self.registry.aexecute_tool("execute_command", cmd="rm -rf /tmp/x"))
+        
+        self.assertFalse(result["success"])
+        
+    def test_aexecute_command_timeout(self):
+        """测试异步执行命令超时"""
+        result = asyncio.run(self.registry.aexecute_tool("execute_command", cmd="sleep 5", timeout=0.2))
+        
+        self.assertFalse(result["success"])
+        self.assertEqual(result["error"], "命令执行超时")
+        
+    def test_aexecute_falls_back_to_sync_tool(self):
+        """测试未实现异步方法的工具在线程池中执行"""
+        result = asyncio.run(self.registry.aexecute_tool("web_search", query="babyagi"))
+        
+        self.assertTrue(result["success"])
+        self.assertEqual(result["query"], "babyagi")
+        
+    def test_aexecute_tool_not_found(self):
+        """测试异步执行不存在的工具"""
+        result = asyncio.run(self.registry.aexecute_tool("nonexistent_tool"))
+        
+        self.assertFalse(result["success"])
+        self.assertIn("工具不存在", result["error"])
+
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
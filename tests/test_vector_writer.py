@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+向量数据库写缓冲测试
+
+测试按条数和时间批量写入、读取时合并缓冲中的结果，以及在快照、运行结束和恢复时写入缓冲。
+"""
+
+import unittest
+import asyncio
+import tempfile
+import time
+import uuid
+from unittest.mock import patch, MagicMock
+
+# 添加项目根目录到路径
+import sys
+from pathlib import Path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+from config import config
+from benchmark import HashEmbedding, InMemoryVectorStore
+from checkpoint import RunJournal
+from vector_writer import WriteBehindCollection
+from custom_babyagi import AsyncCustomBabyAGI, Task
+
+
+def wait_until(condition, timeout=2.0):
+    """轮询等待后台线程完成写入"""
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestWriteBehindCollection(unittest.TestCase):
+    """写缓冲测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.embedding = HashEmbedding()
+        self.store = InMemoryVectorStore(self.embedding)
+    
+    def _writer(self, batch_size=100, flush_interval=60.0):
+        writer = WriteBehindCollection(self.store, self.embedding, batch_size=batch_size, flush_interval=flush_interval)
+        self.addCleanup(writer.close)
+        return writer
+    
+    def _add(self, writer, text):
+        writer.add(documents=[text], metadatas=[{"task": text}], ids=[f"id-{text}"])
+    
+    def test_flushes_full_batches(self):
+        """测试缓冲达到 batch_size 条时一次写入"""
+        writer = self._writer(batch_size=3)
+        for i in range(4):
+            if i == 3:
+                self.assertTrue(wait_until(lambda: self.store.count() == 3))
+            self._add(writer, f"结果{i}")
+        time.sleep(0.05)
+        
+        self.assertEqual(self.store.count(), 3)
+        self.assertEqual(writer.count(), 4)
+        self.assertEqual(writer.stats["batches"], 1)
+    
+    def test_flushes_after_interval(self):
+        """测试最早的结果等待超过 flush_interval 后写入"""
+        writer = self._writer(flush_interval=0.05)
+        self._add(writer, "结果")
+        
+        self.assertTrue(wait_until(lambda: self.store.count() == 1))
+        self.assertEqual(writer.stats["flushed"], 1)
+    
+    def test_reads_own_buffered_writes(self):
+        """测试检索时按距离合并集合与缓冲中的结果"""
+        self.store.add(documents=["旧的结果 xyz"], metadatas=[{"task": "旧任务"}], ids=["old"])
+        writer = self._writer()
+        self._add(writer, "新的结果 abc")
+        
+        results = writer.query(query_texts=["新的结果 abc"], n_results=2)
+        
+        self.assertEqual(self.store.count(), 1)
+        self.assertEqual(results["ids"][0], ["id-新的结果 abc", "old"])
+        self.assertAlmostEqual(results["distances"][0][0], 0.0, places=5)
+        self.assertEqual(writer.get(ids=["id-新的结果 abc"])["documents"], ["新的结果 abc"])
+    
+    def test_close_flushes_remaining(self):
+        """测试关闭时写入剩余结果"""
+        writer = self._writer()
+        self._add(writer, "结果")
+        
+        writer.close()
+        
+        self.assertEqual(self.store.count(), 1)
+    
+    def test_failed_batch_is_retried(self):
+        """测试写入失败的批次放回缓冲区，退避后重试成功"""
+        writer = self._writer(batch_size=1)
+        writer.retry_backoff = 0.01
+        original_add = self.store.add
+        failures = [RuntimeError("暂时不可用")]
+        
+        def flaky_add(**kwargs):
+            if failures:
+                raise failures.pop()
+            original_add(**kwargs)
+        
+        with patch.object(self.store, "add", side_effect=flaky_add):
+            self._add(writer, "结果")
+            self.assertTrue(wait_until(lambda: self.store.count() == 1))
+        
+        self.assertEqual(writer.stats["retried"], 1)
+        self.assertEqual(writer.stats["failed"], 0)
+    
+    def test_batch_dropped_after_max_attempts(self):
+        """测试连续失败 max_attempts 次后丢弃批次"""
+        writer = WriteBehindCollection(self.store, self.embedding, batch_size=100, max_attempts=2)
+        self._add(writer, "结果")
+        
+        with patch.object(self.store, "add", side_effect=RuntimeError("不可用")):
+            self.assertEqual(writer.flush(), 0)
+            self.assertEqual(writer.count(), 1)
+            writer.flush()
+        
+        self.assertEqual(writer.count(), 0)
+        self.assertEqual(writer.stats["failed"], 1)
+        writer.close()
+    
+    def test_close_stops_thread_and_add_restarts_it(self):
+        """测试关闭后后台线程退出，再次写入时重新启动"""
+        writer = self._writer()
+        self._add(writer, "结果一")
+        thread = writer._thread
+        
+        writer.close()
+        
+        self.assertFalse(thread.is_alive())
+        self.assertIsNone(writer._thread)
+        self._add(writer, "结果二")
+        self.assertTrue(writer._thread.is_alive())
+        writer.close()
+        self.assertEqual(self.store.count(), 2)
+    
+    def test_snapshot_flushes_first(self):
+        """测试运行日志写入快照前先写入缓冲"""
+        writer = self._writer()
+        with tempfile.TemporaryDirectory() as temp_dir:
+            journal = RunJournal("run-1", temp_dir, snapshot_every=2, fsync=False, before_snapshot=writer.flush)
+            self._add(writer, "结果")
+            journal.record("run_started", objective="目标", initial_task="任务", max_iterations=3)
+            self.assertEqual(self.store.count(), 0)
+            journal.record("tasks_added", tasks=[])
+        
+        self.assertEqual(self.store.count(), 1)
+
+
+class TestAgentWriteBehind(unittest.TestCase):
+    """Agent 使用写缓冲测试"""
+    
+    def setUp(self):
+        """测试前准备"""
+        self.embedding = HashEmbedding()
+        self.store = InMemoryVectorStore(self.embedding)
+        self.writer = WriteBehindCollection(self.store, self.embedding, batch_size=100, flush_interval=60.0)
+        self.addCleanup(self.writer.close)
+        with patch.object(config, "CONVERGENCE_PATIENCE", 0), \
+             patch.object(AsyncCustomBabyAGI, '_init_vector_db', return_value=self.writer), \
+             patch.object(AsyncCustomBabyAGI, '_init_llm', return_value=MagicMock()):
+            self.agent = AsyncCustomBabyAGI(objective="测试目标")
+    
+    def test_run_end_flushes_results(self):
+        """测试运行过程中结果留在缓冲，运行结束时全部写入"""
+        agent = self.agent
+        buffered = []
+        
+        async def fake_plan(task, iteration_result):
+            buffered.append(self.store.count())
+            with agent._task_lock:
+                agent.task_list.push(Task(id=str(uuid.uuid4()), content=f"任务{iteration_result['iteration'] + 1}"))
+        
+        async def fake_stream(phase, prompt, **kwargs):
+            return f"结果{len(buffered)}"
+        
+        with patch.object(agent, "_astream_call", side_effect=fake_stream), \
+             patch.object(agent, "_aplan_step", side_effect=fake_plan):
+            asyncio.run(agent.arun(max_iterations=3))
+        
+        self.assertEqual(buffered, [0, 0, 0])
+        self.assertEqual(self.store.count(), 3)
+        self.assertEqual(agent.get_status()["vector_writes"]["batches"], 1)
+        self.assertIsNone(self.writer._thread)
+    
+    def test_restore_rewrites_missing_results(self):
+        """测试恢复运行时补写中断前未写入的任务结果"""
+        self.store.add(documents=["已写入"], metadatas=[{"task": "甲"}], ids=["t1"])
+        completed = [
+            Task(id="t1", content="甲", status="completed", result="已写入"),
+            Task(id="t2", content="乙", status="completed", result="中断前还在缓冲中")
+        ]
+        
+        self.agent._restore_memory(completed)
+        
+        self.assertEqual(self.store.count(), 2)
+        self.assertEqual(self.store.get(ids=["t2"])["documents"], ["中断前还在缓冲中"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,6 @@
 import os
+import asyncio
+import signal
 import subprocess
 import json
 import requests
@@ -23,6 +25,10 @@ class BaseTool(ABC):
         """执行工具"""
         pass
     
+    async def aexecute(self, **kwargs) -> Dict[str, Any]:
+        """异步执行工具，默认在线程池中运行同步实现"""
+        return await asyncio.to_thread(self.execute, **kwargs)
+    
     def validate_params(self, params: Dict[str, Any], required_params: List[str]) -> bool:
         """验证参数"""
         for param in required_params:
@@ -33,26 +39,33 @@ class BaseTool(ABC):
 class CommandExecutor(BaseTool):
     """命令行执行工具"""
     
+    DANGEROUS_COMMANDS = ['rm -rf', 'format', 'del /f', 'shutdown', 'reboot']
+    
     def __init__(self):
         super().__init__(
             name="execute_command",
             description="执行命令行命令，支持 shell 命令执行"
         )
     
+    def _blocked_result(self, cmd: str) -> Optional[Dict[str, Any]]:
+        """安全检查 - 禁止危险命令"""
+        if any(dangerous in cmd.lower() for dangerous in self.DANGEROUS_COMMANDS):
+            return {
+                "success": False,
+                "error": "禁止执行危险命令",
+                "output": "",
+                "stderr": "安全限制：命令被阻止"
+            }
+        return None
+    
     def execute(self, cmd: str, timeout: int = 30, cwd: str = None) -> Dict[str, Any]:
         """执行命令"""
         try:
             logger.info(f"执行命令: {cmd}")
             
-            # 安全检查 - 禁止危险命令
-            dangerous_commands = ['rm -rf', 'format', 'del /f', 'shutdown', 'reboot']
-            if any(dangerous in cmd.lower() for dangerous in dangerous_commands):
-                return {
-                    "success": False,
-                    "error": "禁止执行危险命令",
-                    "output": "",
-                    "stderr": "安全限制：命令被阻止"
-                }
+            blocked = self._blocked_result(cmd)
+            if blocked:
+                return blocked
             
             result = subprocess.run(
                 cmd,
@@ -87,6 +100,56 @@ class CommandExecutor(BaseTool):
                 "output": "",
                 "stderr": str(e)
             }
+    
+    async def aexecute(self, cmd: str, timeout: int = 30, cwd: str = None) -> Dict[str, Any]:
+        """异步执行命令，不占用线程等待子进程"""
+        try:
+            logger.info(f"执行命令: {cmd}")
+            
+            blocked = self._blocked_result(cmd)
+            if blocked:
+                return blocked
+            
+            process = await asyncio.create_subprocess_shell(
+                cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
+                start_new_session=hasattr(os, "killpg")
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout)
+            except asyncio.TimeoutError:
+                # 结束整个进程组，避免 shell 的子进程继续占用输出管道
+                if hasattr(os, "killpg"):
+                    os.killpg(process.pid, signal.SIGKILL)
+                else:
+                    process.kill()
+                await process.wait()
+                logger.error(f"命令执行超时: {cmd}")
+                return {
+                    "success": False,
+                    "error": "命令执行超时",
+                    "output": "",
+                    "stderr": f"命令在 {timeout} 秒后超时"
+                }
+            
+            return {
+                "success": process.returncode == 0,
+                "returncode": process.returncode,
+                "output": stdout.decode("utf-8", errors="replace"),
+                "stderr": stderr.decode("utf-8", errors="replace"),
+                "command": cmd
+            }
+            
+        except Exception as e:
+            logger.error(f"命令执行失败: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "output": "",
+                "stderr": str(e)
+            }
 
 class FileManager(BaseTool):
     """文件管理工具"""
@@ -500,6 +563,27 @@ class ToolRegistry:
                 "tool": tool_name
             }
 
+    async def aexecute_tool(self, tool_name: str, **kwargs) -> Dict[str, Any]:
+        """异步执行工具"""
+        tool = self.get_tool(tool_name)
+        if not tool:
+            return {
+                "success": False,
+                "error": f"工具不存在: {tool_name}"
+            }
+        
+        try:
+            result = await tool.aexecute(**kwargs)
+            logger.info(f"工具 {tool_name} 执行完成")
+            return result
+        except Exception as e:
+            logger.error(f"工具 {tool_name} 执行失败: {e}")
+            return {
+                "success": False,
+                "error": str(e),
+                "tool": tool_name
+            }
+
 # 全局工具注册表实例
 tool_registry = ToolRegistry()
 
@@ -0,0 +1,243 @@
+import atexit
+import threading
+import time
+import weakref
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from logger import get_logger
+
+logger = get_logger("vector_writer")
+
+# 进程退出时写入所有缓冲中的结果
+_writers: "weakref.WeakSet[WriteBehindCollection]" = weakref.WeakSet()
+
+class WriteBehindCollection:
+    """带写缓冲的向量集合（实现 Agent 用到的 add / query / count / get 接口）
+    
+    add 只把结果放入缓冲区，由后台线程在缓冲达到 batch_size 条或最早的结果等待超过 flush_interval 秒时
+    一次性计算嵌入并写入集合。查询时把缓冲中（包括正在写入）的结果与集合的检索结果按余弦距离合并，
+    写入方总能读到自己刚写的内容。写入失败的批次放回缓冲区头部，按指数退避重试，
+    连续失败 max_attempts 次后才丢弃。close 停止后台线程，之后再写入时重新启动。
+    """
+    
+    def __init__(
+        self,
+        collection: Any,
+        embedding_function: Optional[Callable[[List[str]], Any]] = None,
+        batch_size: int = 16,
+        flush_interval: float = 2.0,
+        max_attempts: int = 5,
+        retry_backoff: float = 1.0
+    ):
+        self.collection = collection
+        self.embedding_function = embedding_function
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.max_attempts = max(1, max_attempts)
+        self.retry_backoff = retry_backoff
+        self._buffer: List[Dict[str, Any]] = []
+        self._inflight: List[Dict[str, Any]] = []
+        self._oldest = 0.0
+        self._retry_at = 0.0
+        self._stopping = False
+        self._thread: Optional[threading.Thread] = None
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self.stats = {"buffered": 0, "flushed": 0, "batches": 0, "retried": 0, "failed": 0}
+        _writers.add(self)
+    
+    def add(
+        self,
+        documents: List[str],
+        metadatas: List[Dict[str, Any]],
+        ids: List[str],
+        embeddings: Optional[List[Any]] = None
+    ) -> None:
+        """放入写缓冲"""
+        entries = [
+            {"id": id_, "document": document, "metadata": metadata, "embedding": embeddings[i] if embeddings is not None else None, "attempts": 0}
+            for i, (id_, document, metadata) in enumerate(zip(ids, documents, metadatas))
+        ]
+        with self._cond:
+            if not self._buffer:
+                self._oldest = time.monotonic()
+            self._buffer.extend(entries)
+            self.stats["buffered"] += len(entries)
+            if self._thread is None:
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name="vector-writer", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+    
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stopping:
+                    now = time.monotonic()
+                    if self._buffer and now < self._retry_at:
+                        # 上次写入失败，退避后再重试
+                        self._cond.wait(self._retry_at - now)
+                        continue
+                    if len(self._buffer) >= self.batch_size:
+                        break
+                    if self._buffer:
+                        remaining = self._oldest + self.flush_interval - now
+                        if remaining <= 0:
+                            break
+                        self._cond.wait(remaining)
+                    else:
+                        self._cond.wait()
+                if self._stopping:
+                    return
+            self.flush()
+    
+    def _embed_missing(self, entries: List[Dict[str, Any]]) -> None:
+        """为没有嵌入的结果批量计算嵌入（没有嵌入函数时交给集合计算）"""
+        missing = [entry for entry in entries if entry["embedding"] is None]
+        if not missing or self.embedding_function is None:
+            return
+        vectors = self.embedding_function([entry["document"] for entry in missing])
+        for entry, vector in zip(missing, vectors):
+            entry["embedding"] = [float(value) for value in vector]
+    
+    def flush(self) -> int:
+        """立即把缓冲中的结果写入集合，返回写入条数"""
+        with self._flush_lock:
+            with self._cond:
+                batch, self._buffer = self._buffer, []
+                self._inflight = batch
+            if not batch:
+                return 0
+            
+            try:
+                self._embed_missing(batch)
+                embeddings = [entry["embedding"] for entry in batch]
+                self.collection.add(
+                    ids=[entry["id"] for entry in batch],
+                    documents=[entry["document"] for entry in batch],
+                    metadatas=[entry["metadata"] for entry in batch],
+                    embeddings=embeddings if all(vector is not None for vector in embeddings) else None
+                )
+                self.stats["flushed"] += len(batch)
+                self.stats["batches"] += 1
+                logger.debug(f"批量写入向量数据库 {len(batch)} 条结果")
+                with self._cond:
+                    self._inflight = []
+                    self._retry_at = 0.0
+                return len(batch)
+            except Exception as e:
+                for entry in batch:
+                    entry["attempts"] += 1
+                retry = [entry for entry in batch if entry["attempts"] < self.max_attempts]
+                dropped = len(batch) - len(retry)
+                self.stats["retried"] += len(retry)
+                self.stats["failed"] += dropped
+                with self._cond:
+                    # 放回缓冲区头部，保持写入顺序
+                    self._buffer[:0] = retry
+                    self._inflight = []
+                    if retry:
+                        # 退避结束后立即重试，不再等待 flush_interval
+                        self._oldest = 0.0
+                        attempts = max(entry["attempts"] for entry in retry)
+                        self._retry_at = time.monotonic() + self.retry_backoff * 2 ** (attempts - 1)
+                if dropped:
+                    logger.error(f"批量写入向量数据库连续失败 {self.max_attempts} 次，丢弃 {dropped} 条结果: {e}")
+                if retry:
+                    logger.warning(f"批量写入向量数据库失败，{len(retry)} 条结果稍后重试: {e}")
+                return 0
+    
+    def _pending(self) -> List[Dict[str, Any]]:
+        with self._cond:
+            return self._inflight + self._buffer
+    
+    def count(self) -> int:
+        return self.collection.count() + len(self._pending())
+    
+    def query(
+        self,
+        query_texts: Optional[List[str]] = None,
+        n_results: int = 10,
+        query_embeddings: Optional[List[Any]] = None,
+        **kwargs: Any
+    ) -> Dict[str, List[List[Any]]]:
+        """检索集合并合并缓冲中的结果（按余弦距离）"""
+        pending = self._pending()
+        if pending and self.embedding_function is None and (
+            query_embeddings is None or any(entry["embedding"] is None for entry in pending)
+        ):
+            # 没有嵌入函数时无法计算缓冲中结果的距离，先写入再检索
+            self.flush()
+            pending = []
+        
+        if pending and query_embeddings is None:
+            query_embeddings = self.embedding_function(query_texts)
+        query_args = {"query_embeddings": query_embeddings} if query_embeddings is not None else {"query_texts": query_texts}
+        
+        stored = self.collection.count()
+        if stored:
+            results = self.collection.query(**query_args, n_results=min(n_results, stored), **kwargs)
+        else:
+            empty = [[] for _ in (query_embeddings if query_embeddings is not None else query_texts)]
+            results = {"ids": empty, "documents": list(empty), "metadatas": list(empty), "distances": list(empty)}
+        if not pending:
+            return results
+        
+        self._embed_missing(pending)
+        matrix = np.asarray([entry["embedding"] for entry in pending], dtype=np.float32)
+        matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+        
+        with_embeddings = "embeddings" in (kwargs.get("include") or [])
+        stored_embeddings = results.get("embeddings") if with_embeddings else None
+        merged: Dict[str, List[List[Any]]] = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        if with_embeddings:
+            merged["embeddings"] = []
+        for index, query in enumerate(np.asarray(query_embeddings, dtype=np.float32)):
+            distances = 1.0 - matrix @ (query / max(float(np.linalg.norm(query)), 1e-12))
+            candidates = {
+                entry["id"]: (float(distance), entry["document"], entry["metadata"], entry["embedding"])
+                for entry, distance in zip(pending, distances)
+            }
+            vectors = stored_embeddings[index] if stored_embeddings is not None else [None] * len(results["ids"][index])
+            for id_, document, metadata, distance, vector in zip(
+                results["ids"][index], results["documents"][index], results["metadatas"][index], results["distances"][index], vectors
+            ):
+                candidates.setdefault(id_, (distance, document, metadata, vector))
+            
+            top = sorted(candidates.items(), key=lambda item: item[1][0])[:n_results]
+            merged["ids"].append([id_ for id_, _ in top])
+            merged["distances"].append([value[0] for _, value in top])
+            merged["documents"].append([value[1] for _, value in top])
+            merged["metadatas"].append([value[2] for _, value in top])
+            if with_embeddings:
+                merged["embeddings"].append([value[3] for _, value in top])
+        return merged
+    
+    def get(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Dict[str, Any]:
+        """按 ID 读取（先写入缓冲中的结果）"""
+        self.flush()
+        return self.collection.get(ids=ids, **kwargs)
+    
+    def close(self) -> None:
+        """停止后台线程并写入剩余结果（之后再写入时重新启动后台线程）"""
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify_all()
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        with self._cond:
+            if self._thread is thread:
+                self._thread = None
+        self.flush()
+
+def _flush_all() -> None:
+    for writer in list(_writers):
+        try:
+            writer.flush()
+        except Exception as e:
+            logger.error(f"退出前写入向量数据库失败: {e}")
+
+atexit.register(_flush_all)